@@ -0,0 +1,127 @@
+"""
+Benchmark of minimap2 mapping small samples against the reference fasta,
+which builds the short read index in every job, and against the prebuilt
+index written by the reference_index rule in snakefile2.
+
+Synthetic samples of short paired reads are drawn from data/SARS2.fasta and
+each is mapped as the mapping rule does, once with each reference.
+minimap2 needs to be on the PATH, ie from the envs/minimap2.yaml env.
+
+Run from the backend directory:
+    python benchmarks/bench_minimap2_index.py -n 50 -r 1000 5000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+FASTA = "data/SARS2.fasta"
+# length of the synthetic reads and of the inserts the pairs are drawn from
+READ_LENGTH = 150
+INSERT_SIZE = 300
+
+
+def read_reference(fasta):
+    """
+    Returns the sequence of the single record fasta
+    """
+
+    with open(fasta, "r", encoding="utf-8") as in_fh:
+        return "".join(line.strip() for line in in_fh if not line.startswith(">"))
+
+
+def write_sample(path, ref, reads, seed):
+    """
+    Writes an interleaved fastq of read pairs drawn from the reference
+    """
+
+    rng = random.Random(seed)
+    pairs = {"A": "T", "C": "G", "G": "C", "T": "A", "N": "N"}
+    with open(path, "w", encoding="utf-8") as out_fh:
+        for read in range(reads):
+            start = rng.randrange(len(ref) - INSERT_SIZE)
+            mate1 = ref[start : start + READ_LENGTH]
+            mate2 = "".join(
+                pairs.get(base, "N")
+                for base in reversed(
+                    ref[start + INSERT_SIZE - READ_LENGTH : start + INSERT_SIZE]
+                )
+            )
+            for mate in (mate1, mate2):
+                out_fh.write(f"@r{read}\n{mate}\n+\n{'I' * READ_LENGTH}\n")
+
+
+def map_sample(reference, fastq, threads):
+    """
+    Maps the sample as the mapping rule does
+
+    Returns the seconds taken
+    """
+
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            "minimap2",
+            "-t",
+            str(threads),
+            "-ax",
+            "sr",
+            reference,
+            fastq,
+            "-o",
+            os.devnull,
+            "--secondary=no",
+            "--sam-hit-only",
+        ],
+        check=True,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Runs the benchmark
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--samples", type=int, default=50)
+    parser.add_argument("-r", "--reads", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("-t", "--threads", type=int, default=1)
+    args = parser.parse_args()
+    if not shutil.which("minimap2"):
+        sys.exit("minimap2 was not found on the PATH")
+
+    ref = read_reference(FASTA)
+    with tempfile.TemporaryDirectory() as work_dir:
+        index = os.path.join(work_dir, "SARS2.sr.mmi")
+        start = time.perf_counter()
+        subprocess.run(
+            ["minimap2", "-x", "sr", "-d", index, FASTA],
+            check=True,
+            stderr=subprocess.DEVNULL,
+        )
+        print(f"index built once in {time.perf_counter() - start:.3f} s")
+        print("read pairs\tfasta s/sample\tindex s/sample\tsaved s/sample\tspeedup")
+        for reads in args.reads:
+            fastqs = []
+            for sample in range(args.samples):
+                fastqs.append(os.path.join(work_dir, f"sample{sample}.fq"))
+                write_sample(fastqs[-1], ref, reads, sample)
+            fasta_time = sum(map_sample(FASTA, fq, args.threads) for fq in fastqs)
+            index_time = sum(map_sample(index, fq, args.threads) for fq in fastqs)
+            print(
+                f"{reads}\t{fasta_time / args.samples:.4f}\t"
+                f"{index_time / args.samples:.4f}\t"
+                f"{(fasta_time - index_time) / args.samples:.4f}\t"
+                f"{fasta_time / index_time:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of parse_xml_meta() time and peak memory for synthetic metadata
+xml files of increasing size and numbers of cores.  Each parse is run in a
+fresh process so the peak resident set size of that process is reported (for
+parallel parses this is the parent process only).
+
+Run from the backend directory:
+    python benchmarks/bench_parse_meta.py -n 10000 50000 200000 -c 1 4 16
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synth_meta import write_meta
+
+CHILD = """
+import os, sys, resource
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions
+os.chdir(sys.argv[1])
+snakefunctions.parse_xml_meta("bench", **eval(sys.argv[2]))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def parse(work_dir, kwargs):
+    """
+    Parses the xml in the work dir in a new process
+
+    Returns the time taken and peak rss in MB
+    """
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, work_dir, repr(kwargs)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    max_rss = int(result.stdout.split()[-1]) / 1024
+    return elapsed, max_rss
+
+
+def main():
+    """
+    Runs the benchmark
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--runs", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("-c", "--cores", type=int, nargs="+", default=[1])
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    print("runs\txml MB\tcores\tseconds\tpeak RSS MB")
+    for runs in args.runs:
+        with tempfile.TemporaryDirectory() as work_dir:
+            xml_file = write_meta(os.path.join(work_dir, "sra_meta_bench.xml"), runs)
+            xml_mb = os.path.getsize(xml_file) / 1e6
+            for cores in args.cores:
+                elapsed, max_rss = parse(
+                    work_dir, {"chunk_size": args.chunk_size, "cores": cores}
+                )
+                print(f"{runs}\t{xml_mb:.1f}\t{cores}\t{elapsed:.2f}\t{max_rss:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark of the compiled primer keyword matcher against the original
+get_primer_bed(), which reloaded the mapping json on every call.
+
+Every character data string of a synthetic metadata xml is matched against
+elements_mapping.json, as data_fun() does, and the collected primers of each
+package against primer_mapping.json, as end_ele_fun() does.
+
+Run from the backend directory:
+    python benchmarks/bench_primer_matcher.py -n 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import xml.parsers.expat
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+from synth_meta import write_meta  # pylint: disable=wrong-import-position
+
+
+def legacy_get_primer_bed(primers_str, mapping_file):
+    """
+    get_primer_bed as it was before the matcher was compiled and cached
+    """
+
+    with open(
+        os.path.join(snakefunctions.snakemodpath, mapping_file), "r", encoding="utf-8"
+    ) as _primer_map_json:
+        _primer_map_dict = json.load(_primer_map_json)
+    bed = "Unknown"
+    matching_dict = _primer_map_dict
+    while isinstance(matching_dict, dict) and bed == "Unknown":
+        new_dict = 0
+        for key in matching_dict:
+            if key in primers_str:
+                if isinstance(matching_dict[key], str):
+                    bed = matching_dict[key]
+                    break
+                matching_dict = matching_dict[key]
+                new_dict = 1
+                break
+            try:
+                bed = matching_dict["Other"]
+                break
+            except KeyError:
+                pass
+        if new_dict == 0:
+            break
+
+    return bed
+
+
+def package_strings(xml_path):
+    """
+    Returns a list with the list of non-blank data strings of each package
+    """
+
+    packages = []
+    depth = [0]
+
+    def start_element(name, attrs):
+        assert name or attrs is not None
+        depth[0] += 1
+        if depth[0] == 2:
+            packages.append([])
+
+    def end_element(name):
+        assert name
+        depth[0] -= 1
+
+    def char_data(data):
+        if data and data.strip() and packages:
+            packages[-1].append(data)
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = char_data
+    with open(xml_path, "rb") as xml_fh:
+        parser.ParseFile(xml_fh)
+    return packages
+
+
+def run(match_fun, packages):
+    """
+    Matches all strings and returns the per package beds and the time taken
+    """
+
+    start = time.perf_counter()
+    beds = []
+    for strings in packages:
+        primers = [
+            match_fun(data.upper(), "data/elements_mapping.json") for data in strings
+        ]
+        beds.append(match_fun("".join(primers), "data/primer_mapping.json"))
+    return beds, time.perf_counter() - start
+
+
+def main():
+    """
+    Runs the benchmark
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--runs", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        xml_path = write_meta(os.path.join(tmpdir, "sra_meta_bench.xml"), args.runs)
+        packages = package_strings(xml_path)
+    strings = sum(len(strings) for strings in packages)
+
+    legacy_beds, legacy_time = run(legacy_get_primer_bed, packages)
+    new_beds, new_time = run(snakefunctions.get_primer_bed, packages)
+    assert legacy_beds == new_beds
+
+    print(f"runs: {args.runs}  data strings: {strings}")
+    print(f"original get_primer_bed: {legacy_time:.3f} s")
+    print(f"compiled PrimerMatcher:  {new_time:.3f} s")
+    print(f"speedup: {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
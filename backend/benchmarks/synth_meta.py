@@ -0,0 +1,76 @@
+"""
+Writes large synthetic SRA experiment package xml files, similar to the
+sra_meta_<stamp>.xml files downloaded by sra_query(), for benchmarking the
+metadata parsing functions.
+"""
+
+import argparse
+import random
+
+PROTOCOLS = [
+    "ARTIC V3 amplicons",
+    "ARTIC V4.1 amplicon panel",
+    "Swift SNAP Version 2.0 with additional coverage",
+    "NEBNext VarSkip Long primers",
+    "NEBNext VarSkip Short v2",
+    "QIAseq DIRECT SARS-CoV-2",
+    "Ion AmpliSeq SARS-CoV-2 Research Panel",
+    "Paragon CleanPlex",
+    "unspecified",
+    "Illumina COVIDSeq &amp; library prep, see protocols.io",
+]
+LOCATIONS = ["USA: Texas, Houston", "USA:New York, Brooklyn", "United Kingdom"]
+
+
+def package(run: int, rand: random.Random) -> str:
+    """
+    Returns the xml of one experiment package with a single run
+    """
+
+    protocol = rand.choice(PROTOCOLS)
+    return (
+        f'<EXPERIMENT_PACKAGE><EXPERIMENT accession="SRX{run:08d}" '
+        f'alias="ww_{run}"><IDENTIFIERS><PRIMARY_ID>SRX{run:08d}</PRIMARY_ID>'
+        f"</IDENTIFIERS><TITLE>Wastewater sequencing of SARS-CoV-2 sample {run}"
+        "</TITLE><DESIGN><DESIGN_DESCRIPTION>"
+        f"{protocol}\nmulti line\ndescription</DESIGN_DESCRIPTION>"
+        "<LIBRARY_DESCRIPTOR><LIBRARY_STRATEGY>AMPLICON</LIBRARY_STRATEGY>"
+        "<LIBRARY_SOURCE>VIRAL RNA</LIBRARY_SOURCE><LIBRARY_LAYOUT><PAIRED/>"
+        "</LIBRARY_LAYOUT></LIBRARY_DESCRIPTOR></DESIGN><PLATFORM><ILLUMINA>"
+        "<INSTRUMENT_MODEL>Illumina NovaSeq 6000</INSTRUMENT_MODEL></ILLUMINA>"
+        "</PLATFORM></EXPERIMENT><SAMPLE><SAMPLE_ATTRIBUTES>"
+        "<SAMPLE_ATTRIBUTE><TAG>collection_date</TAG>"
+        f"<VALUE>2022-{rand.randint(1, 12):02d}-{rand.randint(1, 28):02d}</VALUE>"
+        "</SAMPLE_ATTRIBUTE><SAMPLE_ATTRIBUTE><TAG>geo_loc_name</TAG>"
+        f"<VALUE>{rand.choice(LOCATIONS)}</VALUE></SAMPLE_ATTRIBUTE>"
+        "<SAMPLE_ATTRIBUTE><TAG>ww_population</TAG>"
+        f"<VALUE>{rand.randint(1000, 2000000)}</VALUE></SAMPLE_ATTRIBUTE>"
+        "</SAMPLE_ATTRIBUTES></SAMPLE><RUN_SET>"
+        f'<RUN accession="SRR{run:08d}" total_spots="{rand.randint(1, 10**6)}">'
+        f"<IDENTIFIERS><PRIMARY_ID>SRR{run:08d}</PRIMARY_ID></IDENTIFIERS>"
+        "</RUN></RUN_SET></EXPERIMENT_PACKAGE>\n"
+    )
+
+
+def write_meta(path: str, runs: int, seed: int = 0) -> str:
+    """
+    Writes a synthetic metadata xml with the passed number of runs
+
+    Returns the path written
+    """
+
+    rand = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as out_fh:
+        out_fh.write('<?xml version="1.0" ?>\n<EXPERIMENT_PACKAGE_SET>\n')
+        for run in range(runs):
+            out_fh.write(package(run, rand))
+        out_fh.write("</EXPERIMENT_PACKAGE_SET>\n")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="xml file to write")
+    parser.add_argument("-n", "--runs", type=int, default=10000)
+    args = parser.parse_args()
+    write_meta(args.path, args.runs)
@@ -0,0 +1,300 @@
+"""
+This module has the index of the aggregate files (VCs.tsv, Lineages.tsv and
+Consensus.fa) used by aggregate_endpoints() in snakefunctions.py.  A SQLite
+sidecar in the endpoints directory maps each sample accession to the byte
+range of its block in each aggregate file, so finding a sample is a lookup
+instead of a read of the whole file.  A replaced sample's old block is
+overwritten in place by a tombstone of blank lines, which the files'
+readers skip, and its new block appended, so no file is rewritten until it
+is compacted.
+
+Compact the aggregate files of an endpoints directory, ie
+    python aggregate_index.py endpoints
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+INDEX_FILE = "aggregate_index.sqlite"
+TSV_SEP = b"\n--------\n"
+CONSENSUS_RE = re.compile(rb">(?:Consensus_)?(.+?)(?:_threshold.*)?\s*$")
+AGGREGATES = {"VCs.tsv": "tsv", "Lineages.tsv": "tsv", "Consensus.fa": "fasta"}
+
+
+def tsv_blocks(data: bytes):
+    """
+    Yields the accession, offset and length of each sample block of an
+    aggregate tsv, its accession line to its separator
+    """
+
+    offset = 0
+    while offset < len(data):
+        end = data.find(TSV_SEP, offset)
+        end = len(data) if end < 0 else end + len(TSV_SEP)
+        block = data[offset:end]
+        if block.strip(b"\n-"):
+            start = offset + len(block) - len(block.lstrip(b"\n"))
+            yield data[start : data.find(b"\n", start)].decode(), start, end - start
+        offset = end
+
+
+def fasta_blocks(data: bytes):
+    """
+    Yields the accession, offset and length of each consensus record of an
+    aggregate fasta, its header to its last sequence line
+    """
+
+    accession, start, length = "", -1, 0
+    offset = 0
+    for line in data.splitlines(keepends=True):
+        if line.startswith(b">"):
+            if start >= 0:
+                yield accession, start, length
+            match = CONSENSUS_RE.match(line)
+            accession = match.group(1).decode() if match else ""
+            start, length = offset, len(line)
+        elif start >= 0 and line.strip():
+            length = offset + len(line) - start
+        offset += len(line)
+    if start >= 0:
+        yield accession, start, length
+
+
+class AggregateFile:
+    """
+    An aggregate file with its index.
+
+    Parameters:
+    path - aggregate file - str
+    kind - tsv or fasta - str
+    index - SQLite index file, by default in the aggregate's directory - str
+
+    Functionality:
+        The index has each sample's byte range in the file, the file's size
+        and its bytes taken by tombstones.  If the file's size isn't the
+        indexed size, ie a new index, an older file or a run that stopped
+        before closing, the index is rebuilt from one scan of the file.
+        A missing file is only created when the first sample is added.
+        Index changes are committed by close().
+    """
+
+    def __init__(self, path: str, kind: str, index: str = ""):
+        self.path = path
+        self.kind = kind
+        self.conn = sqlite3.connect(
+            index or os.path.join(os.path.dirname(path) or ".", INDEX_FILE),
+            timeout=60,
+        )
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blocks (
+                file TEXT,
+                accession TEXT,
+                offset INTEGER,
+                length INTEGER,
+                PRIMARY KEY (file, accession)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                size INTEGER,
+                dead INTEGER
+            );
+            """
+        )
+        self.name = os.path.basename(path)
+        self.fh = None
+        self.size = 0
+        if os.path.isfile(path):
+            self.fh = open(path, "r+b")  # pylint: disable=consider-using-with
+            self.size = os.path.getsize(path)
+        self.dead = 0
+        row = self.conn.execute(
+            "SELECT size, dead FROM files WHERE file = ?", (self.name,)
+        ).fetchone()
+        if row and row[0] == self.size:
+            self.dead = row[1]
+        else:
+            self.rebuild()
+
+    def rebuild(self) -> int:
+        """
+        Called to index the file from a scan of its blocks.  Of blocks of
+        the same sample, the last is indexed and the others counted as dead.
+
+        Returns the number of samples indexed
+        """
+
+        data = b""
+        if self.fh:
+            self.fh.seek(0)
+            data = self.fh.read()
+        blocks = {}
+        scan = tsv_blocks if self.kind == "tsv" else fasta_blocks
+        for accession, offset, length in scan(data):
+            blocks[accession] = (offset, length)
+        self.conn.execute("DELETE FROM blocks WHERE file = ?", (self.name,))
+        self.conn.executemany(
+            "INSERT INTO blocks (file, accession, offset, length) VALUES (?, ?, ?, ?)",
+            [(self.name, acc, off, length) for acc, (off, length) in blocks.items()],
+        )
+        self.dead = len(data) - sum(length for _, length in blocks.values())
+        return len(blocks)
+
+    def block(self, data: bytes, accession: str) -> bytes:
+        """
+        Returns the block of a sample's endpoint file data in the file
+        """
+
+        if self.kind == "tsv":
+            return accession.encode() + b"\n" + data + TSV_SEP
+        return data
+
+    def present(self, accession: str) -> bool:
+        """
+        Returns if the sample is in the file
+        """
+
+        return bool(
+            self.conn.execute(
+                "SELECT 1 FROM blocks WHERE file = ? AND accession = ?",
+                (self.name, accession),
+            ).fetchone()
+        )
+
+    def add(self, accession: str, data: bytes):
+        """
+        Called to append a sample's block to the file, tombstoning its
+        current block if it has one
+
+        Parameters:
+        accession - sample accession - str
+        data - the content of the sample's endpoint file - bytes
+        """
+
+        row = self.conn.execute(
+            "SELECT offset, length FROM blocks WHERE file = ? AND accession = ?",
+            (self.name, accession),
+        ).fetchone()
+        if row:
+            self.fh.seek(row[0])
+            if self.kind == "tsv" and row[1] >= len(TSV_SEP):
+                self.fh.write(b"\n" * (row[1] - len(TSV_SEP)) + TSV_SEP)
+            else:
+                self.fh.write(b"\n" * row[1])
+            self.dead += row[1]
+        block = self.block(data, accession)
+        if not self.fh:
+            self.fh = open(self.path, "w+b")  # pylint: disable=consider-using-with
+        self.fh.seek(self.size)
+        self.fh.write(block)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO blocks (file, accession, offset, length) "
+            "VALUES (?, ?, ?, ?)",
+            (self.name, accession, self.size, len(block)),
+        )
+        self.size += len(block)
+
+    def compact(self) -> int:
+        """
+        Called to rewrite the file without its tombstones, keeping the
+        samples' order
+
+        Returns the number of bytes reclaimed
+        """
+
+        if not self.fh:
+            return 0
+        reclaimed = self.dead
+        blocks = self.conn.execute(
+            "SELECT accession, offset, length FROM blocks WHERE file = ? "
+            "ORDER BY offset",
+            (self.name,),
+        ).fetchall()
+        offset = 0
+        with open(f"{self.path}.tmp", "wb") as out_fh:
+            for accession, old_offset, length in blocks:
+                self.fh.seek(old_offset)
+                out_fh.write(self.fh.read(length))
+                self.conn.execute(
+                    "UPDATE blocks SET offset = ? WHERE file = ? AND accession = ?",
+                    (offset, self.name, accession),
+                )
+                offset += length
+        self.fh.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        self.fh = open(self.path, "r+b")  # pylint: disable=consider-using-with
+        self.size = offset
+        self.dead = 0
+        self.commit()
+        return reclaimed
+
+    def commit(self):
+        """
+        Called to flush the file and commit the index with its size
+        """
+
+        if self.fh:
+            self.fh.flush()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (file, size, dead) VALUES (?, ?, ?)",
+            (self.name, self.size, self.dead),
+        )
+        self.conn.commit()
+
+    def close(self):
+        """
+        Commits and closes the file and index
+        """
+
+        self.commit()
+        if self.fh:
+            self.fh.close()
+        self.conn.close()
+
+
+def add_endpoints(agg: AggregateFile, files: list, redo: bool):
+    """
+    Generator adding samples' endpoint files to an aggregate file
+
+    Parameters:
+    agg - the aggregate file - AggregateFile
+    files - the samples' endpoint files, endpoints/ACCESSION.* - list
+    redo - replace samples already in the file - bool
+
+    Yields the accession and file content of each sample added
+    """
+
+    for file in files:
+        accession = os.path.basename(file).split(".")[0]
+        if redo or not agg.present(accession):
+            with open(file, "rb") as samp_fh:
+                data = samp_fh.read()
+            agg.add(accession, data)
+            yield accession, data
+
+
+def main(argv=None) -> int:
+    """
+    Compacts the aggregate files of an endpoints directory
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("endpoints", help="endpoints directory")
+    args = parser.parse_args(argv)
+
+    for name, kind in AGGREGATES.items():
+        path = os.path.join(args.endpoints, name)
+        if os.path.isfile(path):
+            agg = AggregateFile(path, kind)
+            print(f"{path}: reclaimed {agg.compact()} bytes")
+            agg.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
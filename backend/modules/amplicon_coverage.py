@@ -0,0 +1,376 @@
+"""
+This module has the amplicon coverage report written by the
+amplicons rule in snakefile3.  Each primer bed is indexed once as the
+sorted insert intervals of its amplicons, and the samples using a bed
+have their depths taken from the depth matrix (see depth_matrix.py)
+together, so each amplicon's mean depth and breadth (the fraction of its
+positions with at least min_depth reads) for every sample are differences
+of the samples' cumulative depths at the amplicons' ends.  An amplicon
+whose breadth is below the dropout breadth is flagged as a dropout.
+
+The report, endpoints/AmpliconCoverage.tsv, has a row for each amplicon of
+each sample.  Samples reported again replace their rows.  Report all the
+samples of the depth matrix with the beds of sra_meta_collect tsvs, ie
+    python amplicon_coverage.py endpoints/depth_matrix sra_meta_collect_*.tsv
+"""
+
+import argparse
+import csv
+import functools
+import os
+import re
+import sys
+
+from depth_matrix import DepthMatrix
+from downsample import PRIMER_CLUSTER
+
+REPORT_FILE = "endpoints/AmpliconCoverage.tsv"
+COLUMNS = (
+    "accession",
+    "bed",
+    "amplicon",
+    "start",
+    "end",
+    "mean_depth",
+    "breadth",
+    "dropout",
+)
+# the primer's direction and any alt suffix, ie _LEFT_alt1, _RIGHT, for, rev
+DIRECTION_RE = re.compile(r"(?i)(_(LEFT|RIGHT)(_alt\w*)?|for|rev|ref)$")
+CHUNK = 256
+MAX_INSERT = 2500
+
+
+def read_primers(bed_file: str) -> dict:
+    """
+    Returns dict of the (start, end) of the forward (+) and reverse (-)
+    primers of a bed, by their names
+    """
+
+    primers = {"+": {}, "-": {}}
+    with open(bed_file, "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 6 and fields[5] in primers:
+                primers[fields[5]][fields[3]] = (int(fields[1]), int(fields[2]))
+    return primers
+
+
+def cluster(primers: list) -> list:
+    """
+    Returns list of [start, end] of the primers merged where they start
+    within PRIMER_CLUSTER nts of each other, ie alternate primers
+    """
+
+    clusters = []
+    for start, end in sorted(primers):
+        if clusters and start - clusters[-1][0] <= PRIMER_CLUSTER:
+            clusters[-1][1] = max(clusters[-1][1], end)
+        else:
+            clusters.append([start, end])
+    return clusters
+
+
+def named_inserts(primers: dict) -> tuple:
+    """
+    Returns list of the (name, start, end) inserts of the forward and
+    reverse primers with the same name but for their direction, and the set
+    of the primers they pair
+    """
+
+    named = {}
+    for strand, names in primers.items():
+        for name, interval in names.items():
+            key = DIRECTION_RE.sub("", name)
+            if key != name:
+                named.setdefault(key, {"+": [], "-": []})[strand].append(interval)
+    inserts = []
+    paired = set()
+    for key, strands in named.items():
+        if strands["+"] and strands["-"]:
+            inserts.append(
+                (
+                    key,
+                    max(end for _, end in strands["+"]),
+                    min(start for start, _ in strands["-"]),
+                )
+            )
+            paired.update(strands["+"] + strands["-"])
+    return inserts, paired
+
+
+def amplicons(bed_file: str) -> list:
+    """
+    Called to get the amplicons of a primer scheme
+
+    Parameters:
+    bed_file - primer bed with the primers' strands - str
+
+    Functionality:
+        Forward and reverse primers with the same name but for their
+        direction (ie nCoV-2019_1_LEFT and nCoV-2019_1_RIGHT_alt1) make an
+        amplicon.  The remaining forward primer clusters are paired in order
+        with the first unpaired reverse primer cluster after them, if it's
+        within MAX_INSERT nts, and unpaired primers are left out.  An
+        amplicon's insert runs from the end of its forward primers to the
+        start of its reverse primers, and amplicons with inserts within
+        PRIMER_CLUSTER nts of another's are merged.
+
+    Returns list of the (name, start, end) of the inserts, 0 based half
+    open, sorted by start
+    """
+
+    primers = read_primers(bed_file)
+    inserts, paired = named_inserts(primers)
+    reverse = cluster(
+        interval for interval in primers["-"].values() if interval not in paired
+    )
+    for start, end in cluster(
+        interval for interval in primers["+"].values() if interval not in paired
+    ):
+        rev = next((rev for rev in reverse if rev[0] > end), None)
+        if rev and rev[0] - end <= MAX_INSERT:
+            inserts.append((f"{start}_{rev[1]}", end, rev[0]))
+            reverse.remove(rev)
+    merged = []
+    for name, start, end in sorted(inserts, key=lambda insert: insert[1:]):
+        if (
+            merged
+            and abs(start - merged[-1][1]) <= PRIMER_CLUSTER
+            and abs(end - merged[-1][2]) <= PRIMER_CLUSTER
+        ):
+            continue
+        merged.append((name, start, end))
+    return merged
+
+
+class AmpliconIndex:
+    """
+    Interval index of a primer scheme's amplicon inserts.
+
+    Parameters:
+    bed_file - primer bed - str
+    length - reference length the depths cover - int
+
+    Functionality:
+        The inserts' starts and ends split the reference into segments, and
+        each insert is the segments between its start's and end's columns,
+        so the samples' depths are summed once for each segment rather than
+        for each insert.
+    """
+
+    def __init__(self, bed_file: str, length: int):
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        inserts = [
+            insert
+            for insert in amplicons(bed_file)
+            if 0 <= insert[1] < min(insert[2], length)
+        ]
+        self.names = [name for name, _, _ in inserts]
+        self.starts = numpy.array([start for _, start, _ in inserts], "i8")
+        self.ends = numpy.minimum([end for _, _, end in inserts], length).astype("i8")
+        self.lengths = self.ends - self.starts
+        self.bounds = numpy.unique(numpy.concatenate([self.starts, self.ends]))
+        self.bounds = self.bounds[self.bounds < length]
+        self.start_cols = numpy.searchsorted(self.bounds, self.starts)
+        self.end_cols = numpy.searchsorted(self.bounds, self.ends)
+
+    def coverage(self, depths, min_depth: int) -> tuple:
+        """
+        Called to get the coverage of the amplicons in samples
+
+        Parameters:
+        depths - samples (rows) by reference positions depths - numpy array
+        min_depth - depth a position needs to be covered - int
+
+        Returns numpy arrays of the samples by amplicons mean depths and
+        breadths
+        """
+
+        return self.means(depths), self.means(depths >= min_depth)
+
+    def means(self, values):
+        """
+        Returns numpy array of the samples by amplicons means of the values
+        over the amplicons' inserts
+        """
+
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        sums = numpy.zeros((len(values), len(self.bounds) + 1), "i8")
+        numpy.cumsum(
+            numpy.add.reduceat(values, self.bounds, axis=1, dtype="i8"),
+            axis=1,
+            out=sums[:, 1:],
+        )
+        return (sums[:, self.end_cols] - sums[:, self.start_cols]) / self.lengths
+
+    def rows(self, accession: str, bed: str, coverage: tuple, dropout_breadth: float):
+        """
+        Yields the report rows of a sample's amplicons from its rows of the
+        mean depths and breadths of coverage()
+        """
+
+        means, breadths = coverage
+        for amplicon, name in enumerate(self.names):
+            yield (
+                accession,
+                bed,
+                name,
+                int(self.starts[amplicon]),
+                int(self.ends[amplicon]),
+                f"{means[amplicon]:.2f}",
+                f"{breadths[amplicon]:.4f}",
+                int(breadths[amplicon] < dropout_breadth),
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def scheme_index(bed_file: str, length: int) -> AmpliconIndex:
+    """
+    Returns the interval index of a primer scheme, built once for each bed
+    """
+
+    return AmpliconIndex(bed_file, length)
+
+
+def samples_by_bed(matrix: DepthMatrix, beds: dict, data_dir: str) -> dict:
+    """
+    Returns dict of the samples in the depth matrix using each primer bed
+    file found in the data directory
+    """
+
+    by_bed = {}
+    for accession, bed in beds.items():
+        if matrix.row(accession) >= 0 and bed.endswith(".bed"):
+            if os.path.isfile(os.path.join(data_dir, bed)):
+                by_bed.setdefault(bed, []).append(accession)
+    return by_bed
+
+
+def amplicon_coverage(
+    matrix: DepthMatrix,
+    beds: dict,
+    data_dir: str = "",
+    min_depth: int = 10,
+    dropout_breadth: float = 0.5,
+):
+    """
+    Called to get the amplicon coverage of samples
+
+    Parameters:
+    matrix - depth matrix of the samples - DepthMatrix
+    beds - the primer bed of each sample, as in sra_accs - dict
+    data_dir - directory the beds' paths are relative to - str
+    min_depth - depth a position needs to be covered - int
+    dropout_breadth - breadth an amplicon needs not to be a dropout - float
+
+    Functionality:
+        Samples without a primer bed file or not in the depth matrix are
+        skipped.  The samples of each bed are computed together, CHUNK
+        samples at a time.
+
+    Yields a report row for each amplicon of each sample
+    """
+
+    depths = matrix.load()
+    for bed, accessions in sorted(samples_by_bed(matrix, beds, data_dir).items()):
+        index = scheme_index(os.path.join(data_dir, bed), matrix.length)
+        if not index.names:
+            continue
+        for chunk in range(0, len(accessions), CHUNK):
+            accs = accessions[chunk : chunk + CHUNK]
+            means, breadths = index.coverage(
+                depths[[matrix.row(acc) for acc in accs]], min_depth
+            )
+            for sample, accession in enumerate(accs):
+                yield from index.rows(
+                    accession, bed, (means[sample], breadths[sample]), dropout_breadth
+                )
+
+
+def write_report(rows, report: str = REPORT_FILE) -> int:
+    """
+    Called to write report rows, replacing the rows of their samples in an
+    existing report
+
+    Parameters:
+    rows - report rows from amplicon_coverage() - iterable
+    report - the report tsv - str
+
+    Returns the number of samples written
+    """
+
+    rows = list(rows)
+    accessions = {row[0] for row in rows}
+    kept = []
+    if os.path.isfile(report):
+        with open(report, "r", encoding="utf-8") as in_fh:
+            reader = csv.reader(in_fh, delimiter="\t")
+            next(reader, None)
+            kept = [row for row in reader if row and row[0] not in accessions]
+    with open(f"{report}.tmp", "w", encoding="utf-8") as out_fh:
+        writer = csv.writer(out_fh, delimiter="\t", lineterminator="\n")
+        writer.writerow(COLUMNS)
+        writer.writerows(kept)
+        writer.writerows(rows)
+    os.replace(f"{report}.tmp", report)
+    return len(accessions)
+
+
+def read_beds(meta_files: list) -> dict:
+    """
+    Returns dict of the primer bed of each sample of sra_meta_collect tsvs,
+    later files taking precedence
+    """
+
+    beds = {}
+    for meta_file in meta_files:
+        with open(meta_file, "r", encoding="utf-8") as in_fh:
+            reader = csv.reader(in_fh, delimiter="\t")
+            next(reader, None)
+            beds.update((row[0], row[3]) for row in reader if len(row) >= 4)
+    return beds
+
+
+def main(argv=None) -> int:
+    """
+    Writes the amplicon coverage of the samples of a depth matrix
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "matrix", help="depth matrix directory, ie endpoints/depth_matrix"
+    )
+    parser.add_argument("meta", nargs="+", help="sra_meta_collect tsvs with the beds")
+    parser.add_argument("-o", "--out", default=REPORT_FILE, help="report tsv")
+    parser.add_argument(
+        "--data",
+        default=os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        help="directory the beds' paths are relative to",
+    )
+    parser.add_argument("-d", "--min-depth", type=int, default=10)
+    parser.add_argument("-b", "--dropout-breadth", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    matrix = DepthMatrix(args.matrix)
+    samples = write_report(
+        amplicon_coverage(
+            matrix,
+            read_beds(args.meta),
+            args.data,
+            args.min_depth,
+            args.dropout_breadth,
+        ),
+        args.out,
+    )
+    matrix.close()
+    print(f"{args.out}: {samples} samples")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
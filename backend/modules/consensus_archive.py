@@ -0,0 +1,408 @@
+"""
+This module has the consensus archive kept beside endpoints/Consensus.fa by
+aggregate_endpoints() in snakefunctions.py.  Each sample's consensus is
+stored in a SQLite database, endpoints/consensus_archive.sqlite, keyed by
+accession, as its differences from the reference (data/SARS2.fasta):
+    S pos seq - substitutions of the reference bases from pos
+    N pos ref_len seq_len - a run of seq_len Ns in place of ref_len bases
+    R pos ref_len seq - seq in place of ref_len bases, ie an indel
+with pos 0 based.  The differences are found by extending exact matches
+from anchors of k-mers unique in the reference, so the consensus needn't be
+aligned.  A record the differences don't reproduce exactly is stored whole.
+
+Export the consensus of samples, or all of them, as fasta, ie
+    python consensus_archive.py endpoints/consensus_archive.sqlite SRR17866146
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import zlib
+
+from aggregate_index import fasta_blocks
+
+ARCHIVE_FILE = "endpoints/consensus_archive.sqlite"
+KMER = 16
+
+
+def read_reference(fasta: str) -> tuple:
+    """
+    Returns the name and sequence of the first record of a fasta
+    """
+
+    with open(fasta, "r", encoding="utf-8") as in_fh:
+        lines = in_fh.read().splitlines()
+    return lines[0][1:].split()[0], "".join(lines[1:]).upper()
+
+
+def kmer_index(ref: str, kmer: int = KMER) -> dict:
+    """
+    Returns dict of the position of each k-mer occurring once in the reference
+    """
+
+    index = {}
+    for pos in range(len(ref) - kmer + 1):
+        word = ref[pos : pos + kmer]
+        index[word] = -1 if word in index else pos
+    return {word: pos for word, pos in index.items() if pos >= 0}
+
+
+def match_length(seq: str, i: int, ref: str, j: int) -> int:
+    """
+    Returns the length of the exact match of seq from i and ref from j
+    """
+
+    length = 0
+    step = 1024
+    while step:
+        if seq[i + length : i + length + step] == ref[j + length : j + length + step]:
+            if i + length + step > len(seq) or j + length + step > len(ref):
+                return length + min(len(seq) - i - length, len(ref) - j - length)
+            length += step
+        else:
+            step //= 2
+    return length
+
+
+def gap_ops(pos: int, ref_gap: str, seq_gap: str) -> list:
+    """
+    Returns the ops for a part of the consensus between exact matches
+    """
+
+    prefix = 0
+    while (
+        prefix < min(len(ref_gap), len(seq_gap)) and ref_gap[prefix] == seq_gap[prefix]
+    ):
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < min(len(ref_gap), len(seq_gap)) - prefix
+        and ref_gap[-1 - suffix] == seq_gap[-1 - suffix]
+    ):
+        suffix += 1
+    pos += prefix
+    ref_gap = ref_gap[prefix : len(ref_gap) - suffix]
+    seq_gap = seq_gap[prefix : len(seq_gap) - suffix]
+    if not ref_gap and not seq_gap:
+        return []
+    if seq_gap and seq_gap == "N" * len(seq_gap):
+        return [("N", pos, len(ref_gap), len(seq_gap))]
+    if len(ref_gap) != len(seq_gap):
+        return [("R", pos, len(ref_gap), seq_gap)]
+    ops = []
+    start = 0
+    for end in range(1, len(seq_gap) + 1):
+        kind = (
+            "=" if seq_gap[start] == ref_gap[start] else "N" * (seq_gap[start] == "N")
+        )
+        if end < len(seq_gap) and kind == (
+            "=" if seq_gap[end] == ref_gap[end] else "N" * (seq_gap[end] == "N")
+        ):
+            continue
+        if kind == "N":
+            ops.append(("N", pos + start, end - start, end - start))
+        elif kind != "=":
+            ops.append(("S", pos + start, seq_gap[start:end]))
+        start = end
+    return ops
+
+
+def encode(ref: str, index: dict, seq: str) -> list:
+    """
+    Called to find the differences of a sequence from the reference
+
+    Parameters:
+    ref - reference sequence - str
+    index - the reference's unique k-mer positions, see kmer_index() - dict
+    seq - consensus sequence - str
+
+    Returns list of ops, see the module's doc
+    """
+
+    ops = []
+    i = j = 0
+    kmer = len(next(iter(index), "")) or KMER
+    while i < len(seq) and j < len(ref):
+        length = match_length(seq, i, ref, j)
+        i += length
+        j += length
+        if i >= len(seq) or j >= len(ref):
+            break
+        anchor = None
+        for pos in range(i + 1, len(seq) - kmer + 1):
+            ref_pos = index.get(seq[pos : pos + kmer], -1)
+            if ref_pos > j:
+                anchor = (pos, ref_pos)
+                break
+        if not anchor:
+            break
+        ops.extend(gap_ops(j, ref[j : anchor[1]], seq[i : anchor[0]]))
+        i, j = anchor
+    ops.extend(gap_ops(j, ref[j:], seq[i:]))
+    return ops
+
+
+def decode(ref: str, ops: list) -> str:
+    """
+    Returns the sequence of the reference with the ops applied
+    """
+
+    parts = []
+    last = 0
+    for op in ops:
+        parts.append(ref[last : op[1]])
+        if op[0] == "S":
+            parts.append(op[2])
+            last = op[1] + len(op[2])
+        elif op[0] == "N":
+            parts.append("N" * op[3])
+            last = op[1] + op[2]
+        else:
+            parts.append(op[3])
+            last = op[1] + op[2]
+    parts.append(ref[last:])
+    return "".join(parts)
+
+
+def pack(ops: list) -> bytes:
+    """
+    Returns the compressed ops
+    """
+
+    return zlib.compress(
+        "".join("\t".join(map(str, op)) + "\n" for op in ops).encode(), 9
+    )
+
+
+def unpack(blob: bytes) -> list:
+    """
+    Returns the ops of a compressed blob
+    """
+
+    ops = []
+    for line in zlib.decompress(blob).decode().splitlines():
+        fields = line.split("\t")
+        if fields[0] == "S":
+            ops.append(("S", int(fields[1]), fields[2]))
+        elif fields[0] == "N":
+            ops.append(("N", int(fields[1]), int(fields[2]), int(fields[3])))
+        else:
+            ops.append(("R", int(fields[1]), int(fields[2]), fields[3]))
+    return ops
+
+
+def fasta_records(data: str):
+    """
+    Yields the header and sequence lines of each record of a fasta
+    """
+
+    header, lines = None, []
+    for line in data.splitlines():
+        if line.startswith(">"):
+            if header is not None:
+                yield header, lines
+            header, lines = line[1:], []
+        elif header is not None and line:
+            lines.append(line)
+    if header is not None:
+        yield header, lines
+
+
+class ConsensusArchive:
+    """
+    Archive of the samples' consensus sequences as reference differences.
+
+    Parameters:
+    path - SQLite database file - str
+    reference - reference fasta the differences are from - str
+
+    Functionality:
+        The reference's name and sequence are stored in the archive, so
+        samples are decoded against the reference they were encoded with.
+        A sample added again replaces its record.  When the archive is
+        first created, the samples already in the Consensus.fa beside it
+        are added, so existing endpoints carry over.
+    """
+
+    def __init__(self, path: str = ARCHIVE_FILE, reference: str = ""):
+        new_archive = not os.path.isfile(path)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS reference (
+                name TEXT,
+                sequence TEXT
+            );
+            CREATE TABLE IF NOT EXISTS consensus (
+                accession TEXT PRIMARY KEY,
+                header TEXT,
+                width INTEGER,
+                raw INTEGER,
+                delta BLOB
+            );
+            """
+        )
+        row = self.conn.execute("SELECT name, sequence FROM reference").fetchone()
+        if row:
+            self.ref_name, self.ref = row
+        elif reference:
+            self.ref_name, self.ref = read_reference(reference)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO reference (name, sequence) VALUES (?, ?)",
+                    (self.ref_name, self.ref),
+                )
+        else:
+            raise ValueError(f"{path} has no reference and none was given")
+        self.index = {}
+        consensus = os.path.join(os.path.dirname(path) or ".", "Consensus.fa")
+        if new_archive and os.path.isfile(consensus):
+            self.import_aggregate(consensus)
+
+    def add(self, accession: str, record: str) -> int:
+        """
+        Called to add or replace a sample's consensus
+
+        Parameters:
+        accession - sample accession - str
+        record - the sample's consensus fasta - str
+
+        Returns the size of the sample's stored record
+        """
+
+        header, lines = next(fasta_records(record), ("", []))
+        seq = "".join(lines)
+        width = len(lines[0]) if len(lines) > 1 else 0
+        if not self.index:
+            self.index = kmer_index(self.ref)
+        ops = encode(self.ref, self.index, seq)
+        raw = decode(self.ref, ops) != seq or self.fasta(header, width, seq) != record
+        blob = zlib.compress(record.encode(), 9) if raw else pack(ops)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO consensus (accession, header, width, raw, delta) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (accession, header, width, int(raw), blob),
+            )
+        return len(blob)
+
+    def import_aggregate(self, consensus: str) -> int:
+        """
+        Called to add the samples of an aggregate Consensus.fa
+
+        Returns the number of samples added
+        """
+
+        with open(consensus, "rb") as in_fh:
+            data = in_fh.read()
+        samples = 0
+        for accession, offset, length in fasta_blocks(data):
+            self.add(accession, data[offset : offset + length].decode())
+            samples += 1
+        return samples
+
+    @staticmethod
+    def fasta(header: str, width: int, seq: str) -> str:
+        """
+        Returns the fasta record of a consensus
+        """
+
+        width = width or len(seq) or 1
+        lines = [seq[pos : pos + width] for pos in range(0, len(seq), width)]
+        return "\n".join([f">{header}"] + lines) + "\n"
+
+    def decode_row(self, row: tuple) -> str:
+        """
+        Returns the fasta record of a consensus table row
+        """
+
+        header, width, raw, blob = row
+        if raw:
+            return zlib.decompress(blob).decode()
+        return self.fasta(header, width, decode(self.ref, unpack(blob)))
+
+    def get(self, accession: str) -> str:
+        """
+        Returns the fasta record of a sample's consensus, empty if it isn't
+        in the archive
+        """
+
+        row = self.conn.execute(
+            "SELECT header, width, raw, delta FROM consensus WHERE accession = ?",
+            (accession,),
+        ).fetchone()
+        return self.decode_row(row) if row else ""
+
+    def records(self):
+        """
+        Yields the accession and fasta record of every consensus, in the
+        order they were first added
+        """
+
+        for row in self.conn.execute(
+            "SELECT accession, header, width, raw, delta FROM consensus ORDER BY rowid"
+        ):
+            yield row[0], self.decode_row(row[1:])
+
+    def accessions(self) -> list:
+        """
+        Returns the samples in the archive
+        """
+
+        return [
+            row[0]
+            for row in self.conn.execute(
+                "SELECT accession FROM consensus ORDER BY rowid"
+            )
+        ]
+
+    def close(self):
+        """
+        Closes the archive
+        """
+
+        self.conn.close()
+
+
+def main(argv=None) -> int:
+    """
+    Writes the consensus of samples, or all samples, as fasta
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("archive", help="consensus_archive.sqlite")
+    parser.add_argument("accessions", nargs="*", help="samples, all if none")
+    parser.add_argument("-o", "--out", help="fasta written, stdout by default")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.archive):
+        print(f"{args.archive} not found", file=sys.stderr)
+        return 1
+    archive = ConsensusArchive(args.archive)
+    out_fh = (
+        open(args.out, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        if args.out
+        else sys.stdout
+    )
+    missing = 0
+    if args.accessions:
+        for accession in args.accessions:
+            record = archive.get(accession)
+            if not record:
+                print(f"{accession} not in {args.archive}", file=sys.stderr)
+                missing += 1
+            out_fh.write(record)
+    else:
+        for _, record in archive.records():
+            out_fh.write(record)
+    if args.out:
+        out_fh.close()
+    archive.close()
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
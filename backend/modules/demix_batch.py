@@ -0,0 +1,218 @@
+"""
+This module demixes the lineages of many samples in one process, instead of
+a freyja demix process for each sample.  The lineage barcodes and lineage
+map are loaded once and the samples' variants and depths are demixed by a
+pool of workers forked from the loading process, using freyja's own
+functions so the lineage reports are the same as freyja demix writes.
+
+Run from the lineages_batch rule in the freyja env, ie
+    python demix_batch.py -j 8 endpoints/ACC1.tsv endpoints/ACC2.tsv
+writes endpoints/ACC1.lineages.tsv and endpoints/ACC2.lineages.tsv from the
+variants tsvs and the .depth files beside them, or from snakefile_redemix
+    python demix_batch.py -j 8 --endpoints endpoints
+re-demixes every sample of the endpoints directory.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+# set by load() in the loading process, inherited by the forked workers
+_DEMIX = {}
+
+
+def load(barcodes: str = "-1", meta: str = "-1", confirmed_only: bool = False):
+    """
+    Called to load the lineage barcodes and lineage map for the workers
+
+    Parameters:
+    barcodes - barcode csv, -1 for freyja's barcodes - str
+    meta - curated lineage json, -1 for freyja's - str
+    confirmed_only - only use confirmed lineages, as freyja's --confirmedonly
+        - bool
+
+    Returns the number of lineages loaded
+    """
+
+    import pandas as pd  # pylint: disable=import-outside-toplevel,import-error
+    from freyja.sample_deconv import (  # pylint: disable=import-outside-toplevel,import-error
+        buildLineageMap,
+    )
+
+    if barcodes == "-1":
+        import freyja  # pylint: disable=import-outside-toplevel,import-error
+
+        barcodes = os.path.join(
+            os.path.dirname(os.path.realpath(freyja.__file__)),
+            "data/usher_barcodes.csv",
+        )
+    df_barcodes = pd.read_csv(barcodes, index_col=0)
+    if confirmed_only:
+        df_barcodes = df_barcodes.loc[
+            [
+                lineage
+                for lineage in df_barcodes.index
+                if "proposed" not in lineage and "misc" not in lineage
+            ],
+            :,
+        ]
+    _DEMIX["barcodes"] = df_barcodes
+    _DEMIX["muts"] = list(df_barcodes.columns)
+    _DEMIX["map"] = buildLineageMap(meta)
+    return len(df_barcodes.index)
+
+
+def endpoint_samples(endpoints: str) -> list:
+    """
+    Returns the sorted variants tsvs of the endpoints directory that have a
+    depth file, ie of every sample processed there
+    """
+
+    files = set(os.listdir(endpoints)) if os.path.isdir(endpoints) else set()
+    return [
+        os.path.join(endpoints, name)
+        for name in sorted(files)
+        if name.endswith(".tsv") and f"{name[:-4]}.depth" in files
+    ]
+
+
+def lineages_file(variants: str) -> str:
+    """
+    Returns the lineage report of a sample's variants tsv
+    """
+
+    return f"{os.path.splitext(variants)[0]}.lineages.tsv"
+
+
+def solve_sample(variants: str, eps: float, covcut: int) -> tuple:
+    """
+    Called by demix_sample() to solve a sample's lineage abundances with
+    freyja's functions
+
+    Returns tuple of the sample name, lineages, abundances, residual and
+    coverage
+    """
+
+    from freyja.sample_deconv import (  # pylint: disable=import-outside-toplevel,import-error
+        build_mix_and_depth_arrays,
+        reindex_dfs,
+        solve_demixing_problem,
+    )
+
+    mix, depths, cov = build_mix_and_depth_arrays(
+        variants, f"{os.path.splitext(variants)[0]}.depth", _DEMIX["muts"], covcut
+    )
+    df_barcodes, mix, depths = reindex_dfs(_DEMIX["barcodes"], mix, depths)
+    strains, abundances, error = solve_demixing_problem(df_barcodes, mix, depths, eps)
+    return mix.name, strains, abundances, error, cov
+
+
+def demix_sample(variants: str, eps: float = 1e-3, covcut: int = 10) -> str:
+    """
+    Called by the workers to demix a sample as freyja demix does
+
+    Parameters:
+    variants - ivar variants tsv of the sample, with its .depth beside it - str
+    eps - minimum lineage abundance - float
+    covcut - depth cutoff for the coverage estimate - int
+
+    Returns the written lineage report
+    """
+
+    import pandas as pd  # pylint: disable=import-outside-toplevel,import-error
+    from freyja.sample_deconv import (  # pylint: disable=import-outside-toplevel,import-error
+        map_to_constellation,
+    )
+
+    name, strains, abundances, error, cov = solve_sample(variants, eps, covcut)
+    sols_df = pd.Series(
+        data=(
+            map_to_constellation(strains, abundances, _DEMIX["map"]),
+            strains,
+            abundances,
+            error,
+            cov,
+        ),
+        index=["summarized", "lineages", "abundances", "resid", "coverage"],
+        name=name,
+    )
+    sols_df["lineages"] = " ".join(sols_df["lineages"])
+    sols_df["abundances"] = " ".join(f"{abundance:.8f}" for abundance in abundances)
+    output = lineages_file(variants)
+    sols_df.to_csv(output, sep="\t")
+    return output
+
+
+def demix_batch(variants: list, jobs: int = 1, **kwargs) -> list:
+    """
+    Called to demix the samples with a pool of workers
+
+    Parameters:
+    variants - the samples' variants tsvs - list
+    jobs - worker processes - int
+    kwargs - eps and covcut as for demix_sample()
+
+    Functionality:
+        The barcodes must already be loaded with load().  A sample that
+        fails is reported and the other samples are still demixed.
+
+    Returns list of the samples that failed
+    """
+
+    failed = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(jobs, len(variants))), mp_context=get_context("fork")
+    ) as executor:
+        futures = {
+            executor.submit(demix_sample, sample, **kwargs): sample
+            for sample in variants
+        }
+        for future in as_completed(futures):
+            try:
+                print(f"demixed {futures[future]} to {future.result()}")
+            except Exception as err:  # pylint: disable=broad-except
+                print(f"demixing {futures[future]} failed: {err!r}", file=sys.stderr)
+                failed.append(futures[future])
+    return failed
+
+
+def main(argv=None) -> int:
+    """
+    Demixes the samples of the command line
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("variants", nargs="*", help="ivar variants tsvs")
+    parser.add_argument(
+        "--endpoints", help="also demix all the samples of this directory"
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--barcodes", default="-1")
+    parser.add_argument("--meta", default="-1")
+    parser.add_argument("--eps", type=float, default=1e-3)
+    parser.add_argument("--covcut", type=int, default=10)
+    parser.add_argument("--confirmedonly", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.endpoints:
+        args.variants += endpoint_samples(args.endpoints)
+    if not args.variants:
+        parser.error("no samples to demix")
+    start = time.time()
+    lineages = load(args.barcodes, args.meta, args.confirmedonly)
+    print(f"loaded {lineages} lineage barcodes in {time.time() - start:.1f}s")
+    failed = demix_batch(args.variants, args.jobs, eps=args.eps, covcut=args.covcut)
+    print(
+        f"demixed {len(args.variants) - len(failed)} of {len(args.variants)} "
+        f"samples in {time.time() - start:.1f}s"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+This module has the depth matrix kept beside the samples' .depth files by
+aggregate_endpoints() in snakefunctions.py.  The matrix is a directory,
+endpoints/depth_matrix, of
+    accessions.txt - the row index, a sample accession per line
+    depths.bin - each row's uint32 depths over the reference positions
+Each sample's row is a fixed length, so a reprocessed sample's depths are
+written over its row, and a row is read, or the whole matrix memory mapped,
+without parsing text.  The .depth files are still written for freyja.
+
+Writing only needs the standard library; numpy is imported when the matrix
+is read, ie
+    matrix = DepthMatrix("endpoints/depth_matrix")
+    depths = matrix.load()
+    (depths >= 10).mean(axis=1)
+
+Write each sample's mean depth and breadth of coverage as a tsv, ie
+    python depth_matrix.py endpoints/depth_matrix --min-depth 10
+"""
+
+import argparse
+import glob
+import os
+import struct
+import sys
+
+MATRIX_DIR = "endpoints/depth_matrix"
+REF_LENGTH = 29903
+
+
+def read_depth(depth_file: str, length: int = REF_LENGTH) -> list:
+    """
+    Called to read a sample's depths
+
+    Parameters:
+    depth_file - the sample's mpileup derived .depth file - str
+    length - reference length - int
+
+    Returns list of the depth of each reference position, 0 for positions
+    not in the file
+    """
+
+    depths = [0] * length
+    with open(depth_file, "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            fields = line.split("\t", 4)
+            if len(fields) > 3 and 0 < int(fields[1]) <= length:
+                depths[int(fields[1]) - 1] = int(fields[3])
+    return depths
+
+
+class DepthMatrix:
+    """
+    Sample by reference position matrix of the samples' depths.
+
+    Parameters:
+    path - matrix directory - str
+    length - reference length - int
+
+    Functionality:
+        When the directory is first created, the .depth files already in
+        the directory beside it are added, so existing endpoints carry over.
+    """
+
+    def __init__(self, path: str = MATRIX_DIR, length: int = REF_LENGTH):
+        self.path = path
+        self.length = length
+        self.row_size = struct.calcsize(f"<{length}I")
+        new_matrix = not os.path.isdir(path)
+        os.makedirs(path, exist_ok=True)
+        accessions = os.path.join(path, "accessions.txt")
+        self.accessions = []
+        if os.path.isfile(accessions):
+            with open(accessions, "r", encoding="utf-8") as in_fh:
+                self.accessions = in_fh.read().splitlines()
+        self.rows = {acc: row for row, acc in enumerate(self.accessions)}
+        self.handles = {}
+        for name in ("accessions.txt", "depths.bin"):
+            with open(os.path.join(path, name), "ab"):
+                pass
+            self.handles[name] = open(  # pylint: disable=consider-using-with
+                os.path.join(path, name), "r+b"
+            )
+        endpoints = os.path.dirname(os.path.normpath(path)) or "."
+        if new_matrix:
+            for depth_file in sorted(glob.glob(os.path.join(endpoints, "*.depth"))):
+                self.add(os.path.basename(depth_file)[: -len(".depth")], depth_file)
+
+    def row(self, accession: str) -> int:
+        """
+        Returns the row of a sample, -1 if it isn't in the matrix
+        """
+
+        return self.rows.get(accession, -1)
+
+    def add(self, accession: str, depth_file: str) -> int:
+        """
+        Called to write a sample's depths to its row, adding the row if new
+
+        Parameters:
+        accession - sample accession - str
+        depth_file - the sample's .depth file - str
+
+        Returns the sample's row
+        """
+
+        depths = read_depth(depth_file, self.length)
+        if accession not in self.rows:
+            self.rows[accession] = len(self.accessions)
+            self.accessions.append(accession)
+            self.handles["accessions.txt"].seek(0, os.SEEK_END)
+            self.handles["accessions.txt"].write(f"{accession}\n".encode())
+        row = self.rows[accession]
+        self.handles["depths.bin"].seek(row * self.row_size)
+        self.handles["depths.bin"].write(struct.pack(f"<{self.length}I", *depths))
+        return row
+
+    def flush(self):
+        """
+        Called to write the matrix's files, the depths first so a stopped
+        run doesn't leave an accession without its row
+        """
+
+        self.handles["depths.bin"].flush()
+        self.handles["accessions.txt"].flush()
+
+    def load(self):
+        """
+        Called to memory map the matrix
+
+        Returns read only numpy uint32 array of the samples (rows, in the
+        order of accessions) by reference positions (columns) depths
+        """
+
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        self.flush()
+        rows = min(
+            len(self.accessions),
+            os.path.getsize(os.path.join(self.path, "depths.bin")) // self.row_size,
+        )
+        if not rows:
+            return numpy.zeros((0, self.length), "<u4")
+        return numpy.memmap(
+            os.path.join(self.path, "depths.bin"),
+            "<u4",
+            "r",
+            shape=(rows, self.length),
+        )
+
+    def depths(self, accession: str):
+        """
+        Returns numpy array of a sample's depths, None if it isn't in the
+        matrix
+        """
+
+        row = self.row(accession)
+        return None if row < 0 else self.load()[row]
+
+    def close(self):
+        """
+        Flushes and closes the matrix's files
+        """
+
+        self.flush()
+        for handle in self.handles.values():
+            handle.close()
+
+
+def add_depth_files(variant_files: list, redo: bool, path: str = MATRIX_DIR) -> int:
+    """
+    Called by aggregate_endpoints() to set the samples' rows of the depth
+    matrix from the .depth files written with their variant calls
+
+    Parameters:
+    variant_files - the samples' variants tsvs, endpoints/ACCESSION.tsv - list
+    redo - replace the rows of samples already in the matrix - bool
+    path - matrix directory - str
+
+    Returns the number of samples added
+    """
+
+    if not variant_files:
+        return 0
+    matrix = DepthMatrix(path)
+    added = 0
+    for file in variant_files:
+        depth_file = f"{os.path.splitext(file)[0]}.depth"
+        accession = os.path.basename(file).split(".")[0]
+        if os.path.isfile(depth_file) and (redo or matrix.row(accession) < 0):
+            matrix.add(accession, depth_file)
+            added += 1
+    matrix.close()
+    return added
+
+
+def main(argv=None) -> int:
+    """
+    Writes each sample's mean depth and breadth of coverage as a tsv
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("matrix", help="matrix directory, ie endpoints/depth_matrix")
+    parser.add_argument(
+        "-d",
+        "--min-depth",
+        type=int,
+        default=10,
+        help="depth a position needs to be covered",
+    )
+    args = parser.parse_args(argv)
+
+    matrix = DepthMatrix(args.matrix)
+    depths = matrix.load()
+    means = depths.mean(axis=1, dtype="f8")
+    breadths = (depths >= args.min_depth).mean(axis=1)
+    print("accession\tmean_depth\tbreadth")
+    for accession, mean, breadth in zip(matrix.accessions, means, breadths):
+        print(f"{accession}\t{mean:.2f}\t{breadth:.4f}")
+    matrix.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+This module has the downsampling used by the downsample rule in snakefile3
+to cap the read depth of very deep samples.  Read pairs are binned by the
+amplicon they come from, using the forward primers of the sample's primer
+bed, or by fixed windows of the reference for samples without known
+primers, and at most a target number of pairs are kept for each bin, in a
+single pass over the reads.  Pairs are kept by a seeded hash of their name,
+so the same pairs are kept on every run and both mates of a pair are kept
+together.
+
+Run from the downsample rule, ie
+    python downsample.py -b data/articv4.1.bed -t 2000 -s 1 sams/ACC.bam | \
+    samtools sort -o sams/ACC.ds.bam
+downsample_report() compares the variants and lineages of the downsampled
+reads with those of the full depth reads for the downsample_report rule.
+"""
+
+import argparse
+import bisect
+import hashlib
+import heapq
+import subprocess
+import sys
+
+PRIMER_CLUSTER = 50
+
+
+def amplicon_starts(bed_file: str) -> list:
+    """
+    Called to get the starts of the amplicons of a primer scheme
+
+    Parameters:
+    bed_file - primer bed with the primers' strands - str
+
+    Functionality:
+        The starts of the forward primers are sorted and alternate forward
+        primers starting within PRIMER_CLUSTER nts of each other are taken
+        as the same amplicon.
+
+    Returns sorted list of the amplicon start positions (0 based)
+    """
+
+    starts = []
+    with open(bed_file, "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 6 and fields[5] == "+":
+                starts.append(int(fields[1]))
+    amplicons = []
+    for start in sorted(starts):
+        if not amplicons or start - amplicons[-1] > PRIMER_CLUSTER:
+            amplicons.append(start)
+    return amplicons
+
+
+def template_bin(fields: list, amplicons: list, window: int) -> int:
+    """
+    Called to get the bin of the template (read pair) of a sam alignment,
+    the same for both mates.
+
+    Parameters:
+    fields - the alignment's sam fields - list
+    amplicons - amplicon starts from amplicon_starts(), empty for windows - list
+    window - width of the windows used without amplicons - int
+
+    Returns the index of the template's bin
+    """
+
+    start = int(fields[3]) - 1
+    if fields[6] == "=" and fields[7] != "0":
+        start = min(start, int(fields[7]) - 1)
+    if amplicons:
+        # reads start at, or just inside, the primer of their amplicon
+        return max(bisect.bisect_right(amplicons, start + PRIMER_CLUSTER) - 1, 0)
+    return start // window
+
+
+def template_hash(qname: str, seed: int) -> float:
+    """
+    Returns a number in [0, 1) fixed by the read name and seed
+    """
+
+    digest = hashlib.blake2b(f"{seed}:{qname}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / (1 << 64)
+
+
+def read_sam(bam: str):
+    """
+    Yields the lines of the bam as sam, with the header
+    """
+
+    with subprocess.Popen(
+        ["samtools", "view", "-h", bam], stdout=subprocess.PIPE, text=True
+    ) as view:
+        yield from view.stdout
+    if view.returncode:
+        raise subprocess.CalledProcessError(view.returncode, view.args)
+
+
+def downsample(lines, out_fh, target: int, **kwargs) -> tuple:
+    """
+    Called to write the alignments of the templates kept for each bin
+
+    Parameters:
+    lines - sam lines, with the header - iterable
+    out_fh - output for the kept sam lines - file handle
+    target - templates to keep for each bin - int
+    kwargs - amplicons, window and seed as for template_bin() and
+        template_hash()
+
+    Functionality:
+        The sam is read once.  Each bin keeps the target templates with the
+        lowest hashes seen so far in a heap, with their alignments, and a
+        template with a lower hash than the highest kept replaces it.  As
+        the highest kept hash only falls, the mates of a dropped template
+        are dropped too, and the templates kept don't depend on the order
+        of the sam.  The header is written as it's read and the kept
+        alignments once the sam is read, so at most the target templates
+        of each bin are held in memory.
+
+    Returns the number of alignments kept and the number of bins
+    """
+
+    heaps = {}
+    kept = {}
+    for line in lines:
+        if line.startswith("@"):
+            out_fh.write(line)
+            continue
+        fields = line.split("\t", 9)
+        if fields[0] in kept:
+            kept[fields[0]].append(line)
+            continue
+        heap = heaps.setdefault(
+            template_bin(fields, kwargs["amplicons"], kwargs["window"]), []
+        )
+        # the heap holds negated hashes so the highest kept is first
+        entry = (-template_hash(fields[0], kwargs["seed"]), fields[0])
+        if len(heap) < target:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            del kept[heapq.heapreplace(heap, entry)[1]]
+        else:
+            continue
+        kept[fields[0]] = [line]
+    alignments = 0
+    for template in kept.values():
+        out_fh.writelines(template)
+        alignments += len(template)
+    return alignments, len(heaps)
+
+
+def read_variant_freqs(tsv: str) -> dict:
+    """
+    Returns dict of the ALT_FREQ of each variant, (POS, REF, ALT), of an
+    ivar variants tsv
+    """
+
+    freqs = {}
+    with open(tsv, "r", encoding="utf-8") as in_fh:
+        header = in_fh.readline().rstrip("\n").split("\t")
+        for line in in_fh:
+            fields = dict(zip(header, line.rstrip("\n").split("\t")))
+            freqs.setdefault(
+                (int(fields["POS"]), fields["REF"], fields["ALT"]),
+                float(fields["ALT_FREQ"]),
+            )
+    return freqs
+
+
+def read_lineage_abundances(lineages: str) -> dict:
+    """
+    Returns dict of the abundance of each lineage in a freyja demix output
+    """
+
+    rows = {}
+    with open(lineages, "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 2:
+                rows[fields[0]] = fields[1].split()
+    return {
+        lineage: float(abundance)
+        for lineage, abundance in zip(
+            rows.get("lineages", []), rows.get("abundances", [])
+        )
+    }
+
+
+def write_changes(out_fh, kind: str, full_values: dict, ds_values: dict) -> float:
+    """
+    Called to write the change of each variant or lineage with downsampling
+
+    Parameters:
+    out_fh - report output - file handle
+    kind - variant or lineage - str
+    full_values - values of the full depth reads - dict
+    ds_values - values of the downsampled reads - dict
+
+    Functionality:
+        Variants are written in position order and lineages by their full
+        depth abundance.  Those found in only one of the runs are written
+        with 0 for the other.
+
+    Returns the largest change
+    """
+
+    largest = 0.0
+    names = sorted(set(full_values) | set(ds_values))
+    if kind == "lineage":
+        names.sort(key=lambda name: -full_values.get(name, 0.0))
+    for name in names:
+        change = ds_values.get(name, 0.0) - full_values.get(name, 0.0)
+        largest = max(largest, abs(change))
+        label = "".join(map(str, name)) if kind == "variant" else name
+        out_fh.write(
+            f"{kind}\t{label}\t{full_values.get(name, 0.0):g}\t"
+            f"{ds_values.get(name, 0.0):g}\t{change:+g}\n"
+        )
+    return largest
+
+
+def downsample_report(full: list, downsampled: list, report: str):
+    """
+    Called to write how a sample's variant frequencies and lineage
+    abundances changed with downsampling
+
+    Parameters:
+    full - variants tsv and lineages tsv of the full depth reads - list
+    downsampled - variants tsv and lineages tsv of the downsampled reads - list
+    report - output tsv - str
+
+    Functionality:
+        The changes of each kind are written by write_changes(), followed
+        by the largest change of the kind as a summary.
+
+    Returns nothing
+    """
+
+    with open(report, "w", encoding="utf-8") as out_fh:
+        out_fh.write("kind\tname\tfull_depth\tdownsampled\tchange\n")
+        for kind, read_values, full_file, ds_file in (
+            ("variant", read_variant_freqs, full[0], downsampled[0]),
+            ("lineage", read_lineage_abundances, full[1], downsampled[1]),
+        ):
+            largest = write_changes(
+                out_fh, kind, read_values(full_file), read_values(ds_file)
+            )
+            out_fh.write(f"max_change\t{kind}\t\t\t{largest:g}\n")
+
+
+def main(argv=None) -> int:
+    """
+    Downsamples a bam to sam on stdout
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("bam")
+    parser.add_argument("-b", "--bed", default="Unknown", help="primer bed")
+    parser.add_argument("-t", "--target", type=int, required=True)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-w", "--window", type=int, default=250)
+    args = parser.parse_args(argv)
+
+    amplicons = [] if args.bed.endswith("Unknown") else amplicon_starts(args.bed)
+    kept, bins = downsample(
+        read_sam(args.bam),
+        sys.stdout,
+        args.target,
+        amplicons=amplicons,
+        window=args.window,
+        seed=args.seed,
+    )
+    print(
+        f"kept {kept} alignments, at most {args.target} templates for each of "
+        f"{bins} {'amplicons' if amplicons else 'windows'}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+This module has the sample by mutation allele frequency matrix kept beside
+endpoints/VCs.tsv by aggregate_endpoints() in snakefunctions.py.  The matrix
+is a directory, endpoints/freq_matrix, of
+    samples.txt - the row dictionary, a sample accession per line
+    mutations.txt - the column dictionary, a mutation (ie A23063T) per line
+    cols.bin, freqs.bin - the entries' int32 columns and float32 ALT_FREQs
+    rows.bin - each row's (offset, count) int64 pair into the entries
+Accessions and mutations keep their row and column numbers once added.  A
+sample is written by appending its entries and pointing its row at them, so
+reprocessing a sample leaves its old entries dead until the matrix is
+compacted, after which the files are the matrix's CSR arrays.
+
+Writing only needs the standard library; numpy, and scipy for load(), are
+imported when the matrix is read, ie
+    matrix = FreqMatrix("endpoints/freq_matrix")
+    csr = matrix.load()
+    csr[matrix.row("SRR17866146"), matrix.column("A23063T")]
+
+Summarize or compact a matrix, ie
+    python freq_matrix.py endpoints/freq_matrix --compact
+"""
+
+import argparse
+import csv
+import os
+import struct
+import sys
+
+from aggregate_index import tsv_blocks
+
+MATRIX_DIR = "endpoints/freq_matrix"
+ROW = struct.Struct("<qq")
+FILES = ("samples.txt", "mutations.txt", "cols.bin", "freqs.bin", "rows.bin")
+
+
+class FreqMatrix:
+    """
+    Incrementally written sparse matrix of the samples' ALT_FREQ values.
+
+    Parameters:
+    path - matrix directory - str
+
+    Functionality:
+        When the directory is first created, the samples already in the
+        VCs.tsv beside it are added, so existing endpoints carry over.
+        Changes are flushed by close(), the rows last so a stopped run
+        leaves the rows pointing at complete entries.
+    """
+
+    def __init__(self, path: str = MATRIX_DIR):
+        self.path = path
+        new_matrix = not os.path.isdir(path)
+        os.makedirs(path, exist_ok=True)
+        self.samples = self.read_names("samples.txt")
+        self.mutations = self.read_names("mutations.txt")
+        self.sample_ids = {acc: row for row, acc in enumerate(self.samples)}
+        self.mutation_ids = {mut: col for col, mut in enumerate(self.mutations)}
+        self.handles = {}
+        self.open()
+        self.entries = min(
+            os.path.getsize(os.path.join(path, "cols.bin")) // 4,
+            os.path.getsize(os.path.join(path, "freqs.bin")) // 4,
+        )
+        vcs = os.path.join(os.path.dirname(os.path.normpath(path)) or ".", "VCs.tsv")
+        if new_matrix and os.path.isfile(vcs):
+            self.import_aggregate(vcs)
+
+    def open(self):
+        """
+        Called to open the matrix's files for writing
+        """
+
+        for name in FILES:
+            with open(os.path.join(self.path, name), "ab"):
+                pass
+            self.handles[name] = open(  # pylint: disable=consider-using-with
+                os.path.join(self.path, name), "r+b"
+            )
+
+    def read_names(self, name: str) -> list:
+        """
+        Returns the names of a dictionary file, in row or column order
+        """
+
+        file = os.path.join(self.path, name)
+        if not os.path.isfile(file):
+            return []
+        with open(file, "r", encoding="utf-8") as in_fh:
+            return in_fh.read().splitlines()
+
+    def new_name(self, name: str, names: list, ids: dict, file: str) -> int:
+        """
+        Returns the number of a name, appending it to its dictionary if new
+        """
+
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+            self.handles[file].seek(0, os.SEEK_END)
+            self.handles[file].write(f"{name}\n".encode())
+        return ids[name]
+
+    def row(self, accession: str) -> int:
+        """
+        Returns the row of a sample, -1 if it isn't in the matrix
+        """
+
+        return self.sample_ids.get(accession, -1)
+
+    def column(self, mutation: str) -> int:
+        """
+        Returns the column of a mutation, -1 if it isn't in the matrix
+        """
+
+        return self.mutation_ids.get(mutation, -1)
+
+    def add(self, accession: str, lines) -> int:
+        """
+        Called to set a sample's row to the frequencies of its variant calls
+
+        Parameters:
+        accession - sample accession - str
+        lines - lines of the sample's ivar variants tsv, with its header - iterable
+
+        Functionality:
+            Calls repeated for overlapping features are one entry.  The
+            sample's row and any new mutations' columns are appended to
+            the dictionaries.
+
+        Returns the number of entries in the sample's row
+        """
+
+        freqs = {}
+        for call in csv.DictReader(lines, delimiter="\t"):
+            if not call.get("POS") or call.get("ALT_FREQ") in (None, "", "NA"):
+                continue
+            col = self.new_name(
+                f"{call['REF']}{call['POS']}{call['ALT']}",
+                self.mutations,
+                self.mutation_ids,
+                "mutations.txt",
+            )
+            freqs[col] = float(call["ALT_FREQ"])
+        row = self.new_name(accession, self.samples, self.sample_ids, "samples.txt")
+        cols = sorted(freqs)
+        self.handles["cols.bin"].seek(self.entries * 4)
+        self.handles["cols.bin"].write(struct.pack(f"<{len(cols)}i", *cols))
+        self.handles["freqs.bin"].seek(self.entries * 4)
+        self.handles["freqs.bin"].write(
+            struct.pack(f"<{len(cols)}f", *(freqs[col] for col in cols))
+        )
+        rows = self.handles["rows.bin"]
+        rows.seek(row * ROW.size)
+        rows.write(ROW.pack(self.entries, len(freqs)))
+        self.entries += len(freqs)
+        return len(freqs)
+
+    def import_aggregate(self, vcs: str) -> int:
+        """
+        Called to add the samples of an aggregate VCs.tsv
+
+        Returns the number of samples added
+        """
+
+        with open(vcs, "rb") as in_fh:
+            data = in_fh.read()
+        samples = 0
+        for accession, offset, length in tsv_blocks(data):
+            self.add(accession, data[offset : offset + length].decode().split("\n")[1:])
+            samples += 1
+        return samples
+
+    def flush(self):
+        """
+        Called to write the matrix's files, the rows last
+        """
+
+        for name in FILES:
+            self.handles[name].flush()
+
+    def arrays(self) -> tuple:
+        """
+        Called to memory map the matrix's files
+
+        Returns the entries' column and frequency arrays and the rows'
+        (offset, count) array, rows without a written offset being empty
+        """
+
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        self.flush()
+        cols = numpy.zeros(0, "<i4")
+        freqs = numpy.zeros(0, "<f4")
+        if self.entries:
+            cols, freqs = (
+                numpy.memmap(
+                    os.path.join(self.path, name), dtype, "r", shape=self.entries
+                )
+                for name, dtype in (("cols.bin", "<i4"), ("freqs.bin", "<f4"))
+            )
+        rows = numpy.zeros((len(self.samples), 2), "<i8")
+        written = min(
+            len(self.samples),
+            os.path.getsize(os.path.join(self.path, "rows.bin")) // 16,
+        )
+        if written:
+            rows[:written] = numpy.memmap(
+                os.path.join(self.path, "rows.bin"), "<i8", "r", shape=(written, 2)
+            )
+        return cols, freqs, rows
+
+    def load(self):
+        """
+        Called to read the matrix
+
+        Returns scipy.sparse.csr_matrix of the samples (rows) by mutations
+        (columns) ALT_FREQ values.  A compacted matrix's columns and
+        frequencies are memory mapped rather than copied.
+        """
+
+        import numpy  # pylint: disable=import-outside-toplevel
+        from scipy import sparse  # pylint: disable=import-outside-toplevel
+
+        cols, freqs, rows = self.arrays()
+        indptr = numpy.zeros(len(rows) + 1, "<i8")
+        numpy.cumsum(rows[:, 1], out=indptr[1:])
+        if not numpy.array_equal(rows[:, 0], indptr[:-1]) or indptr[-1] != len(cols):
+            # gathers each row's entries from its offset
+            take = numpy.arange(indptr[-1]) + numpy.repeat(
+                rows[:, 0] - indptr[:-1], rows[:, 1]
+            )
+            cols, freqs = cols[take], freqs[take]
+        return sparse.csr_matrix(
+            (freqs, cols, indptr),
+            shape=(len(self.samples), len(self.mutations)),
+            copy=False,
+        )
+
+    def dead(self) -> int:
+        """
+        Returns the number of entries no row points at
+        """
+
+        return self.entries - int(self.arrays()[2][:, 1].sum())
+
+    def compact(self) -> int:
+        """
+        Called to rewrite the entries in row order without dead entries
+
+        Returns the number of entries removed
+        """
+
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        csr = self.load()
+        removed = self.entries - csr.nnz
+        counts = numpy.diff(csr.indptr)
+        arrays = {
+            "cols.bin": numpy.asarray(csr.indices, "<i4"),
+            "freqs.bin": numpy.asarray(csr.data, "<f4"),
+            "rows.bin": numpy.stack([csr.indptr[:-1], counts], axis=1).astype("<i8"),
+        }
+        for name, array in arrays.items():
+            file = os.path.join(self.path, name)
+            array.tofile(f"{file}.tmp")
+            self.handles[name].close()
+            os.replace(f"{file}.tmp", file)
+        self.open()
+        self.entries = csr.nnz
+        return removed
+
+    def close(self):
+        """
+        Flushes and closes the matrix's files
+        """
+
+        self.flush()
+        for handle in self.handles.values():
+            handle.close()
+
+
+def main(argv=None) -> int:
+    """
+    Prints the size of a matrix, compacting it if asked
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("matrix", help="matrix directory, ie endpoints/freq_matrix")
+    parser.add_argument(
+        "--compact", action="store_true", help="remove reprocessed samples' old entries"
+    )
+    args = parser.parse_args(argv)
+
+    matrix = FreqMatrix(args.matrix)
+    if args.compact:
+        print(f"{args.matrix}: removed {matrix.compact()} entries")
+    print(
+        f"{len(matrix.samples)} samples x {len(matrix.mutations)} mutations, "
+        f"{matrix.entries} entries, {matrix.dead()} dead"
+    )
+    matrix.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
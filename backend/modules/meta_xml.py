@@ -0,0 +1,220 @@
+"""
+This module has the functions used by parse_xml_meta() to read the metadata
+xml of a query in chunks that can be fed to expat, so the xml is never held
+in memory at once, and to parse ranges of whole experiment packages of large
+xmls in a process pool.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+PACKAGE_RE = re.compile(rb"<EXPERIMENT_PACKAGE[\s>/]")
+# xml before the first package, the root's closing tag and the (start, end)
+# offsets of each range of packages, with the bytes parsed at a time
+XmlShards = namedtuple(
+    "XmlShards", ["xml_file", "prefix", "root_end", "offsets", "chunk_size"]
+)
+# function parsing the chunks of a range in the pool's processes
+_worker = {}
+
+
+def read_xml_chunks(xml_fh, chunk_size: int, end: int = -1):
+    """
+    Generator to read an xml file in chunks that can be fed to expat
+    without splitting the character data of an element between chunks.
+
+    Parameters:
+    xml_fh - xml file opened in binary mode - file object
+    chunk_size - number of bytes to read at a time - int
+    end - file offset to stop reading at, -1 reads to the end - int
+
+    Functionality:
+        Reads the file in blocks of chunk_size into a buffer and yields the
+        buffer up to the last "<" within its first chunk_size bytes, until
+        only the text after the last "<" is left for the next block.  As "<"
+        can't be in character data, text is never split and expat calls the
+        data handler with the same strings as when the whole file is parsed
+        at once.  pyexpat passes at most 1 MiB to expat at a time, splitting
+        longer strings wherever that falls, so chunks are only longer than
+        chunk_size when a single element's text is.
+
+    Yields bytes chunks of the xml
+    """
+
+    buffer = bytearray()
+    while True:
+        read_size = chunk_size
+        if end >= 0:
+            read_size = max(0, min(read_size, end - xml_fh.tell()))
+        block = xml_fh.read(read_size)
+        if not block:
+            if buffer:
+                yield bytes(buffer)
+            return
+        buffer += block
+        while True:
+            cut = buffer.rfind(b"<", 1, chunk_size)
+            if cut < 0 and len(buffer) > chunk_size:
+                # the text of an element is longer than chunk_size
+                cut = buffer.find(b"<", chunk_size)
+            if cut < 0:
+                break
+            yield bytes(buffer[:cut])
+            # deleting from the front of a bytearray doesn't copy the rest
+            del buffer[:cut]
+
+
+def next_package(xml_fh, offset: int, size: int, chunk_size: int) -> int:
+    """
+    Returns the offset of the first experiment package start tag at or after
+    offset, or size if there isn't one
+    """
+
+    while offset < size:
+        xml_fh.seek(offset)
+        block = xml_fh.read(chunk_size + 32)
+        found = PACKAGE_RE.search(block)
+        if found:
+            return offset + found.start()
+        offset += chunk_size
+    return size
+
+
+def find_xml_shards(xml_file: str, shards: int, chunk_size: int):
+    """
+    Called to split a metadata xml into byte ranges of whole experiment
+    packages that can be parsed independently.
+
+    Parameters:
+    xml_file - metadata xml file - str
+    shards - number of ranges to aim for - int
+    chunk_size - bytes read at a time when searching for packages - int
+
+    Functionality:
+        Finds the xml up to the first EXPERIMENT_PACKAGE, which holds the
+        root element, and the end of the root element.  The packages in
+        between are split into ranges of roughly equal size, each starting at
+        an EXPERIMENT_PACKAGE start tag.
+
+    Returns the XmlShards of the xml, or None if no packages are found
+    """
+
+    size = os.path.getsize(xml_file)
+    with open(xml_file, "rb") as xml_fh:
+        first = next_package(xml_fh, 0, size, chunk_size)
+        if first >= size:
+            return None
+        xml_fh.seek(0)
+        prefix = xml_fh.read(first)
+        root = re.search(rb"<([^?!/\s>]+)[^>]*>", prefix)
+        if not root:
+            return None
+        root_end = b"</" + root.group(1) + b">"
+        xml_fh.seek(max(first, size - chunk_size))
+        tail = xml_fh.read()
+        if tail.rfind(root_end) < 0:
+            return None
+        last = size - len(tail) + tail.rfind(root_end)
+        starts = [first]
+        for shard in range(1, shards):
+            start = next_package(
+                xml_fh, first + (last - first) * shard // shards, size, chunk_size
+            )
+            if starts[-1] < start < last:
+                starts.append(start)
+    return XmlShards(
+        xml_file, prefix, root_end, list(zip(starts, starts[1:] + [last])), chunk_size
+    )
+
+
+def set_worker_parser(parse_chunks) -> None:
+    """
+    Called when each process of the pool starts to keep the function that
+    parses the chunks of a range.  The pool's processes are forked, so the
+    function is inherited rather than pickled.
+    """
+
+    _worker["parse_chunks"] = parse_chunks
+
+
+def parse_xml_shard(shards: XmlShards, shard: int, out_base: str) -> str:
+    """
+    Called by the process pool of merge_xml_shards() to parse one range of
+    the metadata xml.
+
+    Parameters:
+    shards - ranges of the xml from find_xml_shards() - XmlShards
+    shard - index of the range to parse - int
+    out_base - path and prefix of the txt and tsv fragments to write - str
+
+    Functionality:
+        The packages are wrapped in the root element of the xml so that the
+        parsed element depths and outputs are the same as the serial parse.
+
+    Returns out_base
+    """
+
+    def chunks():
+        yield shards.prefix
+        with open(shards.xml_file, "rb") as xml_fh:
+            xml_fh.seek(shards.offsets[shard][0])
+            yield from read_xml_chunks(
+                xml_fh, shards.chunk_size, shards.offsets[shard][1]
+            )
+        yield shards.root_end
+
+    with open(
+        f"{out_base}.txt", "w", encoding="utf-8", buffering=shards.chunk_size
+    ) as out_fh:
+        with open(
+            f"{out_base}.tsv", "w", encoding="utf-8", buffering=shards.chunk_size
+        ) as lite_out_fh:
+            _worker["parse_chunks"](chunks(), out_fh, lite_out_fh)
+    return out_base
+
+
+def merge_xml_shards(shards: XmlShards, parse_chunks, cores: int, out_fhs) -> int:
+    """
+    Called to parse the ranges of a metadata xml in a process pool and join
+    the outputs.
+
+    Parameters:
+    shards - ranges of the xml from find_xml_shards() - XmlShards
+    parse_chunks - function parsing xml chunks into the txt and tsv files,
+        parse_xml_chunks() - function
+    cores - number of processes to parse with - int
+    out_fhs - files to write out all and select metadata - tuple
+
+    Functionality:
+        Each range is parsed into temporary txt and tsv fragments, which are
+        copied to the output files in the order of the ranges in the xml
+
+    Returns 0 if no exceptions were raised
+    """
+
+    with tempfile.TemporaryDirectory(dir=".") as shard_dir:
+        with ProcessPoolExecutor(
+            max_workers=cores,
+            mp_context=get_context("fork"),
+            initializer=set_worker_parser,
+            initargs=(parse_chunks,),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    parse_xml_shard, shards, shard, os.path.join(shard_dir, str(shard))
+                )
+                for shard in range(len(shards.offsets))
+            ]
+            for future in futures:
+                out_base = future.result()
+                for fragment, fragment_fh in zip(
+                    (f"{out_base}.txt", f"{out_base}.tsv"), out_fhs
+                ):
+                    with open(fragment, "r", encoding="utf-8", newline="") as in_fh:
+                        shutil.copyfileobj(in_fh, fragment_fh, shards.chunk_size)
+    return 0
@@ -0,0 +1,18 @@
+# Passes on the mated reads of an interleaved fastq stream, as written by
+# fasterq-dump --split-spot, dropping reads without a mate so the stream
+# stays interleaved.  Mates are consecutive reads with the same name.
+# Used by the stream_reads rule in snakefile2.
+
+NR % 4 == 1 { name = $1 }
+{ rec[NR % 4] = $0 }
+NR % 4 == 0 {
+    if (held && name == held_name) {
+        printf "%s\n%s\n%s\n%s\n", held_rec[1], held_rec[2], held_rec[3], held_rec[0]
+        printf "%s\n%s\n%s\n%s\n", rec[1], rec[2], rec[3], rec[0]
+        held = 0
+    } else {
+        for (line in rec) held_rec[line] = rec[line]
+        held_name = name
+        held = 1
+    }
+}
@@ -0,0 +1,261 @@
+"""
+This module detects the primer scheme of samples whose metadata doesn't
+name their primers, from where their mapped reads start and end.  Reads of
+amplicon sequencing start and end at the primers of their amplicons, so
+the 5' ends of a sample of the mapped reads are looked up in an index of
+the primer positions of all the schemes in data/*.bed and the scheme
+matching the most reads is taken, if it matches enough of them.
+
+Used by detect_primer_beds() from snakefile3, or run on its own, ie
+    python primer_detect.py -o 25 sams/ACCESSION.sam
+prints the detected bed, or Unknown.
+"""
+
+import argparse
+import glob
+import os
+import re
+import subprocess
+import sys
+
+CIGAR_RE = re.compile(r"(\d+)([MIDNSHP=X])")
+REFERENCE = ("NC_045512.2", 29903)
+
+
+class PrimerSchemeIndex:
+    """
+    Index of the primer positions of several primer schemes.
+
+    Parameters:
+    beds - primer bed files, with the primers' strands - list
+    tolerance - nts a read's end may be from a primer's and still match - int
+
+    Functionality:
+        The starts of the forward primers and ends of the reverse primers of
+        each bed, widened by the tolerance, are indexed by position to the
+        beds that have a primer there, so each read is matched against all
+        the schemes with two lookups.
+    """
+
+    def __init__(self, beds: list, tolerance: int = 3):
+        self.beds = list(beds)
+        self.primers = [0] * len(self.beds)
+        self.index = {"+": {}, "-": {}}
+        for bed_idx, bed in enumerate(self.beds):
+            with open(bed, "r", encoding="utf-8") as in_fh:
+                for line in in_fh:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) < 6 or fields[5] not in self.index:
+                        continue
+                    self.primers[bed_idx] += 1
+                    pos = int(fields[1]) if fields[5] == "+" else int(fields[2])
+                    for near in range(pos - tolerance, pos + tolerance + 1):
+                        self.index[fields[5]].setdefault(near, set()).add(bed_idx)
+
+    def score(self, ends, offset: int = 0) -> tuple:
+        """
+        Called to count the reads matching each scheme
+
+        Parameters:
+        ends - strand and 5' end position of reads - iterable of tuples
+        offset - nts trimmed from the 5' end of the reads before mapping - int
+
+        Returns tuple of a list of the reads matched by each bed and the
+        number of reads
+        """
+
+        matches = [0] * len(self.beds)
+        reads = 0
+        for strand, pos in ends:
+            reads += 1
+            pos = pos - offset if strand == "+" else pos + offset
+            for bed_idx in self.index[strand].get(pos, ()):
+                matches[bed_idx] += 1
+        return matches, reads
+
+    def detect(self, ends, offset: int = 0, min_fraction: float = 0.5) -> str:
+        """
+        Called to find the scheme of a sample's reads
+
+        Parameters:
+        ends - strand and 5' end position of reads - iterable of tuples
+        offset - nts trimmed from the 5' end of the reads before mapping - int
+        min_fraction - fraction of the reads the scheme has to match - float
+
+        Functionality:
+            Of schemes matching the same reads, the one with fewer primers is
+            taken as the closer match.
+
+        Returns the bed of the best matching scheme, or Unknown
+        """
+
+        matches, reads = self.score(ends, offset)
+        if not reads or not self.beds:
+            return "Unknown"
+        best = max(
+            range(len(self.beds)), key=lambda idx: (matches[idx], -self.primers[idx])
+        )
+        if matches[best] < min_fraction * reads:
+            return "Unknown"
+        return self.beds[best]
+
+
+def alignment_end(fields: list):
+    """
+    Returns the strand and 5' end (0 based, soft clips included) of the read
+    of a primary sam alignment, None if unmapped
+    """
+
+    flag = int(fields[1])
+    if flag & 0x904 or fields[5] == "*":
+        return None
+    cigar = CIGAR_RE.findall(fields[5])
+    if not flag & 0x10:
+        clipped = int(cigar[0][0]) if cigar[0][1] == "S" else 0
+        return "+", int(fields[3]) - 1 - clipped
+    end = int(fields[3]) - 1
+    for length, op in cigar:
+        if op in "MDN=X":
+            end += int(length)
+    if cigar[-1][1] == "S":
+        end += int(cigar[-1][0])
+    return "-", end
+
+
+def read_ends(mapped: str, limit: int = 2000, regions: int = 10):
+    """
+    Called to get the 5' ends of a sample's mapped reads
+
+    Parameters:
+    mapped - sam, or coordinate sorted and indexed bam, of the sample - str
+    limit - reads to return - int
+    regions - for bams, the reads are taken evenly from this many regions of
+        the reference, as the first reads of a sorted bam all start at the
+        beginning of the reference - int
+
+    Returns list of (strand, position) tuples
+    """
+
+    ends = []
+    if mapped.endswith(".sam"):
+        with open(mapped, "r", encoding="utf-8") as in_fh:
+            for line in in_fh:
+                if line.startswith("@"):
+                    continue
+                end = alignment_end(line.split("\t", 6))
+                if end:
+                    ends.append(end)
+                    if len(ends) >= limit:
+                        break
+        return ends
+    name, length = REFERENCE
+    step = length // regions
+    for start in range(0, length, step):
+        region = []
+        with subprocess.Popen(
+            ["samtools", "view", mapped, f"{name}:{start + 1}-{start + step}"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ) as view:
+            for line in view.stdout:
+                end = alignment_end(line.split("\t", 6))
+                # reads overlapping the region from before it were counted
+                if end and int(line.split("\t", 4)[3]) > start:
+                    region.append(end)
+                    if len(region) >= limit // regions:
+                        break
+            view.kill()
+        ends.extend(region)
+    return ends
+
+
+def bed_files(data_dir: str) -> list:
+    """
+    Returns the sorted primer beds of the data directory
+    """
+
+    return sorted(glob.glob(os.path.join(data_dir, "*.bed")))
+
+
+def detect_primer_beds(sample_accs: dict, data_dir: str, **kwargs) -> int:
+    """
+    Called by snakefile3 to detect the primers of the samples whose metadata
+    didn't name them from their mapped reads.
+
+    Parameters:
+    sample_accs - the accessions with primer trimming instructions from
+        get_sample_acc2 - dict
+    data_dir - directory of the primer beds - str
+    reads - mapped reads of each sample to check, 0 to not detect - int
+    min_fraction - fraction of the reads a scheme has to match - float
+    offset - nts fastp trimmed from the 5' end of the reads - int
+
+    Functionality:
+        The 5' ends of the first mapped reads of each sample with an Unknown
+        bed, or reads from across the reference for bams, are matched
+        against the primers of all the beds in data_dir.  The samples' beds
+        are updated in place, so their primers are trimmed by ivar.  This
+        runs as the snakefile is parsed, outside the rules' conda
+        environments, so if samtools isn't found the samples with only a
+        bam are left Unknown.
+
+    Returns the number of samples whose primers were detected
+    """
+
+    unknown = [acc for acc, info in sample_accs.items() if info["bed"] == "Unknown"]
+    if not kwargs["reads"] or not unknown:
+        return 0
+    index = PrimerSchemeIndex(bed_files(data_dir))
+    detected = 0
+    samtools = True
+    for acc in unknown:
+        mapped = f"sams/{acc}.sam"
+        if not os.path.isfile(mapped):
+            mapped = f"sams/{acc}.bam"
+            if not samtools or not os.path.isfile(f"{mapped}.bai"):
+                continue
+        try:
+            ends = read_ends(mapped, kwargs["reads"])
+        except FileNotFoundError:
+            print("samtools not found, primers aren't detected from bams")
+            samtools = False
+            continue
+        bed = index.detect(ends, kwargs["offset"], kwargs["min_fraction"])
+        if bed != "Unknown":
+            sample_accs[acc]["bed"] = os.path.join("data", os.path.basename(bed))
+            detected += 1
+    print(
+        f"primers detected for {detected} of {len(unknown)} samples without known primers"
+    )
+    return detected
+
+
+def main(argv=None) -> int:
+    """
+    Prints the detected bed of a sample
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("mapped", help="sam or sorted and indexed bam")
+    parser.add_argument(
+        "-d",
+        "--data",
+        default=os.path.join(os.path.dirname(os.path.realpath(__file__)), "../data"),
+    )
+    parser.add_argument("-n", "--reads", type=int, default=2000)
+    parser.add_argument("-o", "--offset", type=int, default=0)
+    parser.add_argument("-f", "--min-fraction", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    index = PrimerSchemeIndex(bed_files(args.data))
+    print(
+        index.detect(read_ends(args.mapped, args.reads), args.offset, args.min_fraction)
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+This module has the compiled keyword matcher used by get_primer_bed() to
+find the primers or primer bed of a sample from its metadata strings.
+"""
+
+import json
+import re
+
+
+class PrimerMatcher:
+    """
+    Compiled form of a keyword mapping json used to find the primers or
+    primer bed for a sample.
+
+    NOTE: The matching rules are the same as the original get_primer_bed():
+    at each level of the mapping the keys are checked in order and only the
+    first key found is used.  If a level has an "Other" key, only the first key
+    of that level is checked before falling back to "Other".
+
+    Parameters:
+    mapping_file - json file that contains the matching information - str
+
+    Functionality:
+        The json is loaded once and each level of the nested dicts is compiled
+        into a tuple of the keys to test and the fallback value.  All keywords
+        are also combined into a single regex so that strings without any
+        keyword, the vast majority of the xml data, are resolved with one scan.
+        Results are cached by string, as the same data strings are repeated
+        across many samples.
+    """
+
+    cache_size = 65536
+    _loaded = {}
+
+    def __init__(self, mapping_file: str):
+        with open(mapping_file, "r", encoding="utf-8") as _primer_map_json:
+            self.mapping = json.load(_primer_map_json)
+        keywords = set()
+        self.root = self._compile(self.mapping, keywords)
+        self.keyword_re = None
+        if keywords and "" not in keywords:
+            self.keyword_re = re.compile(
+                "|".join(
+                    re.escape(keyword)
+                    for keyword in sorted(keywords, key=len, reverse=True)
+                )
+            )
+        self.cache = {}
+
+    def _compile(self, matching_dict: dict, keywords: set) -> tuple:
+        """
+        Compiles a level of the mapping into a tuple of (key, value) pairs to
+        test in order and the value to use if none of them are found
+        """
+
+        tests = []
+        for key, value in matching_dict.items():
+            keywords.add(key)
+            if isinstance(value, dict):
+                value = self._compile(value, keywords)
+            elif not isinstance(value, str):
+                value = None
+            tests.append((key, value))
+            if "Other" in matching_dict:
+                # Only the first key is checked before falling back to Other
+                return (tuple(tests), matching_dict["Other"])
+        return (tuple(tests), "Unknown")
+
+    def _walk(self, primers_str: str) -> str:
+        """
+        Walks the compiled levels for the passed string
+        """
+
+        tests, fallback = self.root
+        while True:
+            for key, value in tests:
+                if key in primers_str:
+                    if isinstance(value, tuple):
+                        tests, fallback = value
+                        break
+                    if value is None:
+                        return "Unknown"
+                    return value
+            else:
+                return fallback
+
+    def match(self, primers_str: str) -> str:
+        """
+        Returns the bed file or primer keyword for the passed string
+        """
+
+        try:
+            return self.cache[primers_str]
+        except KeyError:
+            pass
+        if self.keyword_re is not None and not self.keyword_re.search(primers_str):
+            bed = self.root[1]
+        else:
+            bed = self._walk(primers_str)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[primers_str] = bed
+        return bed
+
+    @classmethod
+    def load(cls, mapping_file: str):
+        """
+        Returns the matcher for the mapping json, which is only loaded and
+        compiled the first time it's asked for in a process
+        """
+
+        try:
+            return cls._loaded[mapping_file]
+        except KeyError:
+            matcher = cls(mapping_file)
+            cls._loaded[mapping_file] = matcher
+            return matcher
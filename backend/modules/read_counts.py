@@ -0,0 +1,86 @@
+"""
+This module has the read counters used by qc_pass() to decide which samples
+have enough reads to continue, from the mapped sams, the bam indexes or the
+fastp qc jsons.  Files are streamed or only their summaries read, so memory
+use is constant however large the samples are.
+"""
+
+import json
+import os
+import struct
+
+
+def count_mapped_reads(sam: str, limit: int = 0) -> int:
+    """
+    Called to count the mapped alignments of a sam file
+
+    Parameters:
+    sam - sam file - str
+    limit - count to stop at, 0 to count all - int
+
+    Functionality:
+        Streams through the sam in binary, so memory use is constant and
+        only the flags are decoded, stopping once the limit is reached.
+        Records flagged unmapped (4), ie the unmapped mates minimap2 keeps
+        with --sam-hit-only, aren't counted, so the count matches the
+        mapped reads of the bam index.
+
+    Returns the count, which is the limit if the sam has as many alignments
+    """
+
+    reads = 0
+    with open(sam, "rb") as sam_file:
+        for line in sam_file:
+            if not line.startswith(b"@") and not int(line.split(b"\t", 2)[1]) & 4:
+                reads += 1
+                if reads == limit:
+                    break
+    return reads
+
+
+def bai_mapped_reads(bai: str) -> int:
+    """
+    Called to get the number of mapped reads of a bam from its index
+
+    Parameters:
+    bai - index of the bam, as written by samtools index - str
+
+    Functionality:
+        Reads the mapped read counts that samtools keeps in the pseudo bin
+        (37450) of each reference in the index, as used by samtools idxstats
+
+    Returns the number of mapped reads
+    """
+
+    mapped = 0
+    with open(bai, "rb") as bai_fh:
+        if bai_fh.read(4) != b"BAI\1":
+            raise ValueError(f"{bai} is not a bam index")
+        (n_ref,) = struct.unpack("<i", bai_fh.read(4))
+        for _ in range(n_ref):
+            (n_bin,) = struct.unpack("<i", bai_fh.read(4))
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack("<Ii", bai_fh.read(8))
+                chunks = bai_fh.read(16 * n_chunk)
+                if bin_id == 37450 and n_chunk == 2:
+                    mapped += struct.unpack_from("<Q", chunks, 16)[0]
+            (n_intv,) = struct.unpack("<i", bai_fh.read(4))
+            bai_fh.seek(8 * n_intv, 1)
+    return mapped
+
+
+def fastp_passed_reads(acc: str):
+    """
+    Called to get the number of reads of a sample that passed fastp's
+    filtering from its qc jsons
+
+    Returns the number of reads, None if the sample has no qc json
+    """
+
+    passed = None
+    for json_file in (f"fastqs/{acc}.se.json", f"fastqs/{acc}.pe.json"):
+        if os.path.isfile(json_file):
+            with open(json_file, "r", encoding="utf-8") as in_fh:
+                summary = json.load(in_fh)["summary"]
+            passed = (passed or 0) + summary["after_filtering"]["total_reads"]
+    return passed
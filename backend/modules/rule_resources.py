@@ -0,0 +1,73 @@
+"""
+This module has the functions the snakefiles use to size the threads and
+memory of the processing rules' jobs from the config.yaml rule_resources and
+the samples' run sizes, so snakemake can pack big and small samples onto the
+cores and memory it's given.
+"""
+
+import math
+
+
+def rule_threads(rule_name: str, sra_acc: str, run_sizes: dict, settings: dict) -> int:
+    """
+    Called by the rules to get the threads for a sample, so big samples get
+    many threads and small samples can be run many at once.
+
+    Parameters:
+    rule_name - name of the rule - str
+    sra_acc - accession of the sample - str
+    run_sizes - size in MB of the runs from get_run_sizes() - dict
+    settings - the config.yaml rule_resources - dict
+
+    Functionality:
+        A thread is given for each MB_per_thread of the sample's run size,
+        up to the rule's max_threads.  Samples without a size in the run info
+        get the rule's max_threads.
+
+    Returns the number of threads
+    """
+
+    max_threads = max(settings["max_threads"].get(rule_name, 1), 1)
+    if sra_acc not in run_sizes:
+        return max_threads
+    return min(
+        max(math.ceil(run_sizes[sra_acc] / settings["MB_per_thread"]), 1),
+        max_threads,
+    )
+
+
+def rule_mem_mb(
+    rule_name: str, threads: int, settings: dict, sra_acc: str = "", run_sizes=None
+) -> int:
+    """
+    Called by the rules to get the memory in MB to reserve for a sample
+
+    Parameters:
+    rule_name - name of the rule - str
+    threads - threads of the sample's job - int
+    settings - the config.yaml rule_resources - dict
+    sra_acc - accession of the sample, empty for jobs of many samples - str
+    run_sizes - size in MB of the runs from get_run_sizes() - dict
+
+    Functionality:
+        The rule's mem_mb_per_GB is added for each GB of the sample's run
+        size, so rules held to a thread still get memory for big samples.
+        Samples without a size in the run info are taken to be as big as
+        the rule's max_threads are given for.
+
+    Returns the rule's mem_mb plus its mem_mb_per_thread for each thread and
+    its mem_mb_per_GB for each GB of the sample's run
+    """
+
+    mem_mb = settings["mem_mb"].get(rule_name, 1000) + threads * settings[
+        "mem_mb_per_thread"
+    ].get(rule_name, 0)
+    per_gb = settings.get("mem_mb_per_GB", {}).get(rule_name, 0)
+    if per_gb and sra_acc:
+        size = (run_sizes or {}).get(
+            sra_acc,
+            max(settings["max_threads"].get(rule_name, 1), 1)
+            * settings["MB_per_thread"],
+        )
+        mem_mb += math.ceil(size / 1000 * per_gb)
+    return mem_mb
@@ -0,0 +1,189 @@
+"""
+This module has the persistent catalog of SRA runs used for incremental
+queries.  The catalog is a SQLite database in the working directory holding
+each run's load date and experiment, the metadata collected for each
+experiment by parse_xml_meta(), and the runs and time each query was last
+seen.
+"""
+
+import csv
+import sqlite3
+import time
+
+CATALOG_FILE = "sra_catalog.sqlite"
+COLLECT_HEADER = "Accession\tcollectiong data\tgeo_loc\tprimers\n"
+
+
+class RunCatalog:
+    """
+    Catalog of previously seen runs and their collected metadata.
+
+    Parameters:
+    path - SQLite database file - str
+
+    Functionality:
+        Runs are keyed by accession with the LoadDate of the run info so
+        runs that are reloaded by SRA can be found.  The sra_meta_collect tsv
+        has a row for each experiment package, named for its last run, so the
+        rows are kept by experiment and a new run of an experiment replaces
+        the experiment's row rather than adding another.
+    """
+
+    def __init__(self, path: str = CATALOG_FILE):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                accession TEXT PRIMARY KEY,
+                load_date TEXT,
+                experiment TEXT
+            );
+            CREATE TABLE IF NOT EXISTS experiments (
+                experiment TEXT PRIMARY KEY,
+                collect_row TEXT
+            );
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                last_seen REAL,
+                date_stamp TEXT
+            );
+            CREATE TABLE IF NOT EXISTS query_runs (
+                query TEXT,
+                accession TEXT,
+                position INTEGER,
+                PRIMARY KEY (query, accession)
+            );
+            """
+        )
+
+    def changed_runs(self, runs: dict) -> list:
+        """
+        Called to find the runs that are new or have a different load date
+        than when last seen.
+
+        Parameters:
+        runs - load date and experiment of each run accession - dict
+
+        Returns list of the new or updated accessions
+        """
+
+        seen = dict(self.conn.execute("SELECT accession, load_date FROM runs"))
+        return [
+            acc
+            for acc, (load_date, _) in runs.items()
+            if acc not in seen or seen[acc] != load_date
+        ]
+
+    def update(self, query: str, date_stamp: str, runs: dict, collect_tsv: str):
+        """
+        Called to record the runs of a query and the metadata parsed for the
+        new and updated runs.
+
+        Parameters:
+        query - string for the query - str
+        date_stamp - timestamp of current query - str
+        runs - load date and experiment of each run accession of the query - dict
+        collect_tsv - sra_meta_collect tsv of the parsed runs - str
+
+        Returns 0 if successful
+        """
+
+        with open(collect_tsv, "r", encoding="utf-8") as in_fh:
+            rows = {
+                line.split("\t")[0]: line
+                for line in in_fh.read().split("\n")[1:]
+                if line.strip()
+            }
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO runs (accession, load_date, experiment) "
+                "VALUES (?, ?, ?)",
+                [(acc, *values) for acc, values in runs.items()],
+            )
+            # runs missing from the run info are kept as their own experiment
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO experiments (experiment, collect_row) "
+                "VALUES (?, ?)",
+                [(runs.get(acc, (None, acc))[1], row) for acc, row in rows.items()],
+            )
+            self.conn.execute("DELETE FROM query_runs WHERE query = ?", (query,))
+            self.conn.executemany(
+                "INSERT INTO query_runs (query, accession, position) VALUES (?, ?, ?)",
+                [(query, acc, position) for position, acc in enumerate(runs)],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO queries (query, last_seen, date_stamp) "
+                "VALUES (?, ?, ?)",
+                (query, time.time(), str(date_stamp)),
+            )
+        return 0
+
+    def last_seen(self, query: str):
+        """
+        Returns the time the query was last run, None if it hasn't been
+        """
+
+        row = self.conn.execute(
+            "SELECT last_seen FROM queries WHERE query = ?", (query,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def write_collect(self, query: str, path: str) -> int:
+        """
+        Called to write the sra_meta_collect tsv for all the runs of a query
+        from the catalog, a row for each experiment in the order of the
+        query's run info.
+
+        Parameters:
+        query - string for the query - str
+        path - tsv file to write - str
+
+        Returns the number of rows written
+        """
+
+        written = 0
+        with open(path, "w", encoding="utf-8") as out_fh:
+            out_fh.write(COLLECT_HEADER)
+            for (row,) in self.conn.execute(
+                "SELECT experiments.collect_row FROM query_runs JOIN runs "
+                "ON runs.accession = query_runs.accession JOIN experiments "
+                "ON experiments.experiment = runs.experiment "
+                "WHERE query_runs.query = ? GROUP BY experiments.experiment "
+                "ORDER BY MIN(query_runs.position)",
+                (query,),
+            ):
+                out_fh.write(row)
+                out_fh.write("\n")
+                written += 1
+        return written
+
+    def close(self):
+        """
+        Closes the database
+        """
+
+        self.conn.close()
+
+
+def read_runs(runinfo_csv: str) -> dict:
+    """
+    Called to read the run accessions, load dates and experiments from a run
+    info csv
+
+    Parameters:
+    runinfo_csv - sra_data csv downloaded for the query - str
+
+    Returns dict of the load date, or release date if there isn't one, and the
+    experiment, or the run if there isn't one, of each run accession in the
+    csv's order
+    """
+
+    runs = {}
+    with open(runinfo_csv, "r", encoding="utf-8", newline="") as in_fh:
+        for row in csv.DictReader(in_fh):
+            if row.get("Run") and row["Run"] != "Run":
+                runs[row["Run"]] = (
+                    row.get("LoadDate") or row.get("ReleaseDate"),
+                    row.get("Experiment") or row["Run"],
+                )
+    return runs
@@ -0,0 +1,184 @@
+"""
+This module has the sample state store used by the snakefiles to find which
+samples have been downloaded and processed without scanning the working
+directory.  The store is a SQLite database in the working directory holding
+the furthest stage each sample accession has reached.
+"""
+
+import os
+import sqlite3
+import time
+
+STORE_FILE = "sample_state.sqlite"
+STAGES = ("queried", "downloaded", "fastq", "qc", "mapped", "endpoints")
+# the files showing a sample has reached a stage, furthest stage first
+STAGE_FILES = (
+    ("mapped", ("sams/{acc}.sam", "sams/{acc}.bam")),
+    ("qc", ("fastqs/{acc}.se.json", "fastqs/{acc}.pe.json")),
+    ("fastq", ("fastqs/{acc}.fq.done",)),
+    ("downloaded", ("SRAs/{acc}/{acc}.sra",)),
+)
+
+
+class SampleStore:
+    """
+    Indexed store of the processing stage of each sample.
+
+    Parameters:
+    path - SQLite database file - str
+
+    Functionality:
+        Each accession has the furthest of the STAGES it has reached, whether
+        prefetch found no data for it, whether its sra file is in SRAs/ and,
+        once mapped, its number of mapped reads.  Stages only move forward.
+        The files of a sample are only checked the first time it's seen and
+        when a run that processed it finishes, so existing working
+        directories carry over without listing them.
+    """
+
+    def __init__(self, path: str = STORE_FILE):
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS samples (
+                accession TEXT PRIMARY KEY,
+                stage INTEGER NOT NULL,
+                no_data INTEGER NOT NULL DEFAULT 0,
+                sra INTEGER NOT NULL DEFAULT 0,
+                mapped_reads INTEGER,
+                updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS samples_stage ON samples (stage);
+            """
+        )
+
+    def mark(self, accessions, stage: str, no_data: bool = False) -> int:
+        """
+        Called to record that samples have reached a stage.
+
+        Parameters:
+        accessions - sample accessions - iterable
+        stage - one of STAGES - str
+        no_data - prefetch found no data for the samples - bool
+
+        Returns 0 if successful
+        """
+
+        rank = STAGES.index(stage)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO samples (accession, stage, no_data, updated) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(accession) DO UPDATE SET "
+                "stage = MAX(stage, excluded.stage), "
+                "no_data = MAX(no_data, excluded.no_data), updated = excluded.updated",
+                [(acc, rank, int(no_data), time.time()) for acc in accessions],
+            )
+        return 0
+
+    def at_stage(self, stage: str) -> set:
+        """
+        Returns the set of accessions that have reached at least the stage
+        """
+
+        return {
+            acc
+            for (acc,) in self.conn.execute(
+                "SELECT accession FROM samples WHERE stage >= ? AND no_data = 0",
+                (STAGES.index(stage),),
+            )
+        }
+
+    def set_mapped_reads(self, mapped_reads: dict) -> int:
+        """
+        Called to record the number of mapped reads of samples
+
+        Returns 0 if successful
+        """
+
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE samples SET mapped_reads = ? WHERE accession = ?",
+                [(reads, acc) for acc, reads in mapped_reads.items()],
+            )
+        return 0
+
+    def mapped_reads(self) -> dict:
+        """
+        Returns dict of the recorded number of mapped reads of mapped samples,
+        None where it isn't known yet
+        """
+
+        return dict(
+            self.conn.execute(
+                "SELECT accession, mapped_reads FROM samples WHERE stage >= ?",
+                (STAGES.index("mapped"),),
+            )
+        )
+
+    def unseen(self, accessions) -> list:
+        """
+        Returns list of the accessions that aren't in the store
+        """
+
+        seen = {acc for (acc,) in self.conn.execute("SELECT accession FROM samples")}
+        return [acc for acc in accessions if acc not in seen]
+
+    def downloaded(self) -> set:
+        """
+        Returns the set of accessions whose sra file was in SRAs/ when their
+        files were last checked
+        """
+
+        return {
+            acc
+            for (acc,) in self.conn.execute(
+                "SELECT accession FROM samples WHERE sra = 1 AND no_data = 0"
+            )
+        }
+
+    def sync(self, accessions) -> dict:
+        """
+        Called to record the stages samples have reached from their files in
+        the working directory
+
+        Parameters:
+        accessions - sample accessions - iterable
+
+        Functionality:
+            Checks for the outputs of each stage for only the passed samples
+            and records the furthest stage found, whether prefetch found no
+            data and whether the sra file is there.  Samples without any files
+            are recorded as queried.
+
+        Returns dict of the furthest stage found for each sample with files
+        """
+
+        found = {}
+        no_data = []
+        sra = []
+        accessions = list(accessions)
+        for acc in accessions:
+            if os.path.isfile(f"SRAs/{acc}.no.data"):
+                no_data.append(acc)
+            for stage, outputs in STAGE_FILES:
+                if any(os.path.isfile(output.format(acc=acc)) for output in outputs):
+                    found[acc] = stage
+                    break
+            sra.append((int(os.path.isfile(f"SRAs/{acc}/{acc}.sra")), acc))
+        self.mark(accessions, "queried")
+        self.mark(no_data, "queried", no_data=True)
+        for stage in STAGES:
+            self.mark(
+                [acc for acc, found_stage in found.items() if found_stage == stage],
+                stage,
+            )
+        with self.conn:
+            self.conn.executemany("UPDATE samples SET sra = ? WHERE accession = ?", sra)
+        return found
+
+    def close(self):
+        """
+        Closes the database
+        """
+
+        self.conn.close()
@@ -2,32 +2,51 @@
 Writen by Devon Gregory
 This script has functions called by the snakefiles to query NCBI'
 SRA and download and process the files for the results.
-Last edited on 7-10-22
+Last edited on 10-18-26
 """
 
 import os
+import csv
+import math
 import sys
-import subprocess
 import xml.parsers.expat
-import json
 import shutil
+import time
+from primer_matcher import PrimerMatcher
+from meta_xml import read_xml_chunks, find_xml_shards, merge_xml_shards
+from sra_client import SraClient, query_sra, query_runs_exp
+from run_catalog import RunCatalog, read_runs
+from sample_store import SampleStore
+from read_counts import count_mapped_reads, bai_mapped_reads, fastp_passed_reads
+from aggregate_index import AggregateFile, add_endpoints
+from variant_store import VariantStore, read_meta
+from freq_matrix import FreqMatrix
+from consensus_archive import ConsensusArchive
+from depth_matrix import DepthMatrix, add_depth_files
+from amplicon_coverage import amplicon_coverage, write_report
 
 snakemodpath = os.path.realpath(os.path.join(sys.path[0], ".."))
+# nts fastp trims from the 5' end of the reads of samples without known primers
+UNKNOWN_CUT = 25
 
 
-def sra_query(search_str: str, date_stamp: str) -> int:
+def sra_query(search_str: str, date_stamp: str, **kwargs) -> int:
     """
     Called to query NCBI's SRA and collect metadata for the query results.
 
     Parameters:
     search_str - string for the query - str
     date_stamp - timestamp of current query - str
+    page_size - results downloaded per request, 0 for a single request - int
+    jobs - connections/pages downloaded at once - int
+    retries - times a failed request is retried - int
 
     Functionality:
-        curl is used to download the html results for the query.
-        The html is then parsed to find the MCID and key of the specific
-        query for downloading the metadata, also using using curl.  Files
-        are tagged with the date stamp.
+        The html results for the query are downloaded with a pooled http
+        client (see sra_client.py) and scanned for the MCID and key of the
+        specific query for downloading the metadata.  The metadata is then
+        downloaded in pages of runs, fetched concurrently, and failed requests
+        are retried with a backoff.  Files are tagged with the date stamp.
 
         Searches returning no results (and maybe only 1 result) will cause
         a program exit.
@@ -35,51 +54,113 @@ def sra_query(search_str: str, date_stamp: str) -> int:
         Return: 0 if no exceptions were raised
     """
 
-    subprocess.run(
-        [
-            "curl -A 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:50.0) "
-            "Gecko/20100101 Firefox/50.0' -L --alt-svc '' "
-            "--anyauth -b ncbi "
-            f"'https://www.ncbi.nlm.nih.gov/sra/?term={search_str}' "
-            f"-o search_results_{date_stamp}.html"
-        ],
-        shell=True,
-        check=True,
+    client = SraClient(
+        max_connections=kwargs.get("jobs", 4), retries=kwargs.get("retries", 5)
     )
-    mcid = ""
-    key = -1
     try:
-        with open(
-            f"search_results_{date_stamp}.html", "r", encoding="utf-8"
-        ) as search_fh:
-            mcid = search_fh.read().split('value="MCID_')[1].split('"')[0]
-            search_fh.seek(0)
-            key = search_fh.read().split("query_key:&quot;")[1].split("&quot")[0]
-    except IndexError as err:
+        results = query_sra(
+            client,
+            search_str,
+            date_stamp,
+            page_size=kwargs.get("page_size", 0),
+            jobs=kwargs.get("jobs", 4),
+        )
+    finally:
+        client.close()
+    if results < 0:
         print("Query results can't be used to download metadata")
-        print(err)
+        print(f"No MCID or query key found in search_results_{date_stamp}.html")
         sys.exit(2)
-    subprocess.run(
-        [
-            "curl 'https://trace.ncbi.nlm.nih.gov/Traces/sra-db-be/sra-db-be."
-            f"cgi?rettype=runinfo&WebEnv=MCID_{mcid}&query_key={key}' "
-            f"-L -o sra_data_{date_stamp}.csv"
-        ],
-        shell=True,
-        check=True,
-    )
-    subprocess.run(
-        [
-            "curl 'https://trace.ncbi.nlm.nih.gov/Traces/sra-db-be/sra-db-be."
-            f"cgi?rettype=exp&WebEnv=MCID_{mcid}&query_key={key}' "
-            f"-L -o sra_meta_{date_stamp}.xml"
-        ],
-        shell=True,
-        check=True,
-    )
     return 0
 
 
+def sra_query_incremental(search_str: str, date_stamp: str, **kwargs) -> int:
+    """
+    Called to query NCBI's SRA and collect metadata for only the query
+    results that are new or updated since the query was last run.
+
+    Parameters:
+    search_str - string for the query - str
+    date_stamp - timestamp of current query - str
+    cores - number of processes to parse the metadata xml with - int
+    page_size - results downloaded per request, 0 for a single request - int
+    jobs - connections/pages downloaded at once - int
+    retries - times a failed request is retried - int
+
+    Functionality:
+        The search results and run info csv are downloaded as for
+        sra_query().  The runs and their load dates are checked against the
+        run catalog (see run_catalog.py) and the experiment xml is downloaded
+        and parsed only for new or reloaded runs.  The parsed metadata is added
+        to the catalog and sra_meta_collect_current.tsv is written from the
+        catalog for all the runs of the query.  sra_meta_TIMESTAMP.xml/txt and
+        sra_meta_collect_TIMESTAMP.tsv only hold the new or updated runs.
+
+        Searches returning no results (and maybe only 1 result) will cause
+        a program exit.
+
+    Returns the number of new or updated runs
+    """
+
+    client = SraClient(
+        max_connections=kwargs.get("jobs", 4), retries=kwargs.get("retries", 5)
+    )
+    catalog = RunCatalog()
+    try:
+        mcid, key, count = client.search(
+            search_str, f"search_results_{date_stamp}.html"
+        )
+        if not (mcid and key):
+            print("Query results can't be used to download metadata")
+            print(f"No MCID or query key found in search_results_{date_stamp}.html")
+            sys.exit(2)
+        client.download(
+            "runinfo",
+            mcid,
+            key,
+            f"sra_data_{date_stamp}.csv",
+            count=count,
+            page_size=kwargs.get("page_size", 0),
+            jobs=kwargs.get("jobs", 4),
+        )
+        runs = read_runs(f"sra_data_{date_stamp}.csv")
+        changed = catalog.changed_runs(runs)
+        print(
+            f"{len(changed)} of {len(runs)} runs are new or updated since the "
+            "last query"
+        )
+        query_runs_exp(
+            client,
+            changed,
+            f"sra_meta_{date_stamp}.xml",
+            page_size=kwargs.get("page_size", 0),
+            jobs=kwargs.get("jobs", 4),
+        )
+        parse_xml_meta(date_stamp, cores=kwargs.get("cores", 1))
+        catalog.update(
+            search_str, date_stamp, runs, f"sra_meta_collect_{date_stamp}.tsv"
+        )
+        catalog.write_collect(search_str, "sra_meta_collect_current.tsv")
+    finally:
+        client.close()
+        catalog.close()
+    return len(changed)
+
+
+def get_primer_matcher(mapping_file: str) -> PrimerMatcher:
+    """
+    Called to get the compiled matcher for a mapping json.  Each json is only
+    loaded and compiled once per process.
+
+    Parameters:
+    mapping_file - json file that contains the matching information - str
+
+    Returns the PrimerMatcher for the file
+    """
+
+    return PrimerMatcher.load(os.path.join(snakemodpath, mapping_file))
+
+
 def get_primer_bed(primers_str: str, mapping_file: str) -> str:
     """
     Called to determine  either the proper primer bed or primers used
@@ -96,38 +177,13 @@ def get_primer_bed(primers_str: str, mapping_file: str) -> str:
     Functionality:
         parses the passed string for specific keywords to determine the most
         likely primers used in the sequencing or the primer bed for the found
-        potential primers
+        potential primers.  The mapping file is only loaded once, see
+        PrimerMatcher
 
     Returns string of the bed file or a primer keyword
     """
 
-    with open(
-        os.path.join(snakemodpath, mapping_file), "r", encoding="utf-8"
-    ) as _primer_map_json:
-        _primer_map_dict = json.load(_primer_map_json)
-    bed = "Unknown"
-    matching_dict = _primer_map_dict
-    while isinstance(matching_dict, dict) and bed == "Unknown":
-        new_dict = 0
-        for key in matching_dict:
-            if key in primers_str:
-                # Multiple keys may be present in primers_str. Match the first
-                # key only.
-                if isinstance(matching_dict[key], str):
-                    bed = matching_dict[key]
-                    break
-                matching_dict = matching_dict[key]
-                new_dict = 1
-                break
-            try:
-                bed = matching_dict["Other"]
-                break
-            except KeyError:
-                pass
-        if new_dict == 0:
-            break
-
-    return bed
+    return get_primer_matcher(mapping_file).match(primers_str)
 
 
 def start_ele_fun(name, attrs, element_strs, elements_dict, out_fh):
@@ -149,15 +205,11 @@ def start_ele_fun(name, attrs, element_strs, elements_dict, out_fh):
     """
 
     if len(element_strs) > 1:
-        if len(element_strs) > 2:
-            for _ in element_strs[2:]:
-                out_fh.write("    ")
-        out_fh.write(name)
-        out_fh.write(" :")
+        # each line is written with a single call
         if attrs:
-            out_fh.write(" ")
-            out_fh.write(str(attrs))
-        out_fh.write("\n")
+            out_fh.write(f"{'    ' * (len(element_strs) - 2)}{name} : {attrs}\n")
+        else:
+            out_fh.write(f"{'    ' * (len(element_strs) - 2)}{name} :\n")
     if name == "RUN":
         try:
             elements_dict["accession"] = attrs["accession"]
@@ -302,11 +354,7 @@ def data_fun(data, element_strs, elements_dict, flags, out_fh):
     """
 
     # Add whitespace and newlines to outfile
-    if len(element_strs) > 1:
-        for _ in element_strs[1:]:
-            out_fh.write("    ")
-    out_fh.write(data)
-    out_fh.write("\n")
+    out_fh.write(f"{'    ' * (len(element_strs) - 1)}{data}\n")
 
     # Modify location and date flags if needed
     flags["loc"] = modify_loc_flag(flags, element_strs, elements_dict, data)
@@ -319,61 +367,125 @@ def data_fun(data, element_strs, elements_dict, flags, out_fh):
     return elements_dict
 
 
-def parse_xml_meta(date_stamp: str) -> int:
+def parse_xml_chunks(chunks, out_fh, lite_out_fh) -> int:
+    """
+    Called to parse metadata xml chunks and write the txt and tsv rows for it.
+
+    Parameters:
+    chunks - bytes chunks of the xml - iterable
+    out_fh - file to write out all metadata - file object
+    lite_out_fh - file to write out select metadata - file object
+
+    Functionality:
+        Feeds the chunks to an expat parser whose handlers write out the
+        metadata as the elements are parsed
+
+    Returns 0 if no exceptions were raised
+    """
+
+    parse_xml = xml.parsers.expat.ParserCreate()
+    element_strs = []
+    elements_dict = {
+        "accession": "",
+        "date": "",
+        "loc": "",
+        "primers": [],
+    }
+    flags = {"date": False, "loc": False}
+    # 3 handler functions
+    def start_element(name, attrs):
+        element_strs.append(name)
+        start_ele_fun(name, attrs, element_strs, elements_dict, out_fh)
+
+    def end_element(name):
+        # name is used by parse_xml and must be a parameter of this function
+        assert name
+        element_strs.pop()
+        end_ele_fun(element_strs, elements_dict, out_fh, lite_out_fh)
+
+    def char_data(data):
+        if data and data.strip():
+            data_fun(data, element_strs, elements_dict, flags, out_fh)
+
+    parse_xml.StartElementHandler = start_element
+    parse_xml.EndElementHandler = end_element
+    parse_xml.CharacterDataHandler = char_data
+    for chunk in chunks:
+        parse_xml.Parse(chunk, False)
+    parse_xml.Parse(b"", True)
+    return 0
+
+
+def parse_xml_meta(
+    date_stamp: str,
+    chunk_size: int = 1 << 20,
+    cores: int = 1,
+    shard_size: int = 16 << 20,
+) -> int:
     """
     Called to process the metadata xml for the current query and produce a
     human readable txt file and collect specific sample information into a tsv.
 
     Parameters:
     date_stamp - timestamp of current query - str
+    chunk_size - bytes of xml fed to the parser at a time - int
+    cores - number of processes to parse with - int
+    shard_size - smallest range of the xml parsed by each process - int
 
     Functionality:
         The xml file is parsed and translated into a txt file with a (more)
         human readable format (similiar to json).  Sample data on the run accession,
         collection date, geographic location and the sequencing primers used are
-        collecting into a tsv.
+        collecting into a tsv.  The xml is streamed through the parser in chunks
+        and the outputs are written through large buffers, so memory use doesn't
+        depend on the size of the xml.  The time taken is reported.
+
+        With more than one core, large xmls are split at experiment package
+        boundaries and the ranges parsed in a process pool.  The txt and tsv
+        fragments are then joined in order, giving the same files as the
+        serial parse.
 
     Returns 0 if no exceptions were raised
     """
 
-    with open(f"sra_meta_{date_stamp}.xml", "r", encoding="utf-8") as full_meta_in_fh:
-        with open(f"sra_meta_{date_stamp}.txt", "w", encoding="utf-8") as out_fh:
-            with open(
-                f"sra_meta_collect_{date_stamp}.tsv", "w", encoding="utf-8"
-            ) as lite_out_fh:
-                lite_out_fh.write("Accession\tcollectiong data\tgeo_loc\tprimers\n")
-                parse_xml = xml.parsers.expat.ParserCreate()
-                element_strs = []
-                elements_dict = {
-                    "accession": "",
-                    "date": "",
-                    "loc": "",
-                    "primers": [],
-                }
-                flags = {"date": False, "loc": False}
-                # 3 handler functions
-                def start_element(name, attrs):
-                    element_strs.append(name)
-                    start_ele_fun(name, attrs, element_strs, elements_dict, out_fh)
-
-                def end_element(name):
-                    # name is used by parse_xml and must be a parameter of this function
-                    assert name
-                    element_strs.pop()
-                    end_ele_fun(element_strs, elements_dict, out_fh, lite_out_fh)
-
-                def char_data(data):
-                    if data and data.strip():
-                        data_fun(data, element_strs, elements_dict, flags, out_fh)
-
-                parse_xml.StartElementHandler = start_element
-                parse_xml.EndElementHandler = end_element
-                parse_xml.CharacterDataHandler = char_data
-                parse_xml.Parse(full_meta_in_fh.read())
+    start_time = time.perf_counter()
+    xml_file = f"sra_meta_{date_stamp}.xml"
+    shards = None
+    if cores > 1 and os.path.getsize(xml_file) >= 2 * shard_size:
+        shards = find_xml_shards(
+            xml_file,
+            min(cores * 4, os.path.getsize(xml_file) // shard_size),
+            chunk_size,
+        )
+    with open(
+        f"sra_meta_{date_stamp}.txt", "w", encoding="utf-8", buffering=chunk_size
+    ) as out_fh:
+        with open(
+            f"sra_meta_collect_{date_stamp}.tsv",
+            "w",
+            encoding="utf-8",
+            buffering=chunk_size,
+        ) as lite_out_fh:
+            lite_out_fh.write("Accession\tcollectiong data\tgeo_loc\tprimers\n")
+            if shards:
+                merge_xml_shards(shards, parse_xml_chunks, cores, (out_fh, lite_out_fh))
+            else:
+                with open(xml_file, "rb") as full_meta_in_fh:
+                    parse_xml_chunks(
+                        read_xml_chunks(full_meta_in_fh, chunk_size),
+                        out_fh,
+                        lite_out_fh,
+                    )
     shutil.copyfile(
         f"sra_meta_collect_{date_stamp}.tsv",
         "sra_meta_collect_current.tsv",
     )
+    print(
+        f"Parsed sra_meta_{date_stamp}.xml into sra_meta_{date_stamp}.txt and "
+        f"sra_meta_collect_{date_stamp}.tsv in "
+        f"{time.perf_counter() - start_time:.2f} seconds"
+        f"{f' using {len(shards.offsets)} ranges' if shards else ''}"
+    )
     return 0
 
 
@@ -385,224 +497,272 @@ def get_sample_acc1(redo: bool) -> list:
     bool - boolean for reprocessing samples - bool
 
     Functionality:
-        If reprocessing is not to be done, accessions of previously
-        downloaded and processed samples are collected from the current
-        meta collected values tsv. Sample accession are check against
-        previously processed samples, if relevent, and returned
+        Sample accessions from the current meta collected values tsv are
+        recorded as queried in the sample state store (see sample_store.py),
+        with the stages of samples the store hasn't seen before found from
+        their files.  If reprocessing is not to be done, samples the store
+        has as quality checked are left out.
 
     Returns a list of the accessions
     """
-    prev_accs = []
-    if (not redo) and os.path.isdir("fastqs/"):
-        for file in os.listdir("fastqs/"):
-            if file.endswith(".json"):
-                prev_accs.append(file.split(".")[0])
-    accs = []
+    query_accs = []
     with open("sra_meta_collect_current.tsv", "r", encoding="utf-8") as in_fh:
         for line in in_fh:
             split_line = line.strip("\n").split("\t")
-            if (
-                split_line[0]
-                and (split_line[0].startswith("SRR") or split_line[0].startswith("ERR"))
-                and not split_line[0] in prev_accs
+            if split_line[0] and (
+                split_line[0].startswith("SRR") or split_line[0].startswith("ERR")
             ):
-                accs.append(split_line[0])
+                query_accs.append(split_line[0])
+    store = SampleStore()
+    sync_samples(store, store.unseen(query_accs))
+    store.mark(query_accs, "queried")
+    prev_accs = set()
+    if not redo:
+        prev_accs = store.at_stage("qc")
+    store.close()
+    accs = [acc for acc in query_accs if not acc in prev_accs]
     return " ".join(accs)
 
 
-def get_sample_acc2(redo: bool) -> dict:
+def get_run_info() -> dict:
     """
-    Called to get the accessions of the samples of the current query.
-
-    Parameters:
-    bool - boolean for reprocessing samples - bool
+    Called to get the run info of the runs of the most recent query.
 
     Functionality:
-        If reprocessing is not to be done, accessions of previously
-        downloaded and processed samples are collected based on the
-        presence of the qc json for the sample.
-        Sample accession from the current query are check against previously
-        processed samples, if relevent, and passed back as a dict with
-        primer trimming instructions to be used in rules.
+        Reads the run info, sra_data_TIMESTAMP.csv, most recently written
+        to the working directory
 
-    Returns a dict of the accessions with primer trimming instructions.
+    Returns a dict of the run info row of each run accession, empty if there
+    is no run info
     """
-    prev_accs = []
-    if (not redo) and os.path.isdir("fastqs/"):
-        for file in os.listdir("fastqs/"):
-            if file.endswith(".json"):
-                prev_accs.append(file.split(".")[0])
-    accs = {}
-    with open("sra_meta_collect_current.tsv", "r", encoding="utf-8") as in_fh:
-        for line in in_fh:
-            split_line = line.strip("\n").split("\t")
-            if (
-                split_line[0]
-                and (split_line[0].startswith("SRR") or split_line[0].startswith("ERR"))
-                and not split_line[0] in prev_accs
-            ):
-                if os.path.isfile(f"SRAs/{split_line[0]}/{split_line[0]}.sra"):
-                    accs[split_line[0]] = {"bed": split_line[3], "cut": ""}
-                    if split_line[3] == "Unknown":
-                        accs[split_line[0]]["cut"] = "-f 25 "
-    return accs
+
+    runinfo_csvs = [
+        file
+        for file in os.listdir(".")
+        if file.startswith("sra_data_") and file.endswith(".csv")
+    ]
+    run_info = {}
+    if runinfo_csvs:
+        with open(
+            max(runinfo_csvs, key=os.path.getmtime), "r", encoding="utf-8", newline=""
+        ) as in_fh:
+            for row in csv.DictReader(in_fh):
+                if row.get("Run") and row["Run"] != "Run":
+                    run_info[row["Run"]] = row
+    return run_info
 
 
-def qc_pass(sample_accs: dict) -> list:
+def get_run_sizes() -> dict:
     """
-    Called to discover qc checked fastq files generated by the quality_check rule
-    and determine if they are of a quality worth continuing.
-    Potentilal TODO: have the cut off in the config.yaml and pass it here
+    Called to get the size of the runs of the most recent query.
+
+    Returns a dict of the size in MB of each run accession, empty if there
+    is no run info
+    """
+
+    sizes = {}
+    for acc, row in get_run_info().items():
+        try:
+            sizes[acc] = float(row.get("size_MB") or 0)
+        except ValueError:
+            sizes[acc] = 0.0
+    return sizes
+
+
+def get_run_layouts(sample_accs) -> dict:
+    """
+    Called to get whether the samples' reads are paired or single end,
+    for rules that can't check the fastqs written by fasterq-dump.
 
     Parameters:
-    sample_accs - accession list for the SRA samples - list
+    sample_accs - accessions of the samples - iterable
 
     Functionality:
-        Checks the fastqs subfolder for single or paired qced fastq files,
-        then checks the qc json for sufficient passed reads to conintue.
-        Currently requires over 500 passed reads. returns list of passed samples
+        Runs with mated spots in the run info are paired end.  Runs without
+        spot counts go by the library layout, and runs not in the run info
+        are taken as single end.
 
-    Returns list of passed accs
+    Returns dict of "pe" or "se" for each accession
     """
 
-    passed = []
+    run_info = get_run_info()
+    layouts = {}
     for acc in sample_accs:
-        if os.path.isfile(f"sams/{acc}.sam"):
-            with open(f"sams/{acc}.sam", "r", encoding="utf-8") as sam_file:
-                lines = len(sam_file.read().split("\n"))
-                if lines > 502:
-                    passed.append(acc)
-
-    return passed
+        row = run_info.get(acc, {})
+        spots = row.get("spots") or ""
+        mated = row.get("spots_with_mates") or ""
+        if spots.isdigit() and int(spots) > 0 and mated.isdigit():
+            paired = int(mated) > 0
+        else:
+            paired = row.get("LibraryLayout", "").upper() == "PAIRED"
+        layouts[acc] = "pe" if paired else "se"
+    return layouts
 
 
-def add_sample(agg, file, samp):
+def download_mb(sra_acc: str, run_sizes: dict, budget: int) -> int:
     """
-    This function adds the pased sample data to the passed file
+    Called by the download rules to get the size of a download to count
+    against the download budget.
 
     Parameters:
-    agg - aggregate file - open file handle
-    file - name of the sample file - str
-    samp - sample accession - str
-
-    Functionality:
-        Opens the sample file and writes date from it to the aggreagate file
+    sra_acc - accession of the sample - str
+    run_sizes - size in MB of the runs from get_run_sizes() - dict
+    budget - MB that may be downloaded at once, 0 for no limit - int
 
-    Returns
+    Returns the size in whole MB, at least 1 and at most the budget
     """
 
-    with open(file, "r", encoding="utf-8") as samp_fh:
-        if file.endswith(".tsv"):
-            agg.write(samp)
-            agg.write("\n")
-        agg.write(samp_fh.read())
-        if file.endswith(".tsv"):
-            agg.write("\n--------\n")
+    size = max(math.ceil(run_sizes.get(sra_acc, 0)), 1)
+    if budget:
+        size = min(size, budget)
+    return size
 
 
-def check_if_present(agg, redo, file, samp):
+def get_sample_acc2(redo: bool) -> dict:
     """
-    This function checks if the sample is present in the aggregated file.
+    Called to get the accessions of the samples of the current query.
 
     Parameters:
-    agg - aggregate file - open file handle
-    redo - boolean to indicate if samples are to be reprocessed - bool
-    file - name of the sample file - str
-    samp - sample accession - str
+    bool - boolean for reprocessing samples - bool
 
     Functionality:
-        Parses the aggreagate file data from the current sample.  If not found
-        the data is added to the aggregate file.  If it is found and redo is
-        True, re_write is set to true.
+        The samples of the current query are looked up in the sample state
+        store (see sample_store.py), with the stages of samples the store
+        hasn't seen before found from their files.  If reprocessing is not
+        to be done, samples the store has as quality checked are left out.
+        Those whose sra files have been downloaded are passed back as a dict
+        with primer trimming instructions to be used in rules.
 
-    Returns re_write
+    Returns a dict of the accessions with primer trimming instructions.
     """
-
-    agg.seek(0)
-    present = samp in agg.read()
-    re_write = False
-
-    if redo and present:
-        re_write = True
-    elif not present:
-        add_sample(agg, file, samp)
-
-    return re_write
+    query = []
+    with open("sra_meta_collect_current.tsv", "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            split_line = line.strip("\n").split("\t")
+            if split_line[0] and (
+                split_line[0].startswith("SRR") or split_line[0].startswith("ERR")
+            ):
+                query.append(split_line)
+    store = SampleStore()
+    sync_samples(store, store.unseen(split_line[0] for split_line in query))
+    prev_accs = set()
+    if not redo:
+        prev_accs = store.at_stage("qc")
+    downloaded = store.downloaded()
+    store.close()
+    accs = {}
+    for split_line in query:
+        if split_line[0] in downloaded and not split_line[0] in prev_accs:
+            accs[split_line[0]] = {"bed": split_line[3], "cut": ""}
+            if split_line[3] == "Unknown":
+                accs[split_line[0]]["cut"] = f"-f {UNKNOWN_CUT} "
+    return accs
 
 
-def re_write_tsv_file(re_write_file, samp, file):
+def record_sample_stages(sample_accs) -> int:
     """
-    This function takes the variant call or lineage call tsv file and adds the
-    new variant calls as necessary.
+    Called by the snakefiles when they finish to record the stages the
+    samples of the run reached in the sample state store.
 
     Parameters:
-    re_write_file - aggregate file - str
-    samp - sample accession - str
-    file - name of the sample file - str
+    sample_accs - accessions of the samples of the run - iterable
 
     Functionality:
-        Reads the current aggregate file and re-writes it without the old data
-        for the sample and with the new data
+        Checks for the outputs of each stage for only the passed samples and
+        records the furthest stage found (see sample_store.py).  The mapped
+        reads of mapped samples are counted again, as their sams may have been
+        rewritten.
 
-    Returns
+    Returns 0 if successful
     """
 
-    old_file = ""
-    new_file = ""
+    store = SampleStore()
+    sync_samples(store, sample_accs)
+    store.close()
+    return 0
 
-    with open(re_write_file, "r", encoding="utf-8") as agg:
-        old_file = agg.read()
-    old_split = old_file.split("\n--------\n")
 
-    for data in old_split:
-        if (not data.startswith(samp)) and data.strip():
-            new_file += data
-            new_file += "\n--------\n"
+def sync_samples(store: SampleStore, sample_accs) -> dict:
+    """
+    Called to record the stages samples have reached from their files in the
+    sample state store and the number of mapped reads of mapped samples.
 
-    with open(re_write_file, "w", encoding="utf-8") as agg:
-        agg.write(new_file)
-        with open(file, "r", encoding="utf-8") as samp_fh:
-            agg.write(samp)
-            agg.write("\n")
-            agg.write(samp_fh.read())
-            agg.write("\n--------\n")
+    Parameters:
+    store - sample state store - SampleStore
+    sample_accs - accessions of the samples to check - iterable
 
+    Functionality:
+        The mapped reads are counted from the sam, or read from the bam index
+        of samples mapped straight to bams
 
-def re_write_consensus_file(con_file, samp, file):
+    Returns dict of the furthest stage found for each sample with files
     """
-    This function re-writes the consensus file if necessary. This function is
-    separate from the more general re_write_tsv_file() because the consensus
-    is in fasta format.
 
-    Parameters:
-    con_file - aggregate file - str
-    samp - sample accession - str
-    file - name of the sample file - str
+    found = store.sync(sample_accs)
+    mapped_reads = {}
+    for acc, stage in found.items():
+        if stage != "mapped":
+            continue
+        mapped_reads[acc] = None
+        if os.path.isfile(f"sams/{acc}.sam"):
+            mapped_reads[acc] = count_mapped_reads(f"sams/{acc}.sam")
+        elif os.path.isfile(f"sams/{acc}.bam.bai"):
+            # mapped straight to an indexed bam
+            mapped_reads[acc] = bai_mapped_reads(f"sams/{acc}.bam.bai")
+    store.set_mapped_reads(mapped_reads)
+    return found
 
-    Functionality:
-        Reads the current aggregate file and re-writes it without the old data
-        for the sample and with the new data
 
-    Returns
+def qc_pass(sample_accs: dict, min_reads: int = 500, count: str = "sam") -> list:
     """
+    Called to discover qc checked fastq files generated by the quality_check rule
+    and determine if they are of a quality worth continuing.
 
-    old_file = ""
-    new_file = ""
+    Parameters:
+    sample_accs - accession list for the SRA samples - list
+    min_reads - samples need more reads than this to continue - int
+    count - how reads are counted, "sam" or "bam" for mapped reads or "fastp"
+        for reads passing qc - str
 
-    with open(con_file, "r", encoding="utf-8") as agg:
-        old_file = agg.read()
+    Functionality:
+        Only samples the sample state store has recorded with a sam or bam
+        are checked, whichever way reads are counted.  With "sam", the number
+        of mapped reads counted from the sams when the mapping finished (see
+        record_sample_stages()) is used, so no files are read.  Samples
+        without a recorded count have their sam counted, stopping once more
+        than min_reads are found, and whole counts are recorded.  With "bam",
+        the mapped reads are read from the bam index, as they are for samples
+        mapped straight to bams without a recorded count, and with "fastp", the
+        reads passing fastp's filters are read from the qc jsons.
+        returns list of passed samples
 
-    old_split = old_file.split(">")
+    Returns list of passed accs
+    """
 
-    for data in old_split:
-        if (not samp in data) and data.strip():
-            new_file += ">"
-            new_file += data
+    store = SampleStore()
+    mapped_reads = store.mapped_reads()
+    counted = {}
+    passed = []
+    for acc in sample_accs:
+        if acc not in mapped_reads:
+            continue
+        reads = mapped_reads[acc]
+        if count == "fastp":
+            reads = fastp_passed_reads(acc)
+        elif (
+            count == "bam" or reads is None and not os.path.isfile(f"sams/{acc}.sam")
+        ) and os.path.isfile(f"sams/{acc}.bam.bai"):
+            reads = bai_mapped_reads(f"sams/{acc}.bam.bai")
+        elif reads is None and os.path.isfile(f"sams/{acc}.sam"):
+            reads = count_mapped_reads(f"sams/{acc}.sam", min_reads + 1)
+            if reads <= min_reads:
+                counted[acc] = reads
+        if (reads or 0) > min_reads:
+            passed.append(acc)
+    store.set_mapped_reads(counted)
+    store.close()
 
-    with open(con_file, "w", encoding="utf-8") as agg:
-        agg.write(new_file)
-        with open(file, "r", encoding="utf-8") as samp_fh:
-            agg.write(samp_fh.read())
+    return passed
 
 
 def aggregate_endpoints(vc_list, con_list, lin_list, redo) -> int:
@@ -617,50 +777,104 @@ def aggregate_endpoints(vc_list, con_list, lin_list, redo) -> int:
 
     Functionality:
         Adds sample data to the aggregate files unless it is
-        already present and reprocessing isn't being done
+        already present and reprocessing isn't being done.  Samples are
+        looked up by accession in the aggregate files' index (see
+        aggregate_index.py) and reprocessed samples' old data is
+        tombstoned rather than each file being rewritten.  Aggregate files
+        are only made once they have a sample.  The variant calls are also
+        added to the variant store (see variant_store.py) with the samples'
+        collection dates and locations, and their frequencies set as the
+        samples' rows of the sample by mutation matrix (see freq_matrix.py).
+        The consensus sequences are also added to the consensus archive as
+        their differences from the reference (see consensus_archive.py).
+        The depths written with the variant calls are set as the samples'
+        rows of the depth matrix (see depth_matrix.py).
 
     Returns 0 if successful.
     """
 
-    vc_file = "endpoints/VCs.tsv"
-    con_file = "endpoints/Consensus.fa"
-    lineage_file = "endpoints/Lineages.tsv"
+    variants = VariantStore(gff=os.path.join(snakemodpath, "data/NC_045512.2.gff3"))
+    freqs = FreqMatrix()
+    consensus = ConsensusArchive(
+        reference=os.path.join(snakemodpath, "data/SARS2.fasta")
+    )
+    meta = read_meta("sra_meta_collect_current.tsv")
+    for agg_file, kind, file_list in (
+        ("endpoints/VCs.tsv", "variants", vc_list),
+        ("endpoints/Consensus.fa", "consensus", con_list),
+        ("endpoints/Lineages.tsv", "lineages", lin_list),
+    ):
+        if not file_list:
+            continue
+        agg = AggregateFile(agg_file, "fasta" if kind == "consensus" else "tsv")
+        for samp, data in add_endpoints(agg, file_list, redo):
+            if kind == "variants":
+                lines = data.decode().splitlines()
+                variants.add(samp, lines, meta.get(samp, ("", "")))
+                freqs.add(samp, lines)
+            elif kind == "consensus":
+                consensus.add(samp, data.decode())
+        agg.close()
+    variants.close()
+    freqs.close()
+    consensus.close()
+    add_depth_files(vc_list, redo)
 
-    ####################
-    # Iterate through variant calls, adding to summary file if not yet present
+    return 0
 
-    for file in vc_list:
-        samp = file.split("/")[1].split(".")[0]
 
-        with open(vc_file, "a+", encoding="utf-8") as agg:
-            re_write = check_if_present(agg, redo, file, samp)
+def amplicon_report(sample_accs: dict, min_depth: int, dropout_breadth: float) -> int:
+    """
+    Called to report the coverage of the samples' amplicons.
 
-        if re_write:
-            re_write_tsv_file(vc_file, samp, file)
+    Parameters:
+    sample_accs - dict of the samples with their primer beds - dict
+    min_depth - depth a position needs to be covered - int
+    dropout_breadth - breadth an amplicon needs not to be a dropout - float
 
-    ####################
-    # Iterate through consensus definitions, adding to summary file if not yet
-    # present
+    Functionality:
+        Each amplicon's mean depth, breadth and dropout flag are computed
+        from the depth matrix for the samples with primer beds (see
+        amplicon_coverage.py) and replace their rows in
+        endpoints/AmpliconCoverage.tsv.
+
+    Returns the number of samples reported
+    """
+
+    matrix = DepthMatrix()
+    samples = write_report(
+        amplicon_coverage(
+            matrix,
+            {acc: info["bed"] for acc, info in sample_accs.items()},
+            snakemodpath,
+            min_depth,
+            dropout_breadth,
+        )
+    )
+    matrix.close()
+    return samples
 
-    for file in con_list:
-        samp = file.split("/")[1].split(".")[0]
 
-        with open(con_file, "a+", encoding="utf-8") as agg:
-            re_write = check_if_present(agg, redo, file, samp)
+def update_lineages(lin_list) -> int:
+    """
+    Called by snakefile_redemix to replace the samples' lineages in the
+    lineage aggregate file after they are re-demixed.
 
-        if re_write:
-            re_write_consensus_file(con_file, samp, file)
+    Parameters:
+    lin_list - the samples' lineage files - list
+
+    Functionality:
+        Each sample's block in Lineages.tsv is tombstoned and its new
+        lineages appended (see aggregate_index.py), with samples not yet in
+        it added.
 
-    ####################
-    # Iterate through lineages, adding to summary file if not yet present
+    Returns the number of samples updated
+    """
 
+    agg = AggregateFile("endpoints/Lineages.tsv", "tsv")
     for file in lin_list:
         samp = file.split("/")[1].split(".")[0]
-
-        with open(lineage_file, "a+", encoding="utf-8") as agg:
-            re_write = check_if_present(agg, redo, file, samp)
-
-        if re_write:
-            re_write_tsv_file(lineage_file, samp, file)
-
-    return 0
+        with open(file, "rb") as samp_fh:
+            agg.add(samp, samp_fh.read())
+    agg.close()
+    return len(lin_list)
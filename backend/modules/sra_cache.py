@@ -0,0 +1,456 @@
+"""
+This module has the cache of sra and fastq files shared by working
+directories.  Files are stored once by the sha256 of their content under
+objects/ in the cache directory, and an index in the cache directory maps
+each sample accession and kind of file (sra or fastq) to its files.  Working
+directories get hard links to the stored files, or copies where links
+aren't possible.  The least recently used samples are evicted to keep the
+files only the cache holds within its disk budget.
+
+It is run from the download_sra and get_fastqs rules, ie
+    python sra_cache.py CACHE_DIR fetch ACCESSION sra SRAs/ACCESSION
+exits 0 if the files were found and linked, 1 if not, and
+    python sra_cache.py CACHE_DIR store ACCESSION sra SRAs/ACCESSION/ACCESSION.sra
+adds the files to the cache.
+"""
+
+import argparse
+import hashlib
+import os
+import shlex
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+INDEX_FILE = "cache.sqlite"
+KINDS = ("sra", "fastq")
+
+
+def file_sha256(path: str) -> str:
+    """
+    Returns the hex sha256 of the file's content
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as in_fh:
+        for block in iter(lambda: in_fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dest: str):
+    """
+    Called to hard link src to dest, copying it if it can't be linked.
+    dest is replaced if it exists.
+    """
+
+    dest_dir = os.path.dirname(dest) or "."
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_dest = f"{dest}.cache.tmp"
+    if os.path.lexists(tmp_dest):
+        os.remove(tmp_dest)
+    try:
+        os.link(src, tmp_dest)
+    except OSError:
+        shutil.copyfile(src, tmp_dest)
+    os.replace(tmp_dest, dest)
+
+
+class SraCache:
+    """
+    Content addressed cache of the sra and fastq files of samples.
+
+    Parameters:
+    root - cache directory - str
+    budget - bytes of files the cache may hold, 0 for no limit - int
+
+    Functionality:
+        Entries are keyed by accession and kind with the checksum, name and
+        size of each of their files and the time they were last used.  Files
+        with the same content are stored once.  Hits and misses are counted
+        in the index.
+    """
+
+    def __init__(self, root: str, budget: int = 0):
+        self.root = root
+        self.budget = budget
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, INDEX_FILE), timeout=300)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                accession TEXT,
+                kind TEXT,
+                last_used REAL,
+                PRIMARY KEY (accession, kind)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                accession TEXT,
+                kind TEXT,
+                name TEXT,
+                checksum TEXT,
+                size INTEGER,
+                PRIMARY KEY (accession, kind, name)
+            );
+            CREATE INDEX IF NOT EXISTS files_checksum ON files (checksum);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS stats (
+                kind TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+
+    def object_path(self, checksum: str) -> str:
+        """
+        Returns the path of the stored file with the checksum
+        """
+
+        return os.path.join(self.root, "objects", checksum[:2], checksum)
+
+    def count(self, kind: str, hit: bool):
+        """
+        Called to add a hit or miss to the statistics of the kind
+        """
+
+        column = "hits" if hit else "misses"
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO stats (kind) VALUES (?) ON CONFLICT(kind) DO NOTHING",
+                (kind,),
+            )
+            self.conn.execute(
+                f"UPDATE stats SET {column} = {column} + 1 WHERE kind = ?", (kind,)
+            )
+
+    def fetch(self, accession: str, kind: str, dest_dir: str) -> list:
+        """
+        Called to link the cached files of a sample into a directory.
+
+        Parameters:
+        accession - sample accession - str
+        kind - one of KINDS - str
+        dest_dir - directory for the files - str
+
+        Functionality:
+            The files are checked against their recorded size and checksum
+            before linking, as a working directory may have changed a file
+            linked to its stored copy.  A sample with missing or changed files
+            is dropped from the cache and counted as a miss.
+
+        Returns list of the linked files, empty for a miss
+        """
+
+        files = self.conn.execute(
+            "SELECT name, checksum, size FROM files WHERE accession = ? AND kind = ?",
+            (accession, kind),
+        ).fetchall()
+        for _, checksum, size in files:
+            path = self.object_path(checksum)
+            if (
+                not os.path.isfile(path)
+                or os.path.getsize(path) != size
+                or file_sha256(path) != checksum
+            ):
+                self.remove(accession, kind)
+                files = []
+                break
+        self.count(kind, bool(files))
+        if not files:
+            return []
+        linked = []
+        for name, checksum, _ in files:
+            linked.append(os.path.join(dest_dir, name))
+            link_or_copy(self.object_path(checksum), linked[-1])
+        with self.conn:
+            self.conn.execute(
+                "UPDATE entries SET last_used = ? WHERE accession = ? AND kind = ?",
+                (time.time(), accession, kind),
+            )
+        return linked
+
+    def store(self, accession: str, kind: str, paths: list) -> int:
+        """
+        Called to add the files of a sample to the cache, then evict the
+        least recently used samples over the budget.
+
+        Parameters:
+        accession - sample accession - str
+        kind - one of KINDS - str
+        paths - the sample's files - list
+
+        Returns the number of bytes added
+        """
+
+        records = []
+        added = 0
+        for path in paths:
+            checksum = file_sha256(path)
+            obj = self.object_path(checksum)
+            if not os.path.isfile(obj):
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                tmp_fd, tmp_obj = tempfile.mkstemp(dir=os.path.dirname(obj))
+                os.close(tmp_fd)
+                link_or_copy(path, tmp_obj)
+                os.replace(tmp_obj, obj)
+                added += os.path.getsize(obj)
+            records.append(
+                (
+                    accession,
+                    kind,
+                    os.path.basename(path),
+                    checksum,
+                    os.path.getsize(obj),
+                )
+            )
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM files WHERE accession = ? AND kind = ?", (accession, kind)
+            )
+            self.conn.executemany(
+                "INSERT INTO files (accession, kind, name, checksum, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                records,
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (accession, kind, last_used) "
+                "VALUES (?, ?, ?)",
+                (accession, kind, time.time()),
+            )
+        self.evict(keep=(accession, kind))
+        return added
+
+    def remove(self, accession: str, kind: str) -> int:
+        """
+        Called to drop a sample from the cache, deleting its stored files
+        that no other sample uses
+
+        Returns the number of bytes freed by the deleted files that weren't
+        linked elsewhere
+        """
+
+        with self.conn:
+            checksums = [
+                checksum
+                for (checksum,) in self.conn.execute(
+                    "SELECT checksum FROM files WHERE accession = ? AND kind = ?",
+                    (accession, kind),
+                )
+            ]
+            self.conn.execute(
+                "DELETE FROM files WHERE accession = ? AND kind = ?", (accession, kind)
+            )
+            self.conn.execute(
+                "DELETE FROM entries WHERE accession = ? AND kind = ?",
+                (accession, kind),
+            )
+        freed = 0
+        for checksum in checksums:
+            if not self.conn.execute(
+                "SELECT 1 FROM files WHERE checksum = ?", (checksum,)
+            ).fetchone():
+                freed += self.held_bytes(checksum)
+                if os.path.isfile(self.object_path(checksum)):
+                    os.remove(self.object_path(checksum))
+        return freed
+
+    def held_bytes(self, checksum: str) -> int:
+        """
+        Returns the size of the stored file with the checksum if only the
+        cache links to it, 0 if it's also hard linked into a working
+        directory or missing, as deleting it then frees no space
+        """
+
+        try:
+            stat = os.stat(self.object_path(checksum))
+        except FileNotFoundError:
+            return 0
+        return stat.st_size if stat.st_nlink == 1 else 0
+
+    def size(self) -> int:
+        """
+        Returns the bytes of files held by the cache
+        """
+
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM "
+            "(SELECT DISTINCT checksum, size FROM files)"
+        ).fetchone()[0]
+
+    def held_size(self) -> int:
+        """
+        Returns the bytes of stored files only the cache links to
+        """
+
+        return sum(
+            self.held_bytes(checksum)
+            for (checksum,) in self.conn.execute("SELECT DISTINCT checksum FROM files")
+        )
+
+    def freeable(self, accession: str, kind: str) -> int:
+        """
+        Returns the bytes removing a sample would free, ie of its stored
+        files only the cache links to and no other sample uses
+        """
+
+        return sum(
+            self.held_bytes(checksum)
+            for (checksum,) in self.conn.execute(
+                "SELECT DISTINCT checksum FROM files AS own "
+                "WHERE accession = ? AND kind = ? AND NOT EXISTS "
+                "(SELECT 1 FROM files WHERE checksum = own.checksum "
+                "AND NOT (accession = own.accession AND kind = own.kind))",
+                (accession, kind),
+            ).fetchall()
+        )
+
+    def evict(self, keep=None) -> int:
+        """
+        Called to remove the least recently used samples until the cache is
+        within its budget.
+
+        Parameters:
+        keep - (accession, kind) of a sample not to evict - tuple
+
+        Functionality:
+            Stored files that are also hard linked into working directories
+            take no space beyond those directories' copies, so only the files
+            the cache alone links to count toward the budget.  Samples whose
+            removal would free nothing are kept.
+
+        Returns the number of samples evicted
+        """
+
+        evicted = 0
+        if not self.budget:
+            return evicted
+        held = self.held_size()
+        for accession, kind in self.conn.execute(
+            "SELECT accession, kind FROM entries ORDER BY last_used"
+        ).fetchall():
+            if held <= self.budget:
+                break
+            if (accession, kind) != keep and self.freeable(accession, kind):
+                held -= self.remove(accession, kind)
+                evicted += 1
+        return evicted
+
+    def stats(self) -> dict:
+        """
+        Returns dict of the hits and misses of each kind
+        """
+
+        return {
+            kind: {"hits": hits, "misses": misses}
+            for kind, hits, misses in self.conn.execute(
+                "SELECT kind, hits, misses FROM stats ORDER BY kind"
+            )
+        }
+
+    def close(self):
+        """
+        Closes the index
+        """
+
+        self.conn.close()
+
+
+def sra_cache_cmd(cache_dir: str, budget_gb: float) -> str:
+    """
+    Called by the snakefiles to get the command the download and fastq rules
+    use to fetch from and store to the shared sra/fastq cache.
+
+    Parameters:
+    cache_dir - shared cache directory, empty if not used - str
+    budget_gb - GB the cache may hold, 0 for no limit - float
+
+    Returns the command, empty if the cache isn't used
+    """
+
+    if not cache_dir:
+        return ""
+    return " ".join(
+        shlex.quote(arg)
+        for arg in (
+            sys.executable,
+            os.path.realpath(__file__),
+            os.path.realpath(cache_dir),
+            "--budget-gb",
+            str(budget_gb or 0),
+        )
+    )
+
+
+def print_sra_cache_stats(cache_dir: str) -> int:
+    """
+    Called by the snakefiles when they finish to report the hits and misses
+    of the shared sra/fastq cache, if it is used
+
+    Returns 0 if successful
+    """
+
+    if cache_dir:
+        cache = SraCache(os.path.realpath(cache_dir))
+        for kind, counts in cache.stats().items():
+            print(
+                f"sra cache {kind}: {counts['hits']} hits, {counts['misses']} misses, "
+                f"cache holds {cache.size() / (1 << 30):.2f} GB"
+            )
+        cache.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    """
+    Runs the cache actions for the snakefiles' rules
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("cache", help="cache directory")
+    parser.add_argument("--budget-gb", type=float, default=0)
+    actions = parser.add_subparsers(dest="action", required=True)
+    fetch = actions.add_parser("fetch")
+    fetch.add_argument("accession")
+    fetch.add_argument("kind", choices=KINDS)
+    fetch.add_argument("dest_dir")
+    store = actions.add_parser("store")
+    store.add_argument("accession")
+    store.add_argument("kind", choices=KINDS)
+    store.add_argument("paths", nargs="+")
+    actions.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    cache = SraCache(args.cache, int(args.budget_gb * (1 << 30)))
+    code = 0
+    if args.action == "fetch":
+        linked = cache.fetch(args.accession, args.kind, args.dest_dir)
+        if linked:
+            print(f"sra cache hit: {args.kind} {args.accession} {' '.join(linked)}")
+        else:
+            print(f"sra cache miss: {args.kind} {args.accession}")
+            code = 1
+    elif args.action == "store":
+        paths = [path for path in args.paths if os.path.isfile(path)]
+        added = cache.store(args.accession, args.kind, paths)
+        print(
+            f"sra cache stored: {args.kind} {args.accession} {len(paths)} files "
+            f"{added} new bytes, cache holds {cache.size()} bytes"
+        )
+    else:
+        for kind, counts in cache.stats().items():
+            total = counts["hits"] + counts["misses"]
+            print(
+                f"sra cache {kind}: {counts['hits']} hits, {counts['misses']} misses"
+                f" ({100 * counts['hits'] / total if total else 0:.1f}% hit rate)"
+            )
+    cache.close()
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""
+This module has the http client used by sra_query() to query NCBI's SRA
+and download the metadata for the query results.  Connections are kept alive
+and reused, large results are downloaded in pages of runs fetched
+concurrently and failed requests are retried with a backoff.
+"""
+
+import functools
+import http.client
+import os
+import queue
+import re
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urljoin, urlsplit
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:50.0) Gecko/20100101 Firefox/50.0"
+)
+SEARCH_URL = "https://www.ncbi.nlm.nih.gov/sra/"
+TRACE_URL = "https://trace.ncbi.nlm.nih.gov/Traces/sra-db-be/sra-db-be.cgi"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+ROOT_TAG = b"EXPERIMENT_PACKAGE_SET"
+
+
+class ConnectionPool:
+    """
+    Pool of keep-alive http connections for each host.
+
+    Parameters:
+    max_connections - most connections open at once - int
+    timeout - socket timeout in seconds - float
+
+    Functionality:
+        Idle connections are kept per scheme, host and port and handed out
+        again for the next request to that host.  A semaphore bounds the
+        number of connections in use at once.
+    """
+
+    def __init__(self, max_connections: int, timeout: float):
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.ssl_context = ssl.create_default_context()
+
+    def acquire(self, scheme: str, netloc: str):
+        """
+        Returns an idle connection to the host, or a new one
+        """
+
+        self.slots.acquire()  # pylint: disable=consider-using-with
+        with self.lock:
+            idle = self.idle.setdefault((scheme, netloc), queue.LifoQueue())
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            pass
+        if scheme == "https":
+            return http.client.HTTPSConnection(
+                netloc, timeout=self.timeout, context=self.ssl_context
+            )
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def release(self, scheme: str, netloc: str, conn, reuse: bool):
+        """
+        Returns the connection to the pool, or closes it if it can't be reused
+        """
+
+        if reuse:
+            self.idle[(scheme, netloc)].put(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    def close(self):
+        """
+        Closes all idle connections
+        """
+
+        with self.lock:
+            for idle in self.idle.values():
+                while not idle.empty():
+                    idle.get_nowait().close()
+            self.idle = {}
+
+
+class SraClient:
+    """
+    Client for querying NCBI's SRA and downloading the query's metadata.
+
+    Parameters:
+    max_connections - most connections open at once - int
+    timeout - socket timeout in seconds - float
+    search_url - url of the SRA web search - str
+    trace_url - url of the SRA metadata download - str
+    retries - times a request is retried after a failure - int
+    backoff - seconds waited before the first retry, doubled for each retry - float
+
+    Functionality:
+        Requests follow redirects, keep the cookies set by the server and are
+        streamed to disk.  Connection errors and server errors are retried
+        with exponential backoff, after which a ConnectionError is raised.
+    """
+
+    def __init__(self, max_connections: int = 4, timeout: float = 300, **kwargs):
+        self.search_url = kwargs.get("search_url", SEARCH_URL)
+        self.trace_url = kwargs.get("trace_url", TRACE_URL)
+        self.retries = kwargs.get("retries", 5)
+        self.backoff = kwargs.get("backoff", 1.0)
+        self.pool = ConnectionPool(max_connections, timeout)
+        self.cookies = {}
+        self.cookie_lock = threading.Lock()
+
+    def _request_once(self, url: str, out_fh) -> tuple:
+        """
+        Makes one GET request, following redirects, and streams the body to
+        the file.  Returns a tuple of an error string, empty if successful, and
+        whether the error can be retried
+        """
+
+        for _ in range(10):
+            split_url = urlsplit(url)
+            target = split_url.path or "/"
+            if split_url.query:
+                target += "?" + split_url.query
+            headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+            with self.cookie_lock:
+                cookies = self.cookies.get(split_url.netloc)
+                if cookies:
+                    headers["Cookie"] = "; ".join(
+                        f"{name}={value}" for name, value in cookies.items()
+                    )
+            conn = self.pool.acquire(split_url.scheme, split_url.netloc)
+            reuse = False
+            try:
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+                self._store_cookies(split_url.netloc, response)
+                if response.status == 200:
+                    out_fh.seek(0)
+                    out_fh.truncate()
+                    read = functools.partial(response.read, 1 << 16)
+                    for block in iter(read, b""):
+                        out_fh.write(block)
+                else:
+                    response.read()
+                reuse = not response.will_close
+            except (OSError, http.client.HTTPException) as err:
+                return (f"{url} failed: {err!r}", True)
+            finally:
+                self.pool.release(split_url.scheme, split_url.netloc, conn, reuse)
+            if response.status in REDIRECT_STATUSES:
+                url = urljoin(url, response.getheader("Location", ""))
+                continue
+            if response.status == 200:
+                return ("", False)
+            return (
+                f"{url} returned {response.status}",
+                response.status in RETRY_STATUSES,
+            )
+        return (f"{url} redirected too many times", False)
+
+    def _store_cookies(self, netloc: str, response):
+        """
+        Keeps the name and value of cookies set by the host
+        """
+
+        for header, value in response.getheaders():
+            if header.lower() == "set-cookie":
+                name, _, cookie_value = value.split(";")[0].partition("=")
+                with self.cookie_lock:
+                    self.cookies.setdefault(netloc, {})[name.strip()] = cookie_value
+
+    def get(self, url: str, path: str) -> str:
+        """
+        Called to download the url to the file path, retrying failures.
+
+        Parameters:
+        url - url to download - str
+        path - file to write the response body to - str
+
+        Functionality:
+            The response is streamed to the file.  Failures are retried after
+            waiting backoff * 2^attempt seconds.
+
+        Returns the path
+        """
+
+        with open(path, "wb") as out_fh:
+            for attempt in range(self.retries + 1):
+                error, retry = self._request_once(url, out_fh)
+                if not error:
+                    return path
+                print(f"Request attempt {attempt + 1} failed: {error}")
+                if not retry:
+                    break
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2**attempt)
+        raise ConnectionError(error)
+
+    def search(self, search_str: str, path: str) -> tuple:
+        """
+        Called to run the SRA search and find the query's MCID, key and
+        number of results.
+
+        Parameters:
+        search_str - string for the query - str
+        path - file to save the search results html to - str
+
+        Functionality:
+            The search results html is saved and scanned once for the MCID,
+            query key and result count.  The count is None if the html
+            doesn't have it.
+
+        Returns tuple of the mcid, key and count.  mcid and key are empty
+        strings if the results can't be used to download metadata
+        """
+
+        self.get(
+            f"{self.search_url}?term={quote(search_str, safe='+:/()[]=,*&')}", path
+        )
+        with open(path, "r", encoding="utf-8", errors="replace") as search_fh:
+            html = search_fh.read()
+        mcid = re.search(r'value="MCID_([^"]*)"', html)
+        key = re.search(r"query_key:&quot;(.*?)&quot", html)
+        count = re.search(r'<meta name="ncbi_resultcount" content="(\d+)"', html)
+        return (
+            mcid.group(1) if mcid else "",
+            key.group(1) if key else "",
+            int(count.group(1)) if count else None,
+        )
+
+    def download(self, rettype: str, mcid: str, key: str, path: str, **kwargs) -> bool:
+        """
+        Called to download the metadata of a query's results.
+
+        Parameters:
+        rettype - runinfo for the csv or exp for the xml metadata - str
+        mcid - MCID of the query - str
+        key - query key of the query - str
+        path - file to write the metadata to - str
+        count - number of results (experiments) of the query, None if unknown - int
+        page_size - results downloaded per request, 0 for a single request - int
+        jobs - pages downloaded at once - int
+
+        Functionality:
+            If the results are more than a page, the first page is downloaded.
+            For the xml, it is checked to hold no more than a page of
+            experiment packages, otherwise the server has ignored the paging
+            and the first page is used as the whole result.  The remaining
+            pages are downloaded concurrently, each retried on its own, and
+            then joined into one csv or xml.
+
+        Returns True if the download was paged
+        """
+
+        count = kwargs.get("count")
+        page_size = kwargs.get("page_size", 0)
+        url = f"{self.trace_url}?rettype={rettype}&WebEnv=MCID_{mcid}&query_key={key}"
+        if not page_size or count is None or count <= page_size:
+            self.get(url, path)
+            return False
+
+        pages = [f"{path}.page{page}" for page in range(-(-count // page_size))]
+        try:
+            self.get(f"{url}&retstart=0&retmax={page_size}", pages[0])
+            if rettype == "exp" and count_packages(pages[0]) > page_size:
+                print("Paging of SRA metadata not supported, using a single download")
+                os.replace(pages[0], path)
+                return False
+            with ThreadPoolExecutor(max_workers=kwargs.get("jobs", 4)) as executor:
+                for future in [
+                    executor.submit(
+                        self.get,
+                        f"{url}&retstart={page * page_size}&retmax={page_size}",
+                        page_path,
+                    )
+                    for page, page_path in enumerate(pages)
+                    if page
+                ]:
+                    future.result()
+            join_pages(pages, path, rettype)
+        finally:
+            for page_path in pages:
+                if os.path.isfile(page_path):
+                    os.remove(page_path)
+        return True
+
+    def close(self):
+        """
+        Closes the client's connections
+        """
+
+        self.pool.close()
+
+
+def count_packages(path: str) -> int:
+    """
+    Called to count the experiment packages in a downloaded xml without
+    loading the file
+
+    Returns the count
+    """
+
+    packages = 0
+    package_re = re.compile(rb"<EXPERIMENT_PACKAGE[\s>]")
+    with open(path, "rb") as page_fh:
+        # the end of each block is kept to find tags split between blocks,
+        # it's shorter than a full match so none are counted twice
+        tail = b""
+        for block in iter(lambda: page_fh.read(1 << 20), b""):
+            block = tail + block
+            packages += len(package_re.findall(block))
+            tail = block[-19:]
+    return packages
+
+
+def page_range(page_fh, rettype: str, first: bool, last: bool) -> tuple:
+    """
+    Returns the start and end offsets of a page's content to keep when
+    joining pages: the csv header is only kept for the first page and the xml
+    declaration and root element are only opened in the first page and
+    closed in the last
+    """
+
+    page_fh.seek(0, os.SEEK_END)
+    size = page_fh.tell()
+    start, end = 0, size
+    page_fh.seek(0)
+    if rettype == "exp":
+        head = page_fh.read(1 << 16)
+        root_start = head.find(b"<" + ROOT_TAG)
+        if not first and root_start >= 0:
+            start = head.find(b">", root_start) + 1
+            start += len(head[start:]) - len(head[start:].lstrip())
+        if not last:
+            page_fh.seek(max(0, size - (1 << 16)))
+            tail = page_fh.read()
+            root_end = tail.rfind(b"</" + ROOT_TAG)
+            if root_end >= 0:
+                end = size - len(tail) + root_end
+    elif not first:
+        start = len(page_fh.readline())
+    return start, end
+
+
+def join_pages(pages: list, path: str, rettype: str):
+    """
+    Called to join downloaded pages of metadata into one file, streaming
+    each page's content into the output
+    """
+
+    with open(path, "wb") as out_fh:
+        for page, page_path in enumerate(pages):
+            with open(page_path, "rb") as page_fh:
+                start, end = page_range(
+                    page_fh, rettype, page == 0, page == len(pages) - 1
+                )
+                page_fh.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = page_fh.read(min(remaining, 1 << 20))
+                    if not block:
+                        break
+                    out_fh.write(block)
+                    remaining -= len(block)
+
+
+def query_sra(client: SraClient, search_str: str, date_stamp: str, **kwargs) -> int:
+    """
+    Called to search SRA and download the query's run info csv and
+    experiment xml, tagged with the date stamp.
+
+    Parameters:
+    client - client to make the requests - SraClient
+    search_str - string for the query - str
+    date_stamp - timestamp of current query - str
+    page_size - results downloaded per request, 0 for a single request - int
+    jobs - pages downloaded at once - int
+
+    Returns the number of results, -1 if the results can't be used to
+    download metadata
+    """
+
+    mcid, key, count = client.search(search_str, f"search_results_{date_stamp}.html")
+    if not (mcid and key):
+        return -1
+    # the xml is downloaded first as it is used to check paging is supported
+    if not client.download(
+        "exp", mcid, key, f"sra_meta_{date_stamp}.xml", count=count, **kwargs
+    ):
+        kwargs["page_size"] = 0
+    client.download(
+        "runinfo", mcid, key, f"sra_data_{date_stamp}.csv", count=count, **kwargs
+    )
+    return count if count is not None else 0
+
+
+def query_runs_exp(client: SraClient, accessions: list, path: str, **kwargs) -> int:
+    """
+    Called to download the experiment xml for a list of run accessions, used
+    by incremental queries to fetch only new and updated runs.
+
+    Parameters:
+    client - client to make the requests - SraClient
+    accessions - run accessions to download - list
+    path - xml file to write - str
+    batch_size - accessions searched for at once - int
+    page_size - results downloaded per request, 0 for a single request - int
+    jobs - pages downloaded at once - int
+
+    Functionality:
+        The accessions are searched for in batches ("acc1+or+acc2...") and the
+        xml of each batch downloaded and joined into one file.  With no
+        accessions an xml with no experiment packages is written.
+
+    Returns the number of batches
+    """
+
+    batch_size = kwargs.pop("batch_size", 200)
+    batches = [
+        accessions[start : start + batch_size]
+        for start in range(0, len(accessions), batch_size)
+    ]
+    if not batches:
+        with open(path, "w", encoding="utf-8") as out_fh:
+            out_fh.write('<?xml version="1.0" ?>\n<EXPERIMENT_PACKAGE_SET>\n')
+            out_fh.write("</EXPERIMENT_PACKAGE_SET>\n")
+        return 0
+    pages = [f"{path}.batch{batch}" for batch in range(len(batches))]
+    try:
+        for batch, page_path in zip(batches, pages):
+            mcid, key, count = client.search("+or+".join(batch), f"{path}.search.html")
+            if not (mcid and key):
+                raise ConnectionError(f"No MCID or query key found for {batch[0]}...")
+            client.download("exp", mcid, key, page_path, count=count, **kwargs)
+        join_pages(pages, path, "exp")
+    finally:
+        for page_path in pages + [f"{path}.search.html"]:
+            if os.path.isfile(page_path):
+                os.remove(page_path)
+    return len(batches)
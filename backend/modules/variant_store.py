@@ -0,0 +1,324 @@
+"""
+This module has the variant store kept beside endpoints/VCs.tsv by
+aggregate_endpoints() in snakefunctions.py.  Every ivar variant call of the
+aggregated samples is a row of a SQLite database, endpoints/variants.sqlite,
+with the sample's collection date and location, indexed by position,
+nucleotide mutation (ie A23063T), amino acid mutation (ie S:N501Y) and
+sample, so questions about a mutation, region or sample are answered
+without reading VCs.tsv.
+
+Query from python, ie
+    store = VariantStore("endpoints/variants.sqlite")
+    store.mutation("S:N501Y")
+or from the command line
+    python variant_store.py endpoints/variants.sqlite mutation S:N501Y
+    python variant_store.py endpoints/variants.sqlite region 23000 23100
+    python variant_store.py endpoints/variants.sqlite sample SRR17866146
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+from aggregate_index import tsv_blocks
+
+STORE_FILE = "endpoints/variants.sqlite"
+COLUMNS = (
+    "accession",
+    "pos",
+    "ref",
+    "alt",
+    "mutation",
+    "aa_mutation",
+    "ref_dp",
+    "alt_dp",
+    "alt_freq",
+    "total_dp",
+    "pval",
+    "pass",
+    "gff_feature",
+    "ref_aa",
+    "alt_aa",
+)
+
+
+def read_cds(gff: str) -> dict:
+    """
+    Called to get the coding sequences of the reference annotation
+
+    Parameters:
+    gff - gff3 of the reference - str
+
+    Returns dict of the gene and segments (1 based, inclusive) of each CDS ID
+    """
+
+    cds = {}
+    with open(gff, "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 9 or fields[2] != "CDS":
+                continue
+            attrs = dict(
+                attr.split("=", 1) for attr in fields[8].split(";") if "=" in attr
+            )
+            entry = cds.setdefault(attrs["ID"], {"gene": attrs.get("gene"), "segs": []})
+            entry["segs"].append((int(fields[3]), int(fields[4])))
+    return cds
+
+
+def aa_position(segs: list, pos: int) -> int:
+    """
+    Returns the codon number of the reference position in the CDS's
+    segments, 0 if outside them
+    """
+
+    offset = 0
+    for start, end in segs:
+        if start <= pos <= end:
+            return (offset + pos - start) // 3 + 1
+        offset += end - start + 1
+    return 0
+
+
+def number(value: str, kind: type):
+    """
+    Returns the tsv field as the numeric type, None if it is missing or NA
+    """
+
+    if value in (None, "", "NA"):
+        return None
+    return kind(value)
+
+
+def read_meta(meta_file: str) -> dict:
+    """
+    Returns dict of the collection date and location of each sample of a
+    sra_meta_collect tsv, empty if there isn't one
+    """
+
+    if not os.path.isfile(meta_file):
+        return {}
+    with open(meta_file, "r", encoding="utf-8") as in_fh:
+        reader = csv.reader(in_fh, delimiter="\t")
+        next(reader, None)
+        return {row[0]: (row[1], row[2]) for row in reader if len(row) >= 3}
+
+
+class VariantStore:
+    """
+    Indexed store of the samples' variant calls.
+
+    Parameters:
+    path - SQLite database file - str
+    gff - reference annotation used to name the amino acid mutations - str
+
+    Functionality:
+        Samples' calls are replaced as a whole when they are added again.
+        When the database is first created, the samples already in the
+        VCs.tsv beside it are loaded, so existing endpoints carry over.
+    """
+
+    def __init__(self, path: str = STORE_FILE, gff: str = ""):
+        new_store = not os.path.isfile(path)
+        self.cds = read_cds(gff) if gff else {}
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS samples (
+                accession TEXT PRIMARY KEY,
+                collection_date TEXT,
+                location TEXT
+            );
+            CREATE TABLE IF NOT EXISTS variants (
+                accession TEXT,
+                pos INTEGER,
+                ref TEXT,
+                alt TEXT,
+                mutation TEXT,
+                aa_mutation TEXT,
+                ref_dp INTEGER,
+                alt_dp INTEGER,
+                alt_freq REAL,
+                total_dp INTEGER,
+                pval REAL,
+                pass INTEGER,
+                gff_feature TEXT,
+                ref_aa TEXT,
+                alt_aa TEXT
+            );
+            CREATE INDEX IF NOT EXISTS variants_pos ON variants (pos);
+            CREATE INDEX IF NOT EXISTS variants_mutation ON variants (mutation);
+            CREATE INDEX IF NOT EXISTS variants_aa ON variants (aa_mutation);
+            CREATE INDEX IF NOT EXISTS variants_accession ON variants (accession);
+            """
+        )
+        vcs = os.path.join(os.path.dirname(path) or ".", "VCs.tsv")
+        if new_store and os.path.isfile(vcs):
+            self.import_aggregate(vcs)
+
+    def rows(self, accession: str, lines) -> list:
+        """
+        Returns the store's rows for the lines of a sample's ivar variants
+        tsv, with its header
+        """
+
+        reader = csv.DictReader(lines, delimiter="\t")
+        rows = []
+        for call in reader:
+            if not call.get("POS"):
+                continue
+            pos = int(call["POS"])
+            aa_mutation = None
+            feature = self.cds.get(call.get("GFF_FEATURE"))
+            if feature and call.get("REF_AA", "NA") not in ("NA", None):
+                aa_mutation = (
+                    f"{feature['gene']}:{call['REF_AA']}"
+                    f"{aa_position(feature['segs'], pos)}{call['ALT_AA']}"
+                )
+            rows.append(
+                (
+                    accession,
+                    pos,
+                    call["REF"],
+                    call["ALT"],
+                    f"{call['REF']}{pos}{call['ALT']}",
+                    aa_mutation,
+                    number(call.get("REF_DP"), int),
+                    number(call.get("ALT_DP"), int),
+                    number(call.get("ALT_FREQ"), float),
+                    number(call.get("TOTAL_DP"), int),
+                    number(call.get("PVAL"), float),
+                    int(call.get("PASS") == "TRUE"),
+                    call.get("GFF_FEATURE"),
+                    call.get("REF_AA"),
+                    call.get("ALT_AA"),
+                )
+            )
+        return rows
+
+    def add(self, accession: str, lines, meta: tuple = ("", "")):
+        """
+        Called to add or replace a sample's variant calls
+
+        Parameters:
+        accession - sample accession - str
+        lines - lines of the sample's ivar variants tsv - iterable
+        meta - the sample's collection date and location - tuple
+
+        Returns the number of calls stored
+        """
+
+        rows = self.rows(accession, lines)
+        with self.conn:
+            self.conn.execute("DELETE FROM variants WHERE accession = ?", (accession,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO samples (accession, collection_date, location) "
+                "VALUES (?, ?, ?)",
+                (accession, *meta),
+            )
+            self.conn.executemany(
+                f"INSERT INTO variants ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+        return len(rows)
+
+    def import_aggregate(self, vcs: str) -> int:
+        """
+        Called to load the samples of an aggregate VCs.tsv
+
+        Returns the number of samples loaded
+        """
+
+        with open(vcs, "rb") as in_fh:
+            data = in_fh.read()
+        samples = 0
+        for accession, offset, length in tsv_blocks(data):
+            block = data[offset : offset + length].decode()
+            self.add(accession, block.split("\n")[1:])
+            samples += 1
+        return samples
+
+    def query(self, where: str, args: tuple) -> list:
+        """
+        Returns list of dicts of the calls matching the where clause, with
+        their samples' dates and locations
+        """
+
+        return [
+            dict(row)
+            for row in self.conn.execute(
+                "SELECT variants.*, samples.collection_date, samples.location "
+                "FROM variants JOIN samples USING (accession) "
+                f"WHERE {where} ORDER BY variants.accession, pos",
+                args,
+            )
+        ]
+
+    def mutation(self, mutation: str) -> list:
+        """
+        Returns the calls of a nucleotide (A23063T) or amino acid (S:N501Y)
+        mutation in all samples
+        """
+
+        column = "aa_mutation" if ":" in mutation else "mutation"
+        return self.query(f"{column} = ?", (mutation,))
+
+    def region(self, start: int, end: int) -> list:
+        """
+        Returns the calls between the reference positions, inclusive
+        """
+
+        return self.query("pos BETWEEN ? AND ?", (start, end))
+
+    def samples(self, first: str, last: str = "") -> list:
+        """
+        Returns the calls of a sample, or of the accessions from first to
+        last inclusive
+        """
+
+        return self.query("variants.accession BETWEEN ? AND ?", (first, last or first))
+
+    def close(self):
+        """
+        Closes the store
+        """
+
+        self.conn.close()
+
+
+def main(argv=None) -> int:
+    """
+    Prints the calls of a query as a tsv
+
+    Returns the exit code
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("store", help="variants.sqlite")
+    parser.add_argument("query", choices=("mutation", "region", "sample"))
+    parser.add_argument("args", nargs="+")
+    args = parser.parse_args(argv)
+
+    store = VariantStore(args.store)
+    if args.query == "mutation":
+        calls = store.mutation(args.args[0])
+    elif args.query == "region":
+        calls = store.region(int(args.args[0]), int(args.args[-1]))
+    else:
+        calls = store.samples(args.args[0], args.args[-1])
+    store.close()
+    writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+    writer.writerow(COLUMNS + ("collection_date", "location"))
+    for call in calls:
+        writer.writerow(
+            call[column] for column in COLUMNS + ("collection_date", "location")
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 """
 Common code for unit testing of rules generated with Snakemake 7.8.0.
-Last edited on 7-12-22
+Last edited on 10-18-26
 """
 
 import os
@@ -10,6 +10,8 @@ import shutil
 from pathlib import Path, PurePosixPath
 import subprocess as sp
 
+MATRIX_DIRS = ("freq_matrix", "depth_matrix")
+
 
 def run_snakemake(workdir, target, add_args):
     """
@@ -101,7 +103,17 @@ class OutputChecker:
         for path, subdirs, files in os.walk(self.workdir):
             for file in files:
                 file = (Path(path) / file).relative_to(self.workdir)
-                if str(file).startswith(".snakemake"):
+                if str(file).startswith(".snakemake") or str(file).endswith(".sqlite"):
+                    # snakemake's and the pipeline's state databases
+                    continue
+                if str(file).endswith(".mmi"):
+                    # the reference's minimap2 index
+                    continue
+                if str(file).endswith(".pileup.log"):
+                    # the log of the pileup shared by the consensus and vc rules
+                    continue
+                if file.parent.name in MATRIX_DIRS:
+                    # the aggregate step's binary matrices
                     continue
                 if file in expected_files:
                     if not (
@@ -1,9 +1,11 @@
 """
 Fixture for decompressing testing support files
-and removing them after the test
+and removing them after the test, and for the
+stand in SRA server
 """
 import subprocess as sp
 import pytest
+import stand_in
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -28,3 +30,15 @@ def necessary_files():
     sp.run("rm -rf tests/quality_check", shell=True, check=True)
     sp.run("rm -rf tests/sam2bam", shell=True, check=True)
     sp.run("rm -rf tests/vc", shell=True, check=True)
+
+
+@pytest.fixture(name="stand_in")
+def fixture_stand_in():
+    """
+    runs a local stand in for NCBI's SRA servers, see stand_in.py
+    """
+
+    server = stand_in.start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
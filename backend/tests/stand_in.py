@@ -0,0 +1,151 @@
+"""
+    stand in for NCBI's SRA search and metadata servers with canned
+    responses, used to test the SRA http client offline
+    last edited 10-18-26
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.realpath("modules"))
+import sra_client  # pylint: disable=wrong-import-position
+
+RUNS = 23
+SEARCH_HTML = (
+    '<html><head><meta name="ncbi_resultcount" content="{count}" /></head>'
+    '<body><input name="EntrezSystem2.PEntrez.DbConnector.Cmd" value="MCID_6789abc"/>'
+    "<script>var x = {{query_key:&quot;1&quot;, db:&quot;sra&quot;}};</script>"
+    "</body></html>"
+)
+CSV_HEADER = "Run,ReleaseDate,LoadDate,spots,bases,size_MB\n"
+
+
+def runinfo(start, stop, load_dates=None):
+    """
+    canned run info csv for the runs
+    """
+
+    load_dates = load_dates or {}
+    return CSV_HEADER + "".join(
+        f"SRR{run:07d},2022-07-01,{load_dates.get(run, '2022-07-01')},"
+        f"{run * 10},{run * 1500},{run}\n"
+        for run in range(start, stop)
+    )
+
+
+def exp_xml(start, stop, runs=None):
+    """
+    canned experiment xml for the runs
+    """
+
+    return (
+        '<?xml version="1.0" ?>\n<EXPERIMENT_PACKAGE_SET>\n'
+        + "".join(
+            f'<EXPERIMENT_PACKAGE><RUN_SET><RUN accession="SRR{run:07d}"/>'
+            "</RUN_SET></EXPERIMENT_PACKAGE>\n"
+            for run in (runs if runs is not None else range(start, stop))
+        )
+        + "</EXPERIMENT_PACKAGE_SET>\n"
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves search results and paged metadata, failing the first request for
+    each page to test retries
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        handles the get requests
+        """
+
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address[1]))
+            first_try = self.path not in server.seen
+            server.seen.add(self.path)
+        url = urlsplit(self.path)
+        args = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/redirect/":
+            self.reply(302, b"", {"Location": f"/sra/?{url.query}"})
+        elif url.path == "/sra/" and args["term"].startswith("SRR"):
+            # searches for lists of run accessions get their own MCID
+            runs = [int(acc[3:]) for acc in args["term"].split(" or ")]
+            with server.lock:
+                server.searches.append(runs)
+                mcid = f"runs{len(server.searches) - 1}"
+            body = SEARCH_HTML.format(count=len(runs)).replace("6789abc", mcid)
+            self.reply(200, body.encode())
+        elif url.path == "/sra/":
+            body = SEARCH_HTML.format(count=server.count).encode()
+            self.reply(200, body, {"Set-Cookie": "ncbi_sid=abc; path=/"})
+        elif args.get("WebEnv", "").startswith("MCID_runs"):
+            runs = server.searches[int(args["WebEnv"][9:])]
+            self.reply(200, exp_xml(0, 0, runs).encode())
+        elif first_try and "retstart" in args and args["retstart"] != "0":
+            self.reply(503, b"busy")
+        else:
+            start = int(args.get("retstart", 0))
+            if server.paging and "retmax" in args:
+                stop = min(server.count, start + int(args["retmax"]))
+            else:
+                start, stop = 0, server.count
+            if args["rettype"] == "runinfo":
+                body = runinfo(start, stop, server.load_dates).encode()
+            else:
+                body = exp_xml(start, stop).encode()
+            self.reply(200, body)
+
+    def reply(self, status, body, headers=None):
+        """
+        sends the response with a content length so connections are kept alive
+        """
+
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """
+        keeps the test output quiet
+        """
+
+
+def start_server():
+    """
+    runs the stand in server on a free local port in a thread
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.seen = set()
+    server.searches = []
+    server.count = RUNS
+    server.paging = True
+    server.load_dates = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def make_client(server, **kwargs):
+    """
+    client pointed at the stand in server
+    """
+
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return sra_client.SraClient(
+        search_url=f"{base}/redirect/",
+        trace_url=f"{base}/trace",
+        backoff=0.01,
+        **kwargs,
+    )
@@ -0,0 +1,140 @@
+"""
+    module for testing the index of the aggregate files
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import aggregate_index  # pylint: disable=wrong-import-position
+import snakefunctions  # pylint: disable=wrong-import-position
+
+
+def write_endpoints(accs, variant):
+    """
+    writes variants, consensus and lineage files for the samples
+    """
+
+    for acc in accs:
+        with open(f"endpoints/{acc}.tsv", "w", encoding="utf-8") as out_fh:
+            out_fh.write(f"REGION\tPOS\tREF\tALT\nNC_045512.2\t{variant}\n")
+        with open(f"endpoints/{acc}.fa", "w", encoding="utf-8") as out_fh:
+            out_fh.write(f">Consensus_{acc}_threshold_0.5_quality_15\nACGT{variant}\n")
+        with open(f"endpoints/{acc}.lineages.tsv", "w", encoding="utf-8") as out_fh:
+            out_fh.write(f"\tendpoints/{acc}.tsv\nlineages\tBA.{variant}\n")
+    return (
+        [f"endpoints/{acc}.tsv" for acc in accs],
+        [f"endpoints/{acc}.fa" for acc in accs],
+        [f"endpoints/{acc}.lineages.tsv" for acc in accs],
+    )
+
+
+def read(path):
+    """
+    returns the file's content
+    """
+
+    with open(path, "r", encoding="utf-8") as in_fh:
+        return in_fh.read()
+
+
+def test_aggregate_endpoints(tmp_path, monkeypatch):
+    """
+    function to test samples are aggregated in the repo's formats, found by
+    accession without matching accessions containing them, replaced with
+    tombstones when reprocessed and the files compacted
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    snakefunctions.aggregate_endpoints(*write_endpoints(["SRR11", "SRR2"], 1), False)
+    first = {name: read(f"endpoints/{name}") for name in aggregate_index.AGGREGATES}
+    assert first["VCs.tsv"] == "".join(
+        f"{acc}\n{read(f'endpoints/{acc}.tsv')}\n--------\n"
+        for acc in ("SRR11", "SRR2")
+    )
+    assert first["Consensus.fa"] == read("endpoints/SRR11.fa") + read(
+        "endpoints/SRR2.fa"
+    )
+
+    # SRR1 is a substring of SRR11 but not yet aggregated
+    snakefunctions.aggregate_endpoints(*write_endpoints(["SRR1", "SRR2"], 2), False)
+    for name, content in first.items():
+        added = read(f"endpoints/{name}")
+        assert added.startswith(content)
+        assert "SRR1\n" in added or "Consensus_SRR1_" in added
+        assert added.count("SRR2") == content.count("SRR2")
+
+    # reprocessing tombstones the old blocks in place and appends the new
+    sizes = {name: os.path.getsize(f"endpoints/{name}") for name in first}
+    snakefunctions.aggregate_endpoints(*write_endpoints(["SRR2"], 3), True)
+    vcs = read("endpoints/VCs.tsv")
+    blocks = [block for block in vcs.split("\n--------\n") if block.strip()]
+    assert [block.split("\n")[0] for block in blocks] == ["SRR11", "SRR1", "SRR2"]
+    assert "NC_045512.2\t1\n" not in vcs.split("SRR2\n")[1]
+    assert read("endpoints/Consensus.fa").count(">") == 3
+    assert read("endpoints/Consensus.fa").endswith(read("endpoints/SRR2.fa"))
+
+    for name, kind in aggregate_index.AGGREGATES.items():
+        agg = aggregate_index.AggregateFile(f"endpoints/{name}", kind)
+        assert agg.size == os.path.getsize(f"endpoints/{name}")
+        assert agg.dead == os.path.getsize(f"endpoints/{name}") - sizes[name] > 0
+        agg.close()
+    assert aggregate_index.main(["endpoints"]) == 0
+    assert read("endpoints/Consensus.fa") == "".join(
+        read(f"endpoints/{acc}.fa") for acc in ("SRR11", "SRR1", "SRR2")
+    )
+    assert read("endpoints/Lineages.tsv") == "".join(
+        f"{acc}\n{read(f'endpoints/{acc}.lineages.tsv')}\n--------\n"
+        for acc in ("SRR11", "SRR1", "SRR2")
+    )
+
+
+def test_aggregate_rebuild(tmp_path):
+    """
+    function to test the index is rebuilt from aggregate files written
+    without it or changed since it was written
+    """
+
+    vcs = tmp_path / "VCs.tsv"
+    vcs.write_text(
+        "SRR1\nREGION\tPOS\n\n--------\n\n\n--------\nSRR11\nREGION\tPOS\n\n--------\n"
+    )
+    con = tmp_path / "Consensus.fa"
+    con.write_text(
+        ">Consensus_SRR1_threshold_0.5_quality_15\nAC\nGT\n\n\n"
+        ">Consensus_SRR11_threshold_0.5_quality_15\nTT\n"
+    )
+    agg = aggregate_index.AggregateFile(str(vcs), "tsv")
+    assert agg.present("SRR1") and agg.present("SRR11") and not agg.present("SRR")
+    assert agg.dead == len("\n\n--------\n")
+    agg.close()
+    agg = aggregate_index.AggregateFile(str(con), "fasta")
+    assert agg.present("SRR11")
+    agg.add("SRR1", b">Consensus_SRR1_threshold_0.5_quality_15\nGG\n")
+    agg.close()
+    assert con.read_text().startswith("\n" * len(">Consensus_SRR1_threshold_0.5"))
+
+    with open(vcs, "a", encoding="utf-8") as out_fh:
+        out_fh.write("SRR3\nREGION\tPOS\n\n--------\n")
+    agg = aggregate_index.AggregateFile(str(vcs), "tsv")
+    assert agg.present("SRR3")
+    agg.close()
+
+
+def test_aggregate_empty(tmp_path, monkeypatch):
+    """
+    function to test aggregate files are only made once a sample is added
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    vc_list, _, lin_list = write_endpoints(["SRR1"], 1)
+    snakefunctions.aggregate_endpoints(vc_list, [], lin_list, False)
+    assert os.path.isfile("endpoints/VCs.tsv")
+    assert not os.path.exists("endpoints/Consensus.fa")
+    agg = aggregate_index.AggregateFile("endpoints/Consensus.fa", "fasta")
+    assert not agg.present("SRR1")
+    assert agg.compact() == 0
+    agg.close()
+    assert not os.path.exists("endpoints/Consensus.fa")
@@ -0,0 +1,149 @@
+"""
+    module for testing the amplicon coverage report
+    last edited 10-18-26
+"""
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.realpath("modules"))
+import amplicon_coverage  # pylint: disable=wrong-import-position
+import depth_matrix  # pylint: disable=wrong-import-position
+import snakefunctions  # pylint: disable=wrong-import-position
+
+numpy = pytest.importorskip("numpy")
+
+DATA = os.path.realpath(".")
+
+
+def test_amplicons():
+    """
+    function to test amplicons are paired by name, with alternate primers,
+    or by position
+    """
+
+    artic = amplicon_coverage.amplicons("data/articv3.bed")
+    assert len(artic) == 98
+    assert artic[0] == ("nCoV-2019_1", 54, 385)
+    # nCoV-2019_7_LEFT_alt0 is an alternate primer of amplicon 7
+    assert artic[6] == ("nCoV-2019_7", 1897, 2242)
+    assert amplicon_coverage.amplicons("data/SpikeSeq.bed") == [
+        ("NTD", 21729, 22221),
+        ("RBD", 22794, 23300),
+        ("iSeq", 22859, 23077),
+        ("SJ", 23221, 23741),
+    ]
+    snap = amplicon_coverage.amplicons("data/SNAP.bed")
+    assert snap[0] == ("3_322", 56, 301)
+    assert all(0 < end - start <= 2500 for _, start, end in snap)
+
+
+def test_coverage():
+    """
+    function to test the vectorized coverage matches the amplicons' depths
+    """
+
+    index = amplicon_coverage.AmpliconIndex("data/articv4.1.bed", 29903)
+    rng = numpy.random.default_rng(1)
+    depths = rng.integers(0, 30, (3, 29903)).astype("<u4")
+    means, breadths = index.coverage(depths, 10)
+    for sample in range(3):
+        for amplicon in (0, 50, len(index.names) - 1):
+            insert = depths[
+                sample, index.starts[amplicon] : index.ends[amplicon]
+            ].astype(int)
+            assert means[sample, amplicon] == pytest.approx(insert.mean())
+            assert breadths[sample, amplicon] == pytest.approx((insert >= 10).mean())
+
+
+def write_depth(acc, covered):
+    """
+    writes a sample's variants and a .depth file with 100 reads over the
+    covered 1 based positions
+    """
+
+    with open(f"endpoints/{acc}.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write("REGION\tPOS\tREF\tALT\n")
+    with open(f"endpoints/{acc}.depth", "w", encoding="utf-8") as out_fh:
+        for pos in covered:
+            out_fh.write(f"NC_045512.2\t{pos}\tA\t100\n")
+    return f"endpoints/{acc}.tsv"
+
+
+def read_report(report="endpoints/AmpliconCoverage.tsv"):
+    """
+    returns the report's rows
+    """
+
+    with open(report, "r", encoding="utf-8") as in_fh:
+        return list(csv.DictReader(in_fh, delimiter="\t"))
+
+
+def test_amplicon_report(tmp_path, monkeypatch):
+    """
+    function to test the samples' amplicons are reported with their
+    dropouts, samples without beds skipped and samples reported again
+    replaced
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    vcs = [
+        write_depth("SRR1", range(1, 29904)),
+        write_depth("SRR2", range(55, 250)),
+        write_depth("SRR3", range(1, 29904)),
+    ]
+    snakefunctions.aggregate_endpoints(vcs, [], [], False)
+    beds = {
+        "SRR1": {"bed": "data/articv3.bed"},
+        "SRR2": {"bed": "data/articv3.bed"},
+        "SRR3": {"bed": "Unknown"},
+    }
+    assert snakefunctions.amplicon_report(beds, 10, 0.5) == 2
+    rows = read_report()
+    assert len(rows) == 2 * 98
+    assert {row["accession"] for row in rows} == {"SRR1", "SRR2"}
+    assert all(row["dropout"] == "0" for row in rows if row["accession"] == "SRR1")
+    srr2 = [row for row in rows if row["accession"] == "SRR2"]
+    assert srr2[0]["amplicon"] == "nCoV-2019_1"
+    assert (srr2[0]["start"], srr2[0]["end"]) == ("54", "385")
+    assert srr2[0]["breadth"] == f"{195 / 331:.4f}"
+    assert srr2[0]["mean_depth"] == f"{19500 / 331:.2f}"
+    assert srr2[0]["dropout"] == "0"
+    assert all(row["dropout"] == "1" for row in srr2[1:])
+
+    # SRR2's rows are replaced
+    write_depth("SRR2", range(1, 29904))
+    snakefunctions.aggregate_endpoints(["endpoints/SRR2.tsv"], [], [], True)
+    assert snakefunctions.amplicon_report({"SRR2": beds["SRR2"]}, 10, 0.5) == 1
+    rows = read_report()
+    assert [row["accession"] for row in rows[:: len(rows) // 2]] == ["SRR1", "SRR2"]
+    assert all(row["dropout"] == "0" for row in rows)
+
+    # the archive with the beds of the metadata
+    with open("sra_meta_collect_current.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write("Accession\tcollectiong data\tgeo_loc\tprimers\n")
+        for acc, bed in (("SRR1", "Unknown"), ("SRR3", "data/SpikeSeq.bed")):
+            out_fh.write(f"{acc}\t2022-01-02\tUSA\t{bed}\n")
+    assert (
+        amplicon_coverage.main(
+            [
+                "endpoints/depth_matrix",
+                "sra_meta_collect_current.tsv",
+                "--data",
+                DATA,
+                "-o",
+                "archive.tsv",
+            ]
+        )
+        == 0
+    )
+    assert [row["amplicon"] for row in read_report("archive.tsv")] == [
+        "NTD",
+        "RBD",
+        "iSeq",
+        "SJ",
+    ]
+    assert depth_matrix.DepthMatrix().accessions == ["SRR1", "SRR2", "SRR3"]
@@ -0,0 +1,113 @@
+"""
+    module for testing the reference difference archive of the consensus sequences
+    last edited 10-18-26
+"""
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import aggregate_index  # pylint: disable=wrong-import-position
+import consensus_archive  # pylint: disable=wrong-import-position
+import snakefunctions  # pylint: disable=wrong-import-position
+
+REFERENCE = os.path.realpath("data/SARS2.fasta")
+EXPECTED = os.path.realpath("tests/aggregate/expected/endpoints/Consensus.fa")
+
+
+def read(path):
+    """
+    returns the file's content
+    """
+
+    with open(path, "r", encoding="utf-8") as in_fh:
+        return in_fh.read()
+
+
+def test_encode():
+    """
+    function to test substitutions, N runs and indels, at the ends and
+    between matches, are reproduced from the ops
+    """
+
+    ref = consensus_archive.read_reference(REFERENCE)[1]
+    index = consensus_archive.kmer_index(ref)
+    seq = (
+        "N" * 54
+        + ref[54:1000]
+        + "T"
+        + ref[1001:5000]
+        + "ACGTA"
+        + ref[5000:9000]
+        + ref[9009:12000]
+        + "NNNNN"
+        + "G"
+        + ref[12006:20000]
+        + "N" * 300
+        + ref[20280:29850]
+    )
+    ops = consensus_archive.encode(ref, index, seq)
+    assert consensus_archive.decode(ref, ops) == seq
+    assert ops == [
+        ("N", 0, 54, 54),
+        ("S", 1000, "T"),
+        ("R", 5000, 0, "ACGTA"),
+        ("R", 9000, 9, ""),
+        ("N", 12000, 5, 5),
+        ("S", 12005, "G"),
+        ("N", 20000, 280, 300),
+        ("R", 29850, 53, ""),
+    ]
+    assert consensus_archive.unpack(consensus_archive.pack(ops)) == ops
+    assert consensus_archive.decode(ref, []) == ref
+
+
+def test_consensus_archive(tmp_path, monkeypatch):
+    """
+    function to test the aggregate step archives the consensus sequences,
+    a new archive loads Consensus.fa, samples are replaced, decoded singly
+    or all together and exported as fasta
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    shutil.copy(EXPECTED, "endpoints/Consensus.fa")
+    data = read(EXPECTED).encode()
+    records = {
+        acc: data[offset : offset + length].decode()
+        for acc, offset, length in aggregate_index.fasta_blocks(data)
+    }
+    with open("endpoints/SRR1.fa", "w", encoding="utf-8") as out_fh:
+        out_fh.write(">Consensus_SRR1_threshold_0.5_quality_15\nACGT\nAC\n")
+    snakefunctions.aggregate_endpoints([], ["endpoints/SRR1.fa"], [], False)
+
+    archive = consensus_archive.ConsensusArchive("endpoints/consensus_archive.sqlite")
+    assert archive.accessions() == list(records) + ["SRR1"]
+    for acc, record in records.items():
+        assert archive.get(acc) == record
+    assert archive.get("SRR1") == read("endpoints/SRR1.fa")
+    assert archive.get("SRR2") == ""
+    assert dict(archive.records())["SRR1"] == read("endpoints/SRR1.fa")
+    stored = archive.conn.execute(
+        "SELECT SUM(LENGTH(delta)) FROM consensus WHERE raw = 0"
+    ).fetchone()[0]
+    assert stored * 10 < sum(len(record) for record in records.values())
+    archive.close()
+
+    # reprocessing replaces the sample's record
+    with open("endpoints/SRR1.fa", "w", encoding="utf-8") as out_fh:
+        out_fh.write(">Consensus_SRR1_threshold_0.5_quality_15\nTTTT\n")
+    snakefunctions.aggregate_endpoints([], ["endpoints/SRR1.fa"], [], True)
+    assert (
+        consensus_archive.main(["endpoints/consensus_archive.sqlite", "-o", "all.fa"])
+        == 0
+    )
+    assert read("all.fa") == "".join(records.values()) + read("endpoints/SRR1.fa")
+    assert (
+        consensus_archive.main(
+            ["endpoints/consensus_archive.sqlite", "SRR1", "-o", "one.fa"]
+        )
+        == 0
+    )
+    assert read("one.fa") == read("endpoints/SRR1.fa")
+    assert consensus_archive.main(["endpoints/consensus_archive.sqlite", "SRR2"]) == 1
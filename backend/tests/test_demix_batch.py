@@ -0,0 +1,112 @@
+"""
+    module for testing the batch lineage demixing worker with stand in
+    barcodes, so freyja's barcodes aren't needed; needs freyja, ie from
+    the envs/freyja.yaml env
+    last edited 10-18-26
+"""
+import json
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.realpath("modules"))
+import demix_batch  # pylint: disable=wrong-import-position
+
+pytest.importorskip("freyja")
+
+BARCODES = {
+    "BA.1": ["C241T", "C3037T", "A23403G", "C21618T"],
+    "BA.2": ["C241T", "C3037T", "A23403G", "T22917G"],
+    "B.1": ["C241T", "A23403G"],
+}
+META = [
+    {"who_name": "Omicron", "pango_descendants": ["BA.1", "BA.2"]},
+    {"who_name": None, "pango_descendants": ["B.1"]},
+]
+
+
+def write_sample(path, freqs):
+    """
+    writes an ivar variants tsv and depth file with the mutation frequencies
+    """
+
+    header = (
+        "REGION\tPOS\tREF\tALT\tREF_DP\tREF_RV\tREF_QUAL\tALT_DP\tALT_RV\tALT_QUAL"
+        "\tALT_FREQ\tTOTAL_DP\tPVAL\tPASS\tGFF_FEATURE\tREF_CODON\tREF_AA\tALT_CODON"
+        "\tALT_AA\n"
+    )
+    with open(f"{path}.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write(header)
+        for mut, freq in sorted(freqs.items(), key=lambda item: int(item[0][1:-1])):
+            alt_dp = int(freq * 200)
+            out_fh.write(
+                f"NC_045512.2\t{mut[1:-1]}\t{mut[0]}\t{mut[-1]}\t{200 - alt_dp}\t0\t37"
+                f"\t{alt_dp}\t0\t37\t{freq}\t200\t0\tTRUE\tNA\tNA\tNA\tNA\tNA\n"
+            )
+    with open(f"{path}.depth", "w", encoding="utf-8") as out_fh:
+        for pos in range(1, 29904):
+            out_fh.write(f"NC_045512.2\t{pos}\tN\t200\n")
+
+
+def test_demix_batch(tmp_path):
+    """
+    function to test samples demixed by the batch worker get the same
+    lineage reports as freyja demix writes for them
+    """
+
+    barcodes = tmp_path / "barcodes.csv"
+    muts = sorted({mut for lineage in BARCODES.values() for mut in lineage})
+    barcodes.write_text(
+        ","
+        + ",".join(muts)
+        + "\n"
+        + "".join(
+            f"{lineage},"
+            + ",".join(str(int(mut in lineage_muts)) for mut in muts)
+            + "\n"
+            for lineage, lineage_muts in BARCODES.items()
+        )
+    )
+    meta = tmp_path / "lineages.json"
+    meta.write_text(json.dumps(META))
+    samples = {
+        "SRR1": {"C241T": 1, "C3037T": 1, "A23403G": 1, "C21618T": 1},
+        "SRR2": {"C241T": 1, "C3037T": 0.6, "A23403G": 1, "T22917G": 0.6},
+        "SRR3": {"C241T": 1, "C3037T": 0.5, "A23403G": 1, "C21618T": 0.5},
+    }
+    for acc, freqs in samples.items():
+        write_sample(tmp_path / acc, freqs)
+
+    demix_batch.load(str(barcodes), str(meta))
+    variants = [str(tmp_path / f"{acc}.tsv") for acc in samples]
+    assert not demix_batch.demix_batch(variants, jobs=2)
+    for sample in variants:
+        expected = f"{sample}.freyja.tsv"
+        sp.run(
+            [
+                "freyja",
+                "demix",
+                sample,
+                sample.replace(".tsv", ".depth"),
+                "--barcodes",
+                str(barcodes),
+                "--meta",
+                str(meta),
+                "--output",
+                expected,
+            ],
+            check=True,
+            capture_output=True,
+        )
+        with open(demix_batch.lineages_file(sample), "r", encoding="utf-8") as in_fh:
+            batch_report = in_fh.read()
+        with open(expected, "r", encoding="utf-8") as in_fh:
+            assert batch_report == in_fh.read()
+    with open(demix_batch.lineages_file(variants[0]), "r", encoding="utf-8") as in_fh:
+        assert "lineages\tBA.1" in in_fh.read()
+
+    # a sample without a depth file fails alone
+    os.remove(tmp_path / "SRR3.depth")
+    assert demix_batch.demix_batch(variants, jobs=2) == [variants[2]]
@@ -0,0 +1,74 @@
+"""
+    module for testing the sample by position depth matrix
+    last edited 10-18-26
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.realpath("modules"))
+import depth_matrix  # pylint: disable=wrong-import-position
+import snakefunctions  # pylint: disable=wrong-import-position
+
+pytest.importorskip("numpy")
+
+DEPTH = os.path.realpath("tests/vc/expected/endpoints/SRR17866146.depth")
+
+
+def write_depth(acc, depths):
+    """
+    writes a sample's variants and a .depth file of the positions' depths
+    """
+
+    with open(f"endpoints/{acc}.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write("REGION\tPOS\tREF\tALT\n")
+    with open(f"endpoints/{acc}.depth", "w", encoding="utf-8") as out_fh:
+        for pos, depth in depths.items():
+            out_fh.write(f"NC_045512.2\t{pos}\tA\t{depth}\n")
+    return f"endpoints/{acc}.tsv"
+
+
+def test_depth_matrix(tmp_path, monkeypatch, capsys):
+    """
+    function to test the aggregate step writes the samples' depths, a new
+    matrix loads the .depth files and reprocessed samples' rows are
+    overwritten
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    shutil.copy(DEPTH, "endpoints/SRR17866146.depth")
+    snakefunctions.aggregate_endpoints(
+        [write_depth("SRR1", {1: 5, 29903: 7, 29904: 9})], [], [], False
+    )
+    matrix = depth_matrix.DepthMatrix()
+    assert matrix.accessions == ["SRR1", "SRR17866146"]
+    depths = matrix.load()
+    assert depths.shape == (2, depth_matrix.REF_LENGTH)
+    with open(DEPTH, "r", encoding="utf-8") as in_fh:
+        expected = [int(line.split("\t")[3]) for line in in_fh]
+    assert depths[matrix.row("SRR17866146")].tolist() == expected
+    assert matrix.depths("SRR1")[[0, 1, 29902]].tolist() == [5, 0, 7]
+    assert matrix.depths("SRR2") is None
+    matrix.close()
+
+    # samples already in the matrix are only rewritten when reprocessed
+    write_depth("SRR1", {2: 3})
+    snakefunctions.aggregate_endpoints(["endpoints/SRR1.tsv"], [], [], False)
+    matrix = depth_matrix.DepthMatrix()
+    assert matrix.depths("SRR1")[[0, 1]].tolist() == [5, 0]
+    matrix.close()
+    snakefunctions.aggregate_endpoints(["endpoints/SRR1.tsv"], [], [], True)
+    matrix = depth_matrix.DepthMatrix()
+    assert matrix.accessions == ["SRR1", "SRR17866146"]
+    assert matrix.depths("SRR1").sum() == 3
+    assert os.path.getsize("endpoints/depth_matrix/depths.bin") == 2 * 4 * 29903
+    matrix.close()
+
+    assert depth_matrix.main(["endpoints/depth_matrix", "-d", "1"]) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == "accession\tmean_depth\tbreadth"
+    assert out[1] == "SRR1\t0.00\t0.0000"
+    assert out[2].split("\t")[0] == "SRR17866146"
@@ -1,11 +1,19 @@
 """
     module for testing download_sra rule
     generated by snakemake
-    last edited 7-12-22
+    last edited 10-18-26
 """
+import os
+import subprocess as sp
+import sys
+
+import pytest
 
 import common
 
+sys.path.insert(0, os.path.realpath("modules"))
+from sample_store import SampleStore  # pylint: disable=wrong-import-position
+
 
 def test_download_sra():
     """
@@ -21,3 +29,83 @@ def test_download_sra():
     ]
 
     common.run_unit_test("download_sra", "download_sra", additional_variable)
+
+
+FAKE_PREFETCH = """#!/bin/bash
+# stand in for prefetch: accession -O outdir
+echo "start $1" >>"$FAKE_PREFETCH_EVENTS"
+sleep 1
+echo "end $1" >>"$FAKE_PREFETCH_EVENTS"
+case $1 in
+    SRR0000003) exit 3 ;;
+    SRR0000005) echo "failed to download $1"; exit 1 ;;
+esac
+mkdir -p "$3/$1"
+echo "$1" >"$3/$1/$1.sra"
+echo "'$1' was downloaded successfully"
+"""
+
+
+def test_download_sra_concurrent(tmp_path, monkeypatch):
+    """
+    function to test the samples are downloaded as separate jobs, no more
+    than the set number at once, and a failed download doesn't lose the others
+    """
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "prefetch").write_text(FAKE_PREFETCH)
+    (bin_dir / "prefetch").chmod(0o755)
+    events = tmp_path / "events.txt"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_PREFETCH_EVENTS", str(events))
+
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    accs = [f"SRR000000{num}" for num in range(1, 7)]
+    (workdir / "sra_meta_collect_current.tsv").write_text(
+        "Accession\tcollectiong data\tgeo_loc\tprimers\n"
+        + "".join(f"{acc}\t2022-01-01\tUSA\tUnknown\n" for acc in accs)
+    )
+
+    with pytest.raises(sp.CalledProcessError):
+        common.run_snakemake(
+            workdir,
+            "download_sra",
+            [
+                "-j6",
+                "-k",
+                "--config",
+                "query=",
+                "sra_download_jobs=2",
+                "--snakefile",
+                "snakefile1",
+            ],
+        )
+
+    for acc in accs:
+        assert (workdir / f"SRAs/{acc}/{acc}.sra").is_file() == (
+            acc not in ("SRR0000003", "SRR0000005")
+        )
+    assert os.listdir(workdir / "SRAs").count("SRR0000003.no.data") == 1
+    assert (
+        "downloaded successfully"
+        in (workdir / "logs/SRR0000001.prefetch.log").read_text()
+    )
+    running = 0
+    most_running = 0
+    for event in events.read_text().split("\n"):
+        if event.startswith("start"):
+            running += 1
+            most_running = max(running, most_running)
+        elif event.startswith("end"):
+            running -= 1
+    assert most_running == 2
+    store = SampleStore(str(workdir / "sample_state.sqlite"))
+    assert store.at_stage("downloaded") == {
+        "SRR0000001",
+        "SRR0000002",
+        "SRR0000004",
+        "SRR0000006",
+    }
+    store.close()
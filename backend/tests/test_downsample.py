@@ -0,0 +1,111 @@
+"""
+    module for testing the downsampling of deep samples and its report
+    last edited 10-18-26
+"""
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import downsample  # pylint: disable=wrong-import-position
+
+
+def sam_pair(name, pos, mate_pos):
+    """
+    the two alignments of a read pair
+    """
+
+    return [
+        f"{name}\t99\tNC_045512.2\t{pos}\t60\t100M\t=\t{mate_pos}\t300\tA\tI\n",
+        f"{name}\t147\tNC_045512.2\t{mate_pos}\t60\t100M\t=\t{pos}\t-300\tA\tI\n",
+    ]
+
+
+def test_amplicon_starts(tmp_path):
+    """
+    function to test the amplicons are taken from the forward primers with
+    alternate primers joined
+    """
+
+    bed = tmp_path / "primers.bed"
+    bed.write_text(
+        "MN908947.3\t30\t54\tnCoV-2019_1_LEFT\t1\t+\n"
+        "MN908947.3\t385\t410\tnCoV-2019_1_RIGHT\t1\t-\n"
+        "MN908947.3\t320\t342\tnCoV-2019_2_LEFT\t2\t+\n"
+        "MN908947.3\t325\t347\tnCoV-2019_2_LEFT_alt\t2\t+\n"
+        "MN908947.3\t704\t726\tnCoV-2019_2_RIGHT\t2\t-\n"
+    )
+    assert downsample.amplicon_starts(str(bed)) == [30, 320]
+
+
+def test_downsample():
+    """
+    function to test deep amplicons are capped at the target with mates
+    kept together, the same pairs kept for the same seed and shallow
+    amplicons left whole
+    """
+
+    amplicons = [30, 320]
+    lines = ["@HD\tVN:1.6\tSO:coordinate\n"]
+    for pair in range(1000):
+        lines += sam_pair(f"deep{pair}", 31, 250)
+    for pair in range(10):
+        lines += sam_pair(f"shallow{pair}", 330, 600)
+    # alignments sorted by position, with the mates apart
+    lines = lines[:1] + sorted(lines[1:], key=lambda line: int(line.split("\t")[3]))
+
+    kept = {}
+    for seed, sam in ((1, lines), (1, lines[:1] + lines[:0:-1]), (2, lines)):
+        out_fh = io.StringIO()
+        assert downsample.downsample(
+            sam, out_fh, 100, amplicons=amplicons, window=250, seed=seed
+        ) == (220, 2)
+        kept.setdefault(seed, []).append(out_fh.getvalue().splitlines())
+    # the same pairs are kept whatever the order of the sam
+    assert sorted(kept[1][0]) == sorted(kept[1][1])
+    assert sorted(kept[1][0]) != sorted(kept[2][0])
+    names = [line.split("\t")[0] for line in kept[1][0][1:]]
+    deep = [name for name in names if name.startswith("deep")]
+    assert len(deep) == 200
+    assert all(deep.count(name) == 2 for name in deep)
+    assert sum(name.startswith("shallow") for name in names) == 20
+    assert kept[1][0][0].startswith("@HD")
+
+    # without primers, templates are binned by window
+    out_fh = io.StringIO()
+    assert downsample.downsample(
+        lines, out_fh, 100, amplicons=[], window=250, seed=1
+    ) == (220, 2)
+
+
+def test_downsample_report(tmp_path):
+    """
+    function to test the changes in variant frequencies and lineage
+    abundances are reported
+    """
+
+    header = "REGION\tPOS\tREF\tALT\tALT_FREQ\n"
+    files = {}
+    for run, variants, lineages in (
+        ("full", ["210\tG\tT\t1", "214\tC\tA\t0.2"], "BA.1 BA.2\t0.6 0.4"),
+        ("ds", ["210\tG\tT\t1", "1000\tA\t+TT\t0.05"], "BA.1 BA.2\t0.55 0.45"),
+    ):
+        files[run] = [str(tmp_path / f"{run}.tsv"), str(tmp_path / f"{run}.lin.tsv")]
+        with open(files[run][0], "w", encoding="utf-8") as out_fh:
+            out_fh.write(header)
+            out_fh.writelines(f"NC_045512.2\t{variant}\n" for variant in variants)
+        with open(files[run][1], "w", encoding="utf-8") as out_fh:
+            lineage, abundance = lineages.split("\t")
+            out_fh.write(f"\tfull.tsv\nlineages\t{lineage}\nabundances\t{abundance}\n")
+    report = tmp_path / "report.tsv"
+    downsample.downsample_report(files["full"], files["ds"], str(report))
+    assert report.read_text().splitlines() == [
+        "kind\tname\tfull_depth\tdownsampled\tchange",
+        "variant\t210GT\t1\t1\t+0",
+        "variant\t214CA\t0.2\t0\t-0.2",
+        "variant\t1000A+TT\t0\t0.05\t+0.05",
+        "max_change\tvariant\t\t\t0.2",
+        "lineage\tBA.1\t0.6\t0.55\t-0.05",
+        "lineage\tBA.2\t0.4\t0.45\t+0.05",
+        "max_change\tlineage\t\t\t0.05",
+    ]
@@ -0,0 +1,101 @@
+"""
+    module for testing the snakefiles are parsed and schedule the expected
+    jobs, with snakemake's dry run
+    last edited 10-18-26
+"""
+import shutil
+import subprocess as sp
+
+
+def dry_run(tmp_path, name, snakefile, config=()):
+    """
+    dry runs the snakefile on a copy of a rule test's data and returns the
+    count of the jobs of each rule
+    """
+
+    workdir = tmp_path / "workdir"
+    shutil.copytree(f"tests/{name}/data", workdir)
+    command_list = [
+        "python",
+        "-m",
+        "snakemake",
+        "-n",
+        "-j1",
+        "--snakefile",
+        snakefile,
+        "--directory",
+        str(workdir),
+    ]
+    if config:
+        command_list += ["--config", *config]
+    output = sp.check_output(command_list, stderr=sp.STDOUT, text=True)
+    jobs = {}
+    lines = output.split("Job stats:", 1)[-1].splitlines()
+    for line in lines[3:]:
+        fields = line.split()
+        if len(fields) != 2 or fields[0] == "total":
+            break
+        jobs[fields[0]] = int(fields[1])
+    return jobs
+
+
+def test_dry_run_snakefile2(tmp_path):
+    """
+    function to test snakefile2 schedules a downloaded sample's processing
+    """
+
+    assert dry_run(tmp_path, "get_fastqs", "snakefile2") == {
+        "all": 1,
+        "get_fastqs": 1,
+        "mapping": 1,
+        "quality_check": 1,
+        "reference_index": 1,
+    }
+
+
+def test_dry_run_snakefile3(tmp_path):
+    """
+    function to test snakefile3 schedules a trimmed sample's processing, and
+    only the aggregation for samples without their sra files
+    """
+
+    assert dry_run(tmp_path / "vc", "vc", "snakefile3") == {
+        "aggregate": 1,
+        "all": 1,
+        "consensus": 1,
+        "lineages": 1,
+        "pileup": 1,
+        "update_freyja": 1,
+        "vc": 1,
+    }
+    assert dry_run(tmp_path / "aggregate", "aggregate", "snakefile3") == {
+        "aggregate": 1,
+        "all": 1,
+    }
+
+
+def test_dry_run_map_to_bam(tmp_path):
+    """
+    function to test the bams written when mapping are used as they are,
+    without a rule that could rewrite them
+    """
+
+    assert dry_run(tmp_path, "primer_trim", "snakefile3", ["map_to_bam=True"]) == {
+        "aggregate": 1,
+        "all": 1,
+        "consensus": 1,
+        "lineages": 1,
+        "pileup": 1,
+        "primer_trim": 1,
+        "update_freyja": 1,
+        "vc": 1,
+    }
+
+
+def test_dry_run_redemix(tmp_path):
+    """
+    function to test snakefile_redemix is parsed with the functions it
+    imports
+    """
+
+    assert "all" in dry_run(tmp_path, "aggregate", "snakefile_redemix")
@@ -0,0 +1,102 @@
+"""
+    module for testing the sample by mutation frequency matrix
+    last edited 10-18-26
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.realpath("modules"))
+import freq_matrix  # pylint: disable=wrong-import-position
+import snakefunctions  # pylint: disable=wrong-import-position
+
+pytest.importorskip("scipy")
+
+HEADER = "REGION\tPOS\tREF\tALT\tALT_FREQ\tGFF_FEATURE\n"
+
+
+def write_calls(acc, calls):
+    """
+    writes the sample's variant calls and consensus, returning their files
+    """
+
+    with open(f"endpoints/{acc}.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write(HEADER)
+        for pos, alt, freq in calls:
+            out_fh.write(f"NC_045512.2\t{pos}\tA\t{alt}\t{freq}\tNA\n")
+    with open(f"endpoints/{acc}.fa", "w", encoding="utf-8") as out_fh:
+        out_fh.write(f">{acc}\nA\n")
+    return [f"endpoints/{acc}.tsv"], [f"endpoints/{acc}.fa"], []
+
+
+def dense(matrix):
+    """
+    returns the matrix as a dict of sample to dict of mutation frequencies
+    """
+
+    csr = matrix.load().toarray()
+    return {
+        acc: {
+            mut: float(csr[row, col])
+            for col, mut in enumerate(matrix.mutations)
+            if csr[row, col]
+        }
+        for row, acc in enumerate(matrix.samples)
+    }
+
+
+def test_freq_matrix(tmp_path, monkeypatch):
+    """
+    function to test the aggregate step adds and replaces samples' rows with
+    stable rows and columns, a new matrix loads VCs.tsv and compaction
+    keeps the values
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    snakefunctions.aggregate_endpoints(
+        *write_calls("SRR1", [(10, "T", 0.5), (20, "G", 1)]), False
+    )
+    os.remove("endpoints/variants.sqlite")
+    for name in os.listdir("endpoints/freq_matrix"):
+        os.remove(f"endpoints/freq_matrix/{name}")
+    os.rmdir("endpoints/freq_matrix")
+
+    # a new matrix loads the samples already in VCs.tsv
+    snakefunctions.aggregate_endpoints(
+        *write_calls("SRR2", [(20, "G", 0.25), (30, "C", 0.75), (30, "C", 0.75)]),
+        False,
+    )
+    matrix = freq_matrix.FreqMatrix()
+    assert matrix.samples == ["SRR1", "SRR2"]
+    assert matrix.mutations == ["A10T", "A20G", "A30C"]
+    assert dense(matrix) == {
+        "SRR1": {"A10T": 0.5, "A20G": 1},
+        "SRR2": {"A20G": 0.25, "A30C": 0.75},
+    }
+    matrix.close()
+
+    # reprocessing replaces the sample's row and keeps its number
+    snakefunctions.aggregate_endpoints(
+        *write_calls("SRR1", [(40, "G", 0.125), (10, "T", 1)]), True
+    )
+    matrix = freq_matrix.FreqMatrix()
+    expected = {
+        "SRR1": {"A10T": 1, "A40G": 0.125},
+        "SRR2": {"A20G": 0.25, "A30C": 0.75},
+    }
+    assert matrix.samples == ["SRR1", "SRR2"]
+    assert matrix.mutations == ["A10T", "A20G", "A30C", "A40G"]
+    assert dense(matrix) == expected
+    assert matrix.dead() == 2
+    assert matrix.compact() == 2
+    assert matrix.dead() == 0
+    assert dense(matrix) == expected
+    matrix.close()
+
+    assert freq_matrix.main(["endpoints/freq_matrix"]) == 0
+    matrix = freq_matrix.FreqMatrix()
+    assert dense(matrix) == expected
+    assert matrix.load()[matrix.row("SRR2"), matrix.column("A30C")] == 0.75
+    matrix.close()
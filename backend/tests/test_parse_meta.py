@@ -0,0 +1,120 @@
+"""
+    module for testing the parsing of the query metadata xml
+    last edited 10-18-26
+"""
+import os
+import sys
+import shutil
+import filecmp
+
+sys.path.insert(0, os.path.realpath("modules"))
+sys.path.insert(0, os.path.realpath("benchmarks"))
+import snakefunctions  # pylint: disable=wrong-import-position
+import meta_xml  # pylint: disable=wrong-import-position
+from synth_meta import write_meta  # pylint: disable=wrong-import-position
+
+EXPECTED = os.path.realpath("tests/download_sra/expected")
+
+
+def parse_in(tmp_path, xml_file, **kwargs):
+    """
+    copies the xml into a temporary directory and parses it there
+    """
+
+    tmp_path.mkdir(exist_ok=True)
+    shutil.copyfile(xml_file, tmp_path / "sra_meta_test.xml")
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        snakefunctions.parse_xml_meta("test", **kwargs)
+    finally:
+        os.chdir(cwd)
+    return tmp_path
+
+
+def test_parse_meta(tmp_path):
+    """
+    function to test the parsed outputs match those expected, including when
+    the xml is streamed in very small chunks
+    """
+
+    for chunk_size in (64, 1 << 20):
+        out_dir = tmp_path / str(chunk_size)
+        out_dir.mkdir()
+        parse_in(out_dir, f"{EXPECTED}/sra_meta_test.xml", chunk_size=chunk_size)
+        for out_file in (
+            "sra_meta_test.txt",
+            "sra_meta_collect_test.tsv",
+            "sra_meta_collect_current.tsv",
+        ):
+            assert filecmp.cmp(
+                out_dir / out_file, f"{EXPECTED}/{out_file}", shallow=False
+            ), out_file
+
+
+def test_parse_meta_chunks(tmp_path):
+    """
+    function to test chunk size doesn't change the outputs for a larger xml
+    """
+
+    xml_file = write_meta(str(tmp_path / "synth.xml"), 300)
+    whole = parse_in(tmp_path / "whole", xml_file, chunk_size=1 << 24)
+    chunked = parse_in(tmp_path / "chunked", xml_file, chunk_size=100)
+    for out_file in ("sra_meta_test.txt", "sra_meta_collect_test.tsv"):
+        assert filecmp.cmp(whole / out_file, chunked / out_file, shallow=False)
+
+
+def test_read_xml_chunks(tmp_path):
+    """
+    function to test the chunks rebuild the xml or a range of it, are cut
+    before a tag and are at most the chunk size unless a text is longer
+    """
+
+    xml_file = write_meta(str(tmp_path / "synth.xml"), 50)
+    with open(xml_file, "rb") as xml_fh:
+        xml_bytes = xml_fh.read()
+    for chunk_size in (7, 100, 4096):
+        with open(xml_file, "rb") as xml_fh:
+            chunks = list(meta_xml.read_xml_chunks(xml_fh, chunk_size))
+        assert b"".join(chunks) == xml_bytes
+        for chunk in chunks[1:]:
+            assert chunk.startswith(b"<")
+        if chunk_size > 7:
+            assert max(len(chunk) for chunk in chunks) <= chunk_size
+    with open(xml_file, "rb") as xml_fh:
+        xml_fh.seek(100)
+        chunks = list(meta_xml.read_xml_chunks(xml_fh, 64, 1000))
+    assert b"".join(chunks) == xml_bytes[100:1000]
+
+
+def test_parse_meta_parallel(tmp_path):
+    """
+    function to test the parallel parse gives the same outputs as the serial
+    parse
+    """
+
+    xml_file = write_meta(str(tmp_path / "synth.xml"), 1000)
+    serial = parse_in(tmp_path / "serial", xml_file)
+    parallel = parse_in(tmp_path / "parallel", xml_file, cores=3, shard_size=20000)
+    for out_file in ("sra_meta_test.txt", "sra_meta_collect_test.tsv"):
+        assert filecmp.cmp(serial / out_file, parallel / out_file, shallow=False)
+    shards = meta_xml.find_xml_shards(xml_file, 12, 4096)
+    assert len(shards.offsets) == 12
+    assert sorted(os.listdir(parallel)) == [
+        "sra_meta_collect_current.tsv",
+        "sra_meta_collect_test.tsv",
+        "sra_meta_test.txt",
+        "sra_meta_test.xml",
+    ]
+
+    expected = parse_in(
+        tmp_path / "expected",
+        f"{EXPECTED}/sra_meta_test.xml",
+        cores=2,
+        shard_size=1000,
+    )
+    assert filecmp.cmp(
+        expected / "sra_meta_test.txt",
+        f"{EXPECTED}/sra_meta_test.txt",
+        shallow=False,
+    )
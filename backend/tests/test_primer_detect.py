@@ -0,0 +1,124 @@
+"""
+    module for testing the detection of primer schemes from mapped reads
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import primer_detect  # pylint: disable=wrong-import-position
+
+
+def scheme_reads(bed, offset=0, noise=0):
+    """
+    5' read ends of the amplicons of a bed, trimmed by offset, with reads
+    that don't start at primers
+    """
+
+    ends = []
+    with open(bed, "r", encoding="utf-8") as in_fh:
+        for line in in_fh:
+            fields = line.rstrip("\n").split("\t")
+            if fields[5] == "+":
+                ends.append(("+", int(fields[1]) + offset))
+            else:
+                ends.append(("-", int(fields[2]) - offset))
+    ends += [("+", 1000 + 37 * read) for read in range(noise)]
+    return ends
+
+
+def test_alignment_end():
+    """
+    function to test the 5' ends of forward and reverse reads are found
+    with their soft clips
+    """
+
+    assert primer_detect.alignment_end(
+        ["r1", "99", "NC_045512.2", "101", "60", "5S95M", "="]
+    ) == ("+", 95)
+    assert primer_detect.alignment_end(
+        ["r1", "147", "NC_045512.2", "201", "60", "50M2D48M2S", "="]
+    ) == ("-", 302)
+    assert not primer_detect.alignment_end(["r2", "4", "*", "0", "0", "*", "*"])
+    assert not primer_detect.alignment_end(
+        ["r3", "2048", "NC_045512.2", "1", "60", "100M", "*"]
+    )
+
+
+def test_detect():
+    """
+    function to test the schemes of reads are detected from the repo's beds,
+    with and without the reads' 5' ends trimmed, and reads that don't start
+    at primers are left Unknown
+    """
+
+    index = primer_detect.PrimerSchemeIndex(primer_detect.bed_files("data"))
+    for bed in ("data/articv3.bed", "data/SNAP.bed", "data/NEBNextVSL.bed"):
+        assert index.detect(scheme_reads(bed, noise=20)) == bed
+        assert index.detect(scheme_reads(bed, 25, noise=20), 25) == bed
+        assert index.detect(scheme_reads(bed, 25)) == "Unknown"
+    assert index.detect([("+", 1000 + 37 * read) for read in range(100)]) == "Unknown"
+    assert index.detect([]) == "Unknown"
+
+
+def test_read_ends(tmp_path):
+    """
+    function to test the first mapped reads of a sam are taken
+    """
+
+    sam = tmp_path / "test.sam"
+    sam.write_text(
+        "@HD\tVN:1.6\n"
+        "r1\t99\tNC_045512.2\t31\t60\t100M\t=\t200\t270\tA\tI\n"
+        "r1\t147\tNC_045512.2\t200\t60\t100M\t=\t31\t-270\tA\tI\n"
+        "r2\t4\t*\t0\t0\t*\t*\t0\t0\tA\tI\n"
+        "r3\t0\tNC_045512.2\t500\t60\t100M\t*\t0\t0\tA\tI\n"
+    )
+    assert primer_detect.read_ends(str(sam), 2) == [("+", 30), ("-", 299)]
+    assert len(primer_detect.read_ends(str(sam))) == 3
+
+
+def test_detect_primer_beds(tmp_path, monkeypatch):
+    """
+    function to test Unknown samples get the bed detected from their sams,
+    while samples with only a bam stay Unknown when samtools can't read it
+    """
+
+    data_dir = os.path.realpath("data")
+    lines = []
+    for strand, pos in scheme_reads("data/SNAP.bed", 25):
+        if strand == "+":
+            lines.append(
+                f"r{pos}\t0\tNC_045512.2\t{pos + 1}\t60\t100M\t*\t0\t0\tA\tI\n"
+            )
+        else:
+            lines.append(
+                f"r{pos}\t16\tNC_045512.2\t{pos - 99}\t60\t100M\t*\t0\t0\tA\tI\n"
+            )
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("sams")
+    with open("sams/SRR1.sam", "w", encoding="utf-8") as out_fh:
+        out_fh.writelines(lines)
+    # an empty bam, which samtools can't read if it is installed
+    for name in ("sams/SRR2.bam", "sams/SRR2.bam.bai"):
+        with open(name, "w", encoding="utf-8"):
+            pass
+    accs = {
+        "SRR1": {"bed": "Unknown", "cut": "-f 25 "},
+        "SRR2": {"bed": "Unknown", "cut": "-f 25 "},
+        "SRR3": {"bed": "data/articv3.bed", "cut": ""},
+    }
+    assert not primer_detect.detect_primer_beds(
+        accs, data_dir, reads=0, min_fraction=0.5, offset=25
+    )
+    assert (
+        primer_detect.detect_primer_beds(
+            accs, data_dir, reads=2000, min_fraction=0.5, offset=25
+        )
+        == 1
+    )
+    assert [info["bed"] for info in accs.values()] == [
+        "data/SNAP.bed",
+        "Unknown",
+        "data/articv3.bed",
+    ]
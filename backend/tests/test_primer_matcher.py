@@ -0,0 +1,78 @@
+"""
+    module for testing the compiled primer keyword matcher
+    keeps the matching rules of the original get_primer_bed
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+
+# data strings, upper cased as by data_fun(), and the primers they match
+ELEMENTS_EXPECTED = {
+    "ARTIC V3 AMPLICONS": "ArticV3",
+    # Only the first key is checked in levels with an Other key
+    "ARTIC V4.1 AMPLICON PANEL": "Artic",
+    "SWIFT SNAP VERSION 2.0 WITH ADDITIONAL COVERAGE": "SNAPadd",
+    "SWIFT NORMALASE": "SNAP",
+    "NEBNEXT VARSKIP LONG PRIMERS": "NEBNext VarSkip",
+    "NEBNEXT V2": "NEBNext",
+    "QIASEQ DIRECT SARS-COV-2": "QiaSeq",
+    "ION AMPLISEQ SARS-COV-2 RESEARCH PANEL": "IonAmpliSeq",
+    "FISHER": "IonAmpliSeq",
+    "PRJNA748354": "Spike-Amps",
+    "PARAGON CLEANPLEX": "Paragon",
+    "ILLUMINA NOVASEQ 6000": "Unknown",
+    "Artic V3": "Unknown",
+    "": "Unknown",
+}
+
+# joined primers of a sample, as by end_ele_fun(), and the beds they match
+PRIMERS_EXPECTED = {
+    "ArticV4.1": "data/articv4.1.bed",
+    # The first key of the mapping found is used
+    "ArticV4 ArticV4.1": "data/articv4.1.bed",
+    "ArticV3ArticV4": "data/articv4.bed",
+    "NEBNext": "data/articv3.bed",
+    "NEBNext VarSkip Long": "data/NEBNextVSL.bed",
+    "NEBNext VarSkip V2": "data/NEBNextVSS.bed",
+    "SNAPadd": "data/SNAPaddtlCov.bed",
+    "SNAP": "data/SNAP.bed",
+    "QiaSeqSpike-Amps": "data/QiaSeq.bed",
+    "IonAmpliSeq": "Unknown",
+    "Swift": "Unknown",
+    "": "Unknown",
+}
+
+
+def test_primer_matcher():
+    """
+    function to test the matcher returns the primers and beds the original
+    function did for both mapping files
+    """
+
+    for mapping_file, expected in (
+        ("data/elements_mapping.json", ELEMENTS_EXPECTED),
+        ("data/primer_mapping.json", PRIMERS_EXPECTED),
+    ):
+        for primers_str, bed in expected.items():
+            # the second call is answered from the matcher's cache
+            for _ in range(2):
+                assert (
+                    snakefunctions.get_primer_bed(primers_str, mapping_file) == bed
+                ), primers_str
+
+
+def test_primer_matcher_load():
+    """
+    function to test each mapping json is compiled once
+    """
+
+    mapping_file = "data/primer_mapping.json"
+    assert snakefunctions.get_primer_matcher(
+        mapping_file
+    ) is snakefunctions.get_primer_matcher(mapping_file)
+    assert snakefunctions.get_primer_matcher(
+        mapping_file
+    ) is not snakefunctions.get_primer_matcher("data/elements_mapping.json")
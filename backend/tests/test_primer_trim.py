@@ -1,10 +1,22 @@
 """
     module for testing primer_trim rule
     generated by snakemake
-    last edited 7-12-22
+    last edited 10-18-26
 """
+import os
+import shutil
+import subprocess as sp
+import sys
+
+import pytest
+
 import common
 
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+
+EXPECTED = "tests/primer_trim/expected/sams/SRR17866146.trimmed.sorted.bam.bai"
+
 
 def test_primer_trim():
     """
@@ -19,3 +31,41 @@ def test_primer_trim():
     common.run_unit_test(
         "primer_trim", "sams/SRR17866146.trim.done", additional_variable
     )
+
+
+def test_primer_trim_sort_once(tmp_path):
+    """
+    function to test primer_trim trims the mapped sam when sorting once,
+    keeping the same reads as trimming the sorted bam, and fails when ivar
+    does
+    """
+
+    workdir = tmp_path / "workdir"
+    shutil.copytree("tests/primer_trim/data", workdir)
+    os.remove(workdir / "sams/SRR17866146.bam")
+    os.remove(workdir / "sams/SRR17866146.bam.bai")
+    additional_variable = [
+        "--snakefile",
+        "snakefile3",
+        "--config",
+        "trim_sort_once=True",
+    ]
+    common.run_snakemake(
+        str(workdir), "sams/SRR17866146.trim.done", additional_variable
+    )
+    assert not os.path.isfile(workdir / "sams/SRR17866146.trimmed.bam")
+    assert snakefunctions.bai_mapped_reads(
+        str(workdir / "sams/SRR17866146.trimmed.sorted.bam.bai")
+    ) == snakefunctions.bai_mapped_reads(EXPECTED)
+
+    # a failed trim, of a sam without its header, fails the rule rather than
+    # marking the sample trimmed
+    workdir = tmp_path / "failed"
+    shutil.copytree("tests/primer_trim/data", workdir)
+    with open(workdir / "sams/SRR17866146.sam", "w", encoding="utf-8") as out_fh:
+        out_fh.write("r\t0\n" * 600)
+    with pytest.raises(sp.CalledProcessError):
+        common.run_snakemake(
+            str(workdir), "sams/SRR17866146.trim.done", additional_variable
+        )
+    assert not os.path.isfile(workdir / "sams/SRR17866146.trim.done")
@@ -0,0 +1,89 @@
+"""
+    module for testing the read counts used by qc_pass
+    last edited 10-18-26
+"""
+import json
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+import read_counts  # pylint: disable=wrong-import-position
+from sample_store import SampleStore  # pylint: disable=wrong-import-position
+
+
+def bai(mapped):
+    """
+    bam index contents with a binned reference holding the mapped counts
+    samtools writes, and a reference without reads
+    """
+
+    index = b"BAI\1" + struct.pack("<i", 2)
+    index += struct.pack("<i", 2)
+    index += struct.pack("<Ii", 4681, 1) + struct.pack("<QQ", 100, 200)
+    index += struct.pack("<Ii", 37450, 2) + struct.pack("<QQQQ", 100, 200, mapped, 7)
+    index += struct.pack("<i", 2) + struct.pack("<QQ", 100, 150)
+    index += struct.pack("<i", 0) + struct.pack("<i", 0)
+    return index + struct.pack("<Q", 3)
+
+
+def test_count_mapped_reads(tmp_path):
+    """
+    function to test mapped alignments are counted, stopping at the limit
+    """
+
+    sam = tmp_path / "test.sam"
+    sam.write_text(
+        "@SQ\tSN:NC_045512.2\tLN:29903\n@PG\tID:minimap2\n"
+        + "r\t0\n" * 400
+        + "r\t69\n" * 100
+        + "r\t137\n" * 400
+    )
+    assert read_counts.count_mapped_reads(str(sam)) == 800
+    assert read_counts.count_mapped_reads(str(sam), 500) == 500
+    assert read_counts.count_mapped_reads(str(sam), 900) == 800
+
+
+def test_qc_pass_counts(tmp_path, monkeypatch):
+    """
+    function to test mapped samples are passed on recorded sam, bam index or
+    fastp json counts
+    """
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sams").mkdir()
+    (tmp_path / "fastqs").mkdir()
+    accs = ["SRR1", "SRR2", "SRR3", "SRR4"]
+    (tmp_path / "sams/SRR1.bam").write_bytes(b"")
+    (tmp_path / "sams/SRR1.bam.bai").write_bytes(bai(650))
+    (tmp_path / "sams/SRR2.bam.bai").write_bytes(bai(20))
+    (tmp_path / "sams/SRR2.sam").write_text("r\t0\n" * 600)
+    for acc, reads in (("SRR1", 100), ("SRR2", 400), ("SRR3", 300)):
+        (tmp_path / f"fastqs/{acc}.pe.json").write_text(
+            json.dumps({"summary": {"after_filtering": {"total_reads": reads}}})
+        )
+    (tmp_path / "fastqs/SRR3.se.json").write_text(
+        json.dumps({"summary": {"after_filtering": {"total_reads": 200}}})
+    )
+    snakefunctions.record_sample_stages(accs)
+
+    assert read_counts.bai_mapped_reads("sams/SRR1.bam.bai") == 650
+    assert snakefunctions.qc_pass(accs, 600, "bam") == ["SRR1"]
+    # reads mapped straight to a bam are counted from the index
+    assert snakefunctions.qc_pass(accs, 599, "sam") == ["SRR1", "SRR2"]
+    assert snakefunctions.qc_pass(accs, 600, "sam") == ["SRR1"]
+    # samples without a sam or bam aren't passed on their qc counts
+    assert snakefunctions.qc_pass(accs, 350, "fastp") == ["SRR2"]
+
+    # samples without a recorded count are counted, only whole counts are
+    # recorded
+    store = SampleStore()
+    store.set_mapped_reads({"SRR1": None, "SRR2": None})
+    os.remove("sams/SRR1.bam.bai")
+    (tmp_path / "sams/SRR1.sam").write_text("r\t0\n" * 300)
+    assert snakefunctions.qc_pass(accs, 200, "sam") == ["SRR1", "SRR2"]
+    assert store.mapped_reads() == {"SRR1": None, "SRR2": None}
+    assert snakefunctions.qc_pass(accs, 400, "sam") == ["SRR2"]
+    assert store.mapped_reads() == {"SRR1": 300, "SRR2": None}
+    store.close()
@@ -0,0 +1,77 @@
+"""
+    module for testing the parts of the lineage re-demixing that run
+    without freyja
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import demix_batch  # pylint: disable=wrong-import-position
+import snakefunctions  # pylint: disable=wrong-import-position
+
+
+def lineages(tsv, lineage):
+    """
+    a freyja lineage report for the lineage
+    """
+
+    return (
+        f"\t{tsv}\nsummarized\t[('Other', 1.0)]\nlineages\t{lineage}\n"
+        "abundances\t1.00000000\nresid\t0.1\ncoverage\t99.0\n"
+    )
+
+
+def test_endpoint_samples(tmp_path):
+    """
+    function to test only the samples with variants and depths are found
+    """
+
+    for name in (
+        "SRR1.tsv",
+        "SRR1.depth",
+        "SRR1.lineages.tsv",
+        "SRR2.tsv",
+        "SRR3.depth",
+        "VCs.tsv",
+        "Lineages.tsv",
+    ):
+        (tmp_path / name).write_text("")
+    assert demix_batch.endpoint_samples(str(tmp_path)) == [str(tmp_path / "SRR1.tsv")]
+    assert not demix_batch.endpoint_samples(str(tmp_path / "none"))
+
+
+def test_update_lineages(tmp_path, monkeypatch):
+    """
+    function to test the samples' lineages are replaced in the aggregate
+    file, without matching accessions that contain others, and new samples
+    added
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    old = {acc: lineages(f"endpoints/{acc}.tsv", "B.1") for acc in ("SRR1", "SRR11")}
+    with open("endpoints/Lineages.tsv", "w", encoding="utf-8") as agg:
+        for acc, report in old.items():
+            agg.write(f"{acc}\n{report}\n--------\n")
+    new = {acc: lineages(f"endpoints/{acc}.tsv", "BA.2") for acc in ("SRR1", "SRR2")}
+    for acc, report in new.items():
+        with open(f"endpoints/{acc}.lineages.tsv", "w", encoding="utf-8") as out_fh:
+            out_fh.write(report)
+
+    assert (
+        snakefunctions.update_lineages(
+            ["endpoints/SRR1.lineages.tsv", "endpoints/SRR2.lineages.tsv"]
+        )
+        == 2
+    )
+    with open("endpoints/Lineages.tsv", "r", encoding="utf-8") as agg:
+        blocks = [block for block in agg.read().split("\n--------\n") if block.strip()]
+    assert blocks == [
+        f"{acc}\n{report}"
+        for acc, report in (
+            ("SRR11", old["SRR11"]),
+            ("SRR1", new["SRR1"]),
+            ("SRR2", new["SRR2"]),
+        )
+    ]
@@ -0,0 +1,43 @@
+"""
+    module for testing the threads and memory given to the rules' jobs
+    last edited 10-18-26
+"""
+import os
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.realpath("modules"))
+import rule_resources  # pylint: disable=wrong-import-position
+
+
+def test_rule_resources():
+    """
+    function to test threads are sized from the samples' run sizes and
+    memory from the threads and run sizes, with the settings in the
+    config.yaml
+    """
+
+    with open("config.yaml", "r", encoding="utf-8") as in_fh:
+        settings = yaml.safe_load(in_fh)["rule_resources"]
+    settings["MB_per_thread"] = 100
+    run_sizes = {"SRR1": 0.0, "SRR2": 250.0, "SRR3": 5000.0}
+
+    threads = {
+        acc: rule_resources.rule_threads("mapping", acc, run_sizes, settings)
+        for acc in ("SRR1", "SRR2", "SRR3", "SRR4")
+    }
+    assert threads == {"SRR1": 1, "SRR2": 3, "SRR3": 8, "SRR4": 8}
+    assert rule_resources.rule_threads("vc", "SRR3", run_sizes, settings) == 1
+    assert rule_resources.rule_threads("unknown", "SRR3", run_sizes, settings) == 1
+
+    assert rule_resources.rule_mem_mb("mapping", 3, settings) == 1000 + 3 * 800
+    assert rule_resources.rule_mem_mb("vc", 1, settings) == 500
+    assert rule_resources.rule_mem_mb("unknown", 4, settings) == 1000
+    # rules held to a thread get memory for the sample's run size
+    assert rule_resources.rule_mem_mb("vc", 1, settings, "SRR3", run_sizes) == 1500
+    assert rule_resources.rule_mem_mb("vc", 1, settings, "SRR4", run_sizes) == 520
+    assert (
+        rule_resources.rule_mem_mb("mapping", 8, settings, "SRR3", run_sizes)
+        == 1000 + 8 * 800
+    )
@@ -0,0 +1,101 @@
+"""
+    module for testing incremental queries against the run catalog
+    using the stand in SRA server
+    last edited 10-18-26
+"""
+import functools
+import os
+import sys
+
+from stand_in import exp_xml, make_client, sra_client
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+import run_catalog  # pylint: disable=wrong-import-position
+
+
+def collect_rows(path):
+    """
+    accessions of the rows of a sra_meta_collect tsv
+    """
+
+    with open(path, "r", encoding="utf-8") as in_fh:
+        return [line.split("\t")[0] for line in in_fh.read().split("\n")[1:] if line]
+
+
+def test_incremental_query(stand_in, tmp_path, monkeypatch):
+    """
+    function to test only new and reloaded runs are downloaded and parsed,
+    while the current collect tsv holds all the query's runs
+    """
+
+    monkeypatch.chdir(tmp_path)
+    client = make_client(stand_in)
+    monkeypatch.setattr(
+        snakefunctions,
+        "SraClient",
+        functools.partial(
+            sra_client.SraClient,
+            search_url=client.search_url,
+            trace_url=client.trace_url,
+            backoff=0.01,
+        ),
+    )
+    stand_in.count = 10
+    assert snakefunctions.sra_query_incremental("wastewater", "day1") == 10
+    assert collect_rows("sra_meta_collect_current.tsv") == [
+        f"SRR{run:07d}" for run in range(10)
+    ]
+
+    stand_in.count = 13
+    stand_in.load_dates = {4: "2022-08-01"}
+    assert snakefunctions.sra_query_incremental("wastewater", "day2") == 4
+    assert stand_in.searches[-1] == [4, 10, 11, 12]
+    assert (tmp_path / "sra_meta_day2.xml").read_text() == exp_xml(
+        0, 0, [4, 10, 11, 12]
+    )
+    assert collect_rows("sra_meta_collect_day2.tsv") == [
+        f"SRR{run:07d}" for run in (4, 10, 11, 12)
+    ]
+    assert collect_rows("sra_meta_collect_current.tsv") == [
+        f"SRR{run:07d}" for run in range(13)
+    ]
+
+    searches = len(stand_in.searches)
+    assert snakefunctions.sra_query_incremental("wastewater", "day3") == 0
+    assert len(stand_in.searches) == searches
+    assert collect_rows("sra_meta_collect_day3.tsv") == []
+    assert len(collect_rows("sra_meta_collect_current.tsv")) == 13
+
+
+def test_catalog_experiment_rows(tmp_path):
+    """
+    function to test a new run of an experiment replaces the experiment's
+    collect row, which is named for its last run, rather than adding a row
+    """
+
+    runinfo = tmp_path / "runinfo.csv"
+    collect = tmp_path / "collect.tsv"
+    header = "Accession\tcollectiong data\tgeo_loc\tprimers\n"
+    catalog = run_catalog.RunCatalog(str(tmp_path / "catalog.sqlite"))
+    runinfo.write_text(
+        "Run,ReleaseDate,LoadDate,Experiment\n"
+        "SRR1,2022-07-01,2022-07-01,SRX1\n"
+        "SRR2,2022-07-01,2022-07-01,SRX1\n"
+        "SRR3,2022-07-01,2022-07-01,SRX2\n"
+    )
+    runs = run_catalog.read_runs(str(runinfo))
+    assert runs["SRR2"] == ("2022-07-01", "SRX1")
+    assert catalog.changed_runs(runs) == ["SRR1", "SRR2", "SRR3"]
+    collect.write_text(header + "SRR2\t2022\tUSA\tUnknown\nSRR3\t2022\tUSA\tUnknown\n")
+    catalog.update("query", "day1", runs, str(collect))
+
+    with open(runinfo, "a", encoding="utf-8") as out_fh:
+        out_fh.write("SRR4,2022-07-01,2022-08-01,SRX1\n")
+    runs = run_catalog.read_runs(str(runinfo))
+    assert catalog.changed_runs(runs) == ["SRR4"]
+    collect.write_text(header + "SRR4\t2022\tUSA\tArtic\n")
+    catalog.update("query", "day2", runs, str(collect))
+    assert catalog.write_collect("query", str(tmp_path / "current.tsv")) == 2
+    assert collect_rows(tmp_path / "current.tsv") == ["SRR4", "SRR3"]
+    catalog.close()
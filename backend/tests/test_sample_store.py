@@ -0,0 +1,157 @@
+"""
+    module for testing the sample state store and the sample accession
+    functions that use it
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+from sample_store import SampleStore  # pylint: disable=wrong-import-position
+from run_catalog import COLLECT_HEADER  # pylint: disable=wrong-import-position
+
+
+def write_files(root, files):
+    """
+    writes the files, with an optional content, under root
+    """
+
+    for file, content in files.items():
+        path = root / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def write_collect(root, accs):
+    """
+    writes a sra_meta_collect_current tsv for the accessions
+    """
+
+    rows = "".join(
+        f"{acc}\t2022-01-01\tUSA\t{'Unknown' if acc.endswith('3') else 'x.bed'}\n"
+        for acc in accs
+    )
+    write_files(root, {"sra_meta_collect_current.tsv": COLLECT_HEADER + rows})
+
+
+def sam(reads):
+    """
+    sam file contents with a header and the number of alignments
+    """
+
+    return "@SQ\tSN:NC_045512.2\tLN:29903\n@PG\tID:minimap2\n" + "r\t0\n" * reads
+
+
+def test_sample_store_sync(tmp_path, monkeypatch):
+    """
+    function to test only the files of the samples passed are checked, and
+    stages only move forward
+    """
+
+    monkeypatch.chdir(tmp_path)
+    accs = [f"SRR000000{num}" for num in range(1, 5)]
+    write_files(
+        tmp_path,
+        {
+            "SRAs/SRR0000001/SRR0000001.sra": "",
+            "SRAs/SRR0000002/SRR0000002.sra": "",
+            "SRAs/SRR0000003/SRR0000003.sra": "",
+            "SRAs/SRR0000004.no.data": "",
+            "fastqs/SRR0000002.fq.done": "",
+            "fastqs/SRR0000003.fq.done": "",
+            "fastqs/SRR0000003.pe.json": "",
+            "sams/SRR0000003.sam": sam(2),
+        },
+    )
+    store = SampleStore()
+    # the directories aren't listed
+    assert not store.at_stage("queried")
+    assert store.unseen(accs) == accs
+    assert store.sync(accs[:3]) == {
+        "SRR0000001": "downloaded",
+        "SRR0000002": "fastq",
+        "SRR0000003": "mapped",
+    }
+    store.sync(accs[3:])
+    assert store.unseen(accs + ["SRR0000005"]) == ["SRR0000005"]
+    assert store.at_stage("queried") == {"SRR0000001", "SRR0000002", "SRR0000003"}
+    assert store.at_stage("fastq") == {"SRR0000002", "SRR0000003"}
+    assert store.downloaded() == {"SRR0000001", "SRR0000002", "SRR0000003"}
+    store.mark(["SRR0000003"], "downloaded")
+    store.mark(["SRR0000001"], "qc")
+    assert store.at_stage("mapped") == {"SRR0000003"}
+    assert store.at_stage("qc") == {"SRR0000001", "SRR0000003"}
+
+    # a sample with only its sam left isn't downloaded
+    os.remove("SRAs/SRR0000003/SRR0000003.sra")
+    store.sync(["SRR0000003"])
+    assert store.at_stage("mapped") == {"SRR0000003"}
+    assert store.downloaded() == {"SRR0000001", "SRR0000002"}
+    store.close()
+
+
+def test_sample_accs(tmp_path, monkeypatch):
+    """
+    function to test the samples to process are found from the store, with
+    only samples it hasn't seen checked for files, and the stages reached by
+    a run are recorded
+    """
+
+    monkeypatch.chdir(tmp_path)
+    accs = [f"SRR000000{num}" for num in range(1, 5)]
+    write_collect(tmp_path, accs)
+    write_files(tmp_path, {"fastqs/SRR0000001.se.json": ""})
+
+    assert snakefunctions.get_sample_acc1(False) == " ".join(accs[1:])
+    assert snakefunctions.get_sample_acc1(True) == " ".join(accs)
+    assert not snakefunctions.get_sample_acc2(False)
+
+    write_files(
+        tmp_path,
+        {
+            "SRAs/SRR0000002/SRR0000002.sra": "",
+            "SRAs/SRR0000003/SRR0000003.sra": "",
+            "SRAs/SRR0000004.no.data": "",
+        },
+    )
+    # seen samples aren't checked for files until a run records them
+    assert not snakefunctions.get_sample_acc2(False)
+    snakefunctions.record_sample_stages(accs[1:])
+    assert snakefunctions.get_sample_acc2(False) == {
+        "SRR0000002": {"bed": "x.bed", "cut": ""},
+        "SRR0000003": {"bed": "Unknown", "cut": "-f 25 "},
+    }
+    # only samples with their sra files are downloaded
+    write_files(tmp_path, {"sams/SRR0000001.sam": sam(2)})
+    snakefunctions.record_sample_stages(accs[:1])
+    assert list(snakefunctions.get_sample_acc2(True)) == accs[1:3]
+
+    write_files(
+        tmp_path,
+        {
+            "fastqs/SRR0000002.se.json": "",
+            "fastqs/SRR0000003.pe.json": "",
+            "sams/SRR0000002.sam": sam(501),
+            "sams/SRR0000003.sam": sam(500),
+        },
+    )
+    snakefunctions.record_sample_stages(accs[1:])
+    assert snakefunctions.get_sample_acc1(False) == "SRR0000004"
+    assert not snakefunctions.get_sample_acc2(False)
+    assert snakefunctions.qc_pass(accs) == ["SRR0000002"]
+
+    # counts are kept until a run records the sample again
+    os.remove("sams/SRR0000002.sam")
+    assert snakefunctions.qc_pass(accs) == ["SRR0000002"]
+    write_files(tmp_path, {"sams/SRR0000003.sam": sam(600)})
+    assert snakefunctions.qc_pass(accs) == ["SRR0000002"]
+    snakefunctions.record_sample_stages(["SRR0000003"])
+    assert snakefunctions.qc_pass(accs) == ["SRR0000002", "SRR0000003"]
+    store = SampleStore()
+    assert store.mapped_reads() == {
+        "SRR0000001": 2,
+        "SRR0000002": 501,
+        "SRR0000003": 600,
+    }
+    store.close()
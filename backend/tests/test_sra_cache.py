@@ -0,0 +1,135 @@
+"""
+    module for testing the shared sra/fastq cache
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import sra_cache  # pylint: disable=wrong-import-position
+
+
+def write(path, content):
+    """
+    writes the file, making its directory
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_sra_cache_fetch_store(tmp_path):
+    """
+    function to test files are stored once by content and linked back into
+    other working directories, with hits and misses counted
+    """
+
+    cache = sra_cache.SraCache(str(tmp_path / "cache"))
+    work1 = tmp_path / "work1"
+    work2 = tmp_path / "work2"
+    assert not cache.fetch("SRR0000001", "sra", str(work1 / "SRAs/SRR0000001"))
+
+    sra = write(work1 / "SRAs/SRR0000001/SRR0000001.sra", b"sra1" * 100)
+    assert cache.store("SRR0000001", "sra", [sra]) == 400
+    fastqs = [
+        write(work1 / "fastqs/SRR0000001_1.fastq", b"@r1\nACGT\n+\nIIII\n"),
+        write(work1 / "fastqs/SRR0000001_2.fastq", b"@r1\nTGCA\n+\nIIII\n"),
+    ]
+    assert cache.store("SRR0000001", "fastq", fastqs) == 32
+    # the same content is only stored once
+    dup = write(work1 / "SRAs/SRR0000002/SRR0000002.sra", b"sra1" * 100)
+    assert cache.store("SRR0000002", "sra", [dup]) == 0
+    assert cache.size() == 432
+
+    assert cache.fetch("SRR0000001", "fastq", str(work2 / "fastqs")) == [
+        str(work2 / "fastqs/SRR0000001_1.fastq"),
+        str(work2 / "fastqs/SRR0000001_2.fastq"),
+    ]
+    assert (work2 / "fastqs/SRR0000001_2.fastq").read_bytes() == b"@r1\nTGCA\n+\nIIII\n"
+    assert cache.fetch("SRR0000002", "sra", str(work2 / "SRAs/SRR0000002"))
+    assert (work2 / "SRAs/SRR0000002/SRR0000002.sra").read_bytes() == b"sra1" * 100
+
+    # a stored file that has gone missing is a miss and dropped
+    os.remove(cache.object_path(sra_cache.file_sha256(fastqs[0])))
+    assert not cache.fetch("SRR0000001", "fastq", str(work2 / "fastqs"))
+    assert cache.stats() == {
+        "fastq": {"hits": 1, "misses": 1},
+        "sra": {"hits": 1, "misses": 1},
+    }
+    cache.close()
+
+
+def test_sra_cache_eviction(tmp_path):
+    """
+    function to test the least recently used samples are evicted to keep
+    the files only the cache holds within its budget
+    """
+
+    cache = sra_cache.SraCache(str(tmp_path / "cache"), budget=150)
+    paths = {
+        acc: write(tmp_path / f"work/SRAs/{acc}/{acc}.sra", acc.encode() * 10)
+        for acc in ("SRR0000001", "SRR0000002")
+    }
+    # files still linked into the working directory don't count
+    cache.store("SRR0000001", "sra", [paths["SRR0000001"]])
+    cache.store("SRR0000002", "sra", [paths["SRR0000002"]])
+    assert cache.held_size() == 0
+    os.remove(paths["SRR0000001"])
+    os.remove(paths["SRR0000002"])
+    assert cache.held_size() == 200
+    assert cache.fetch("SRR0000001", "sra", str(tmp_path / "work2"))
+    assert cache.held_size() == 100
+    sra = write(tmp_path / "SRR0000003.sra", b"3" * 100)
+    cache.store("SRR0000003", "sra", [sra])
+    os.remove(sra)
+    # SRR0000001 is older than SRR0000003 but linked into work2
+    assert cache.evict() == 1
+    assert cache.size() == 200
+    assert cache.held_size() == 100
+    assert not cache.fetch("SRR0000002", "sra", str(tmp_path / "work2"))
+    assert cache.fetch("SRR0000001", "sra", str(tmp_path / "work2"))
+    assert sum(len(files) for _, _, files in os.walk(tmp_path / "cache/objects")) == 2
+
+    # a sample bigger than the budget is kept until the next is stored
+    big = write(tmp_path / "SRR0000004.sra", b"x" * 300)
+    cache.store("SRR0000004", "sra", [big])
+    os.remove(big)
+    assert cache.evict(keep=("SRR0000004", "sra")) == 1
+    assert cache.size() == 400
+    cache.close()
+
+
+def test_sra_cache_changed(tmp_path):
+    """
+    function to test a stored file changed through a working directory's
+    link is a miss and dropped rather than linked again
+    """
+
+    cache = sra_cache.SraCache(str(tmp_path / "cache"))
+    sra = write(tmp_path / "work/SRAs/SRR0000001/SRR0000001.sra", b"sra1")
+    cache.store("SRR0000001", "sra", [sra])
+    with open(sra, "r+b") as sra_fh:
+        sra_fh.write(b"SRA1")
+    assert not cache.fetch("SRR0000001", "sra", str(tmp_path / "work2"))
+    assert not os.path.exists(tmp_path / "work2")
+    assert cache.size() == 0
+    cache.close()
+
+
+def test_sra_cache_main(tmp_path, capsys):
+    """
+    function to test the command line used by the rules
+    """
+
+    cache_dir = str(tmp_path / "cache")
+    sra = write(tmp_path / "work/SRAs/SRR0000001/SRR0000001.sra", b"sra")
+    dest = str(tmp_path / "work2/SRAs/SRR0000001")
+    assert sra_cache.main([cache_dir, "fetch", "SRR0000001", "sra", dest]) == 1
+    assert sra_cache.main([cache_dir, "store", "SRR0000001", "sra", sra, "none"]) == 0
+    assert sra_cache.main([cache_dir, "fetch", "SRR0000001", "sra", dest]) == 0
+    assert os.listdir(dest) == ["SRR0000001.sra"]
+    sra_cache.main([cache_dir, "stats"])
+    out = capsys.readouterr().out
+    assert "sra cache miss: sra SRR0000001" in out
+    assert "sra cache sra: 1 hits, 1 misses (50.0% hit rate)" in out
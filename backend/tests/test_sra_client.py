@@ -0,0 +1,94 @@
+"""
+    module for testing the SRA http client against a local stand in
+    for NCBI's servers with canned responses
+    last edited 10-18-26
+"""
+import os
+
+import pytest
+
+from stand_in import RUNS, exp_xml, make_client, runinfo, sra_client
+
+
+def test_sra_client_paged(stand_in, tmp_path, monkeypatch):
+    """
+    function to test a paged query gives the same files as a single download,
+    with failed pages retried and connections reused
+    """
+
+    monkeypatch.chdir(tmp_path)
+    client = make_client(stand_in, max_connections=3)
+    assert (
+        sra_client.query_sra(
+            client, "wastewater+SARS-CoV-2", "test", page_size=5, jobs=3
+        )
+        == RUNS
+    )
+    client.close()
+
+    assert (tmp_path / "sra_data_test.csv").read_text() == runinfo(0, RUNS)
+    assert (tmp_path / "sra_meta_test.xml").read_text() == exp_xml(0, RUNS)
+    assert "MCID_6789abc" in (tmp_path / "search_results_test.html").read_text()
+    assert sorted(os.listdir(tmp_path)) == [
+        "search_results_test.html",
+        "sra_data_test.csv",
+        "sra_meta_test.xml",
+    ]
+    # 2 search requests, 5 pages for each rettype and a failure for 8 pages
+    assert len(stand_in.requests) == 2 + 10 + 8
+    # connections are kept alive and reused between requests
+    assert len({port for _, port in stand_in.requests}) <= 3
+
+
+def test_sra_client_paging_ignored(stand_in, tmp_path, monkeypatch):
+    """
+    function to test a server ignoring the paging falls back to a single
+    download
+    """
+
+    monkeypatch.chdir(tmp_path)
+    stand_in.paging = False
+    client = make_client(stand_in)
+    sra_client.query_sra(client, "wastewater", "test", page_size=5, jobs=2)
+    client.close()
+
+    assert (tmp_path / "sra_data_test.csv").read_text() == runinfo(0, RUNS)
+    assert (tmp_path / "sra_meta_test.xml").read_text() == exp_xml(0, RUNS)
+
+
+def test_sra_client_retries(stand_in, tmp_path):
+    """
+    function to test requests are given up after the set retries
+    """
+
+    client = make_client(stand_in, retries=0)
+    url = f"{client.trace_url}?rettype=exp&retstart=5&retmax=5"
+    with pytest.raises(ConnectionError):
+        client.get(url, str(tmp_path / "page.xml"))
+    client = make_client(stand_in, retries=1)
+    client.get(url, str(tmp_path / "page.xml"))
+    assert (tmp_path / "page.xml").read_text() == exp_xml(5, 10)
+
+
+def test_query_runs_exp(stand_in, tmp_path):
+    """
+    function to test the xml for a list of runs is downloaded in batches and
+    joined
+    """
+
+    client = make_client(stand_in)
+    runs = [3, 5, 8, 13, 21]
+    path = str(tmp_path / "sra_meta_test.xml")
+    assert (
+        sra_client.query_runs_exp(
+            client, [f"SRR{run:07d}" for run in runs], path, batch_size=2
+        )
+        == 3
+    )
+    client.close()
+    assert stand_in.searches == [[3, 5], [8, 13], [21]]
+    assert (tmp_path / "sra_meta_test.xml").read_text() == exp_xml(0, 0, runs)
+    assert os.listdir(tmp_path) == ["sra_meta_test.xml"]
+
+    assert sra_client.query_runs_exp(client, [], path) == 0
+    assert (tmp_path / "sra_meta_test.xml").read_text() == exp_xml(0, 0, [])
@@ -0,0 +1,67 @@
+"""
+    module for testing the parts of the stream_reads rule that run
+    without the bioinformatics tools
+    last edited 10-18-26
+"""
+import os
+import subprocess as sp
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+
+
+def fastq(name, seq):
+    """
+    a fastq record as written by fasterq-dump --split-spot
+    """
+
+    return (
+        f"@{name} {name.split('.')[1]} length={len(seq)}\n{seq}\n+\n{'I' * len(seq)}\n"
+    )
+
+
+def test_pair_reads():
+    """
+    function to test reads without a mate are dropped from an interleaved
+    stream and mates are passed on in order
+    """
+
+    records = [
+        fastq("ERR1.1", "ACGT"),
+        fastq("ERR1.1", "TTGA"),
+        fastq("ERR1.2", "GGCA"),
+        fastq("ERR1.3", "CCAT"),
+        fastq("ERR1.3", "AAGT"),
+        fastq("ERR1.4", "TACG"),
+    ]
+    paired = sp.run(
+        ["awk", "-f", "modules/pair_reads.awk"],
+        input="".join(records),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert paired == "".join(records[:2] + records[3:5])
+
+
+def test_get_run_layouts(tmp_path, monkeypatch):
+    """
+    function to test the sample layouts are taken from the run info
+    """
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sra_data_test.csv").write_text(
+        "Run,spots,spots_with_mates,LibraryLayout\n"
+        "SRR1,100,100,PAIRED\n"
+        "SRR2,100,0,PAIRED\n"
+        "SRR3,,,PAIRED\n"
+        "SRR4,0,0,SINGLE\n"
+    )
+    assert snakefunctions.get_run_layouts(["SRR1", "SRR2", "SRR3", "SRR4", "SRR5"]) == {
+        "SRR1": "pe",
+        "SRR2": "se",
+        "SRR3": "pe",
+        "SRR4": "se",
+        "SRR5": "se",
+    }
@@ -0,0 +1,110 @@
+"""
+    module for testing the queryable store of the samples' variant calls
+    last edited 10-18-26
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath("modules"))
+import snakefunctions  # pylint: disable=wrong-import-position
+import variant_store  # pylint: disable=wrong-import-position
+
+GFF = os.path.realpath("data/NC_045512.2.gff3")
+HEADER = (
+    "REGION\tPOS\tREF\tALT\tREF_DP\tREF_RV\tREF_QUAL\tALT_DP\tALT_RV\tALT_QUAL"
+    "\tALT_FREQ\tTOTAL_DP\tPVAL\tPASS\tGFF_FEATURE\tREF_CODON\tREF_AA\tALT_CODON"
+    "\tALT_AA\n"
+)
+
+
+def call(variant, freq, annotation=("NA", "NA", "NA")):
+    """
+    a line of an ivar variants tsv for a (POS, REF, ALT) variant, with the
+    GFF_FEATURE, REF_AA and ALT_AA of its annotation
+    """
+
+    pos, ref, alt = variant
+    feature, ref_aa, alt_aa = annotation
+    return (
+        f"NC_045512.2\t{pos}\t{ref}\t{alt}\t10\t5\t37\t10\t5\t37\t{freq}\t20\t0.01"
+        f"\tTRUE\t{feature}\tNA\t{ref_aa}\tNA\t{alt_aa}\n"
+    )
+
+
+def test_aa_position():
+    """
+    function to test codons are numbered through the ORF1ab frameshift
+    """
+
+    cds = variant_store.read_cds(GFF)
+    assert cds["cds-YP_009724390.1"]["gene"] == "S"
+    assert variant_store.aa_position(cds["cds-YP_009724390.1"]["segs"], 23063) == 501
+    assert variant_store.aa_position(cds["cds-YP_009724389.1"]["segs"], 266) == 1
+    # nsp12 P323L, ORF1ab P4715L, is past the frameshift
+    assert variant_store.aa_position(cds["cds-YP_009724389.1"]["segs"], 14408) == 4715
+    assert not variant_store.aa_position(cds["cds-YP_009724390.1"]["segs"], 100)
+
+
+def test_variant_store(tmp_path, monkeypatch, capsys):
+    """
+    function to test the aggregate step stores the samples' calls with their
+    metadata, replaces reprocessed samples and answers mutation, region and
+    sample queries from python and the command line
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("endpoints")
+    with open("sra_meta_collect_current.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write("Accession\tcollectiong data\tgeo_loc\tprimers\n")
+        out_fh.write("SRR1\t2021-12-08\tUSA: Massachusetts\tdata/articv3.bed\n")
+        out_fh.write("SRR2\t2022-01-02\tUnited Kingdom\tUnknown\n")
+    spike = ("cds-YP_009724390.1", "N", "Y")
+    samples = {
+        "SRR1": [call((210, "G", "T"), 1), call((23063, "A", "T"), 0.9, spike)],
+        "SRR2": [call((23063, "A", "T"), 0.4, spike), call((28881, "G", "A"), 1)],
+    }
+    for acc, calls in samples.items():
+        for ext, content in (("tsv", HEADER + "".join(calls)), ("fa", f">{acc}\nA\n")):
+            with open(f"endpoints/{acc}.{ext}", "w", encoding="utf-8") as out_fh:
+                out_fh.write(content)
+    snakefunctions.snakemodpath = os.path.dirname(os.path.dirname(GFF))
+    snakefunctions.aggregate_endpoints(
+        ["endpoints/SRR1.tsv"], ["endpoints/SRR1.fa"], [], False
+    )
+
+    # a new store loads the samples already in VCs.tsv
+    os.remove("endpoints/variants.sqlite")
+    snakefunctions.aggregate_endpoints(
+        ["endpoints/SRR2.tsv"], ["endpoints/SRR2.fa"], [], False
+    )
+    store = variant_store.VariantStore("endpoints/variants.sqlite")
+    calls = store.mutation("S:N501Y")
+    assert [(row["accession"], row["alt_freq"]) for row in calls] == [
+        ("SRR1", 0.9),
+        ("SRR2", 0.4),
+    ]
+    assert calls[1]["collection_date"] == "2022-01-02"
+    assert calls[1]["location"] == "United Kingdom"
+    assert [row["accession"] for row in store.mutation("A23063T")] == ["SRR1", "SRR2"]
+    assert [row["pos"] for row in store.region(200, 23063)] == [210, 23063, 23063]
+    assert [row["pos"] for row in store.samples("SRR2")] == [23063, 28881]
+    assert len(store.samples("SRR1", "SRR2")) == 4
+    store.close()
+
+    # reprocessing replaces the sample's calls
+    with open("endpoints/SRR2.tsv", "w", encoding="utf-8") as out_fh:
+        out_fh.write(HEADER + call((28881, "G", "A"), 0.5))
+    snakefunctions.aggregate_endpoints(
+        ["endpoints/SRR2.tsv"], ["endpoints/SRR2.fa"], [], True
+    )
+    store = variant_store.VariantStore("endpoints/variants.sqlite")
+    assert [(row["pos"], row["alt_freq"]) for row in store.samples("SRR2")] == [
+        (28881, 0.5)
+    ]
+    assert len(store.mutation("S:N501Y")) == 1
+    store.close()
+
+    assert variant_store.main(["endpoints/variants.sqlite", "mutation", "A23063T"]) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].split("\t")[:3] == ["accession", "pos", "ref"]
+    assert [line.split("\t")[0] for line in out[1:]] == ["SRR1"]